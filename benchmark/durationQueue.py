@@ -0,0 +1,63 @@
+"""
+Scaling benchmark for DurationQueue.
+
+Usage: python -m benchmark.durationQueue [size ...]
+Default sizes run from 10^4 to 10^7 durations.
+"""
+import sys
+from random import seed, uniform
+from time import time
+
+from simulator.Duration import Duration
+from simulator.DurationQueue import DurationQueue
+
+DEFAULT_SIZES = [10**4, 10**5, 10**6, 10**7]
+TOTAL_TIME = 87600.0
+
+
+def run(size):
+    seed(size)
+    durations = DurationQueue()
+
+    t = time()
+    for i in xrange(size):
+        start = round(uniform(0, TOTAL_TIME), 2)
+        durations.addDuration(Duration(Duration.DurationType.Loss, start,
+                                       start + 12.0, None))
+    add_time = time() - t
+
+    t = time()
+    view = durations.clone()
+    clone_time = time() - t
+
+    t = time()
+    last = -1.0
+    while view.size() != 0:
+        d = view.removeFirst()
+        if d.getStartTime() < last:
+            raise Exception("Durations are out of order")
+        last = d.getStartTime()
+    drain_time = time() - t
+
+    if durations.size() != size:
+        raise Exception("Draining the clone changed the original queue")
+
+    return add_time, clone_time, drain_time
+
+
+def main(sizes):
+    print "%10s %10s %10s %10s %14s" % ("size", "add(s)", "clone(s)",
+                                       "drain(s)", "removeFirst/s")
+    for size in sizes:
+        add_time, clone_time, drain_time = run(size)
+        rate = size/drain_time if drain_time > 0 else float("inf")
+        print "%10d %10.3f %10.3f %10.3f %14.0f" % (size, add_time, clone_time,
+                                                   drain_time, rate)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sizes = [int(float(item)) for item in sys.argv[1:]]
+    else:
+        sizes = DEFAULT_SIZES
+    main(sizes)
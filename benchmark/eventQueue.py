@@ -0,0 +1,100 @@
+"""
+Throughput benchmark for EventQueue, in events per second.
+
+Usage: python -m benchmark.eventQueue [--cancel FRACTION] [--hold N] [size ...]
+
+Every size is run as a hold model: the queue is filled with 'size' events
+and EventQueue.run() hands them to a handler that schedules one new event
+per event handled, at an exponential time ahead, so the queue stays at
+'size' events for --hold x size events. With --cancel, that fraction of
+the handled events also cancels a random pending event and schedules a
+replacement. Reported are the fill time and the events handled per second
+by run(). Default sizes run from 10^3 to 10^6 events.
+"""
+import argparse
+from random import seed, random, expovariate, randrange
+from time import time
+
+from simulator.Event import Event
+from simulator.EventQueue import EventQueue
+
+DEFAULT_SIZES = [10**3, 10**4, 10**5, 10**6]
+
+
+class HoldHandler(object):
+
+    def __init__(self, events, budget, cancel):
+        # events added so far, the candidates for cancel()
+        self.events = events
+        self.budget = budget
+        self.cancel = cancel
+        self.last_time = -1.0
+        self.cancelled = 0
+
+    def handleEvent(self, e, queue):
+        if e.time < self.last_time:
+            raise Exception("Events are out of order")
+        self.last_time = e.time
+        if self.budget == 0:
+            return
+        self.budget -= 1
+        self.schedule(queue, e.time)
+        if self.cancel and random() < self.cancel:
+            victim = self.events[randrange(len(self.events))]
+            if victim.queued and not victim.ignore:
+                queue.cancel(victim)
+                self.cancelled += 1
+                self.schedule(queue, e.time)
+
+    def schedule(self, queue, now):
+        e = Event(Event.EventType.Failure, now + expovariate(1.0), None)
+        queue.addEvent(e)
+        self.events.append(e)
+
+
+def run(size, hold, cancel):
+    seed(size)
+    queue = EventQueue()
+    events = []
+
+    t = time()
+    for i in xrange(size):
+        e = Event(Event.EventType.Failure, expovariate(1.0), None)
+        queue.addEvent(e)
+        events.append(e)
+    fill_time = time() - t
+
+    handler = HoldHandler(events, hold*size, cancel)
+    t = time()
+    handled = queue.run(handler)
+    run_time = time() - t
+
+    if queue.size() != 0:
+        raise Exception("Events left in the queue")
+    if handled != size + hold*size:
+        raise Exception("Handled %d events, expected %d" % (handled, size + hold*size))
+
+    return fill_time, handled, handler.cancelled, run_time
+
+
+def main(sizes, hold, cancel):
+    print "%10s %10s %12s %10s %10s %14s" % ("size", "fill(s)", "handled",
+                                            "cancelled", "run(s)", "events/s")
+    for size in sizes:
+        fill_time, handled, cancelled, run_time = run(size, hold, cancel)
+        rate = handled/run_time if run_time > 0 else float("inf")
+        print "%10d %10.3f %12d %10d %10.3f %14.0f" % (size, fill_time, handled, cancelled,
+                                                      run_time, rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Events per second of EventQueue.run().")
+    parser.add_argument("sizes", nargs="*", type=float, default=DEFAULT_SIZES,
+                        help="events kept in the queue, e.g. 1e5")
+    parser.add_argument("--hold", type=int, default=4,
+                        help="events handled per queued event, after the fill")
+    parser.add_argument("--cancel", type=float, default=0.0,
+                        help="fraction of handled events that cancel a pending event")
+    args = parser.parse_args()
+
+    main([int(size) for size in args.sizes], args.hold, args.cancel)
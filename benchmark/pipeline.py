@@ -0,0 +1,209 @@
+"""
+Scaling benchmark of the whole simulation pipeline.
+
+Usage: python -m benchmark.pipeline [--scenario RACKSxSLICES ...] [--out FILE]
+                                    [--baseline FILE] [--timeline TIMELINE]
+
+Every scenario gets a synthetic smusu.conf/layer.xml pair in a temporary
+directory, with rack_count and total_active_storage set for its size and
+disks large enough to hold the slices at half capacity. One iteration is
+run stage by stage: parse (configuration, XML and topology), placement,
+durations, event_log, findConcurrent, the loss and unavailability process
+passes and write (result CSV). Each stage reports wall and CPU time, items
+per second and the peak RSS after it; the phases of Simulation.run are
+those its Profiler records.
+
+Results go to a JSON file. With --baseline, wall times are compared
+against a stored result and stages slower by more than --tolerance fail.
+Default scenarios run from 20 racks/10^4 slices to 2000 racks/10^8 slices.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+from tempfile import mkdtemp
+from time import strftime
+
+from simulator.Profiler import Profiler
+from simulator.Simulation import Simulation
+
+DEFAULT_SCENARIOS = [(20, 10**4), (20, 10**5), (200, 10**6), (2000, 10**7), (2000, 10**8)]
+STAGES = ["parse", "placement", "durations", "event_log", "findConcurrent", "process_loss",
+          "process_unavailable", "write"]
+LAYER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "conf", "layer.xml")
+
+CONF_TEMPLATE = """[DEFAULT]
+total_time = %(total_time)d
+total_active_storage = %(storage).12g
+chunk_size = %(chunk_size)d
+disk_capacity = %(disk_capacity)d
+disks_per_machine = %(disks_per_machine)d
+machines_per_rack = %(machines_per_rack)d
+rack_count = %(racks)d
+data_redundancy = %(drs)s
+xml_file_path = %(xml)s
+event_file = %(event_file)s
+event_format = binary
+columnar_durations = %(columnar)s
+batched_timeline = %(batched)s
+streaming_timeline = %(streaming)s
+node_bandwidth = 9000000
+recovery_bandwidth_cross_rack = 180000
+recovery_bandwidth_intra_rack = 1800000
+"""
+
+
+# Write the conf/layer pair of one scenario to 'directory', return the
+# path of the conf.
+def makeScenario(directory, racks, slices, drs, timeline, total_time=8760,
+                 chunk_size=256, machines_per_rack=18, disks_per_machine=3):
+    names = drs.split("_")
+    n, k = int(names[1]), int(names[2])
+    # inverse of Configuration.total_slices
+    storage = float(slices)*k*chunk_size/pow(2, 30)
+    chunks_per_disk = float(slices)*n/(racks*machines_per_rack*disks_per_machine)
+    disk_capacity = max(2, int(2*chunks_per_disk*chunk_size*pow(2, 20)/pow(10, 12)) + 1)
+
+    xml = os.path.join(directory, "layer.xml")
+    shutil.copy(LAYER_FILE, xml)
+    conf_path = os.path.join(directory, "smusu.conf")
+    with open(conf_path, "w") as fp:
+        fp.write(CONF_TEMPLATE % {"total_time": total_time, "storage": storage,
+                                  "chunk_size": chunk_size, "disk_capacity": disk_capacity,
+                                  "disks_per_machine": disks_per_machine,
+                                  "machines_per_rack": machines_per_rack, "racks": racks,
+                                  "drs": drs, "xml": xml,
+                                  "event_file": os.path.join(directory, "event"),
+                                  "columnar": str(timeline != "units").lower(),
+                                  "batched": str(timeline == "batched").lower(),
+                                  "streaming": str(timeline == "streaming").lower()})
+    return conf_path
+
+
+# Items per second of each stage are over these counters.
+STAGE_ITEMS = {"durations": "durations", "event_log": "durations",
+               "findConcurrent": "durations", "process_loss": "lost_concurrent_periods",
+               "process_unavailable": "concurrent_periods"}
+
+
+# Run one iteration of the scenario, return its stages as
+# {stage: {"wall", "cpu", "items", "rate", "peak_rss_mb"}}. Phases of
+# run() come from the Profiler of Simulation.
+def run(conf_path, iteration_seed=1):
+    profiler = Profiler()
+    with profiler.phase("parse"):
+        sim = Simulation(conf_path)
+    result = sim.runIteration(1, iteration_seed)
+    with profiler.phase("write"):
+        sim.writeToCSV(os.path.join(os.path.dirname(conf_path), "result.csv"),
+                       [sim.resultRow(result)])
+
+    counts = result.profile["counts"]
+    items = {"parse": sim.distributer.getTopology().size, "placement": sim.conf.total_slices,
+             "write": 1}
+    for name, counter in STAGE_ITEMS.items():
+        items[name] = counts[counter]
+    if sim.conf.streaming_timeline:
+        # generated within findConcurrent
+        items["durations"] = 0
+    stages = {}
+    for phase in profiler.phases + result.profile["phases"]:
+        wall = phase["wall"]
+        stages[phase["name"]] = {"wall": wall, "cpu": phase["cpu"], "items": items[phase["name"]],
+                                 "rate": items[phase["name"]]/wall if wall > 0 else None,
+                                 "peak_rss_mb": phase["peak_rss_mb"]}
+
+    return {"total_slices": sim.conf.total_slices,
+            "disks": sim.distributer.getTopology().getLeafTier().size,
+            "counts": counts,
+            "stages": stages}
+
+
+# Stages of 'report' slower than 'baseline' by more than 'tolerance', as
+# (scenario, stage, wall, baseline wall).
+def compare(report, baseline, tolerance):
+    old = dict([(scenario["name"], scenario) for scenario in baseline["scenarios"]])
+    slower = []
+    print "%-14s %-20s %10s %10s %9s" % ("scenario", "stage", "base(s)", "wall(s)", "change")
+    for scenario in report["scenarios"]:
+        if scenario["name"] not in old:
+            continue
+        for name in STAGES:
+            if name not in scenario["stages"] or name not in old[scenario["name"]]["stages"]:
+                continue
+            wall = scenario["stages"][name]["wall"]
+            old_wall = old[scenario["name"]]["stages"][name]["wall"]
+            print "%-14s %-20s %10.3f %10.3f %+8.1f%%" % \
+                (scenario["name"], name, old_wall, wall,
+                 100*(wall - old_wall)/old_wall if old_wall > 0 else 0.0)
+            # stages under 10 ms are noise
+            if wall > old_wall*(1 + tolerance) and wall - old_wall > 0.01:
+                slower.append((scenario["name"], name, wall, old_wall))
+    return slower
+
+
+def main(scenarios, out, drs, timeline, baseline=None, tolerance=0.2, keep=False):
+    report = {"created": strftime("%Y-%m-%d %H:%M:%S"), "drs": drs, "timeline": timeline,
+              "python": sys.version.split()[0], "scenarios": []}
+    print "%-14s %-20s %10s %12s %14s %10s" % ("scenario", "stage", "wall(s)", "items",
+                                              "items/s", "rss(MB)")
+    for racks, slices in scenarios:
+        directory = mkdtemp(prefix="smrsu-bench-")
+        try:
+            conf_path = makeScenario(directory, racks, slices, drs, timeline)
+            scenario = run(conf_path)
+        finally:
+            if not keep:
+                shutil.rmtree(directory, True)
+        scenario["name"] = "%dx%d" % (racks, slices)
+        scenario["racks"] = racks
+        scenario["slices"] = slices
+        report["scenarios"].append(scenario)
+        for name in STAGES:
+            if name not in scenario["stages"]:
+                continue
+            stage = scenario["stages"][name]
+            rate = "%14.0f" % stage["rate"] if stage["rate"] else "%14s" % "-"
+            print "%-14s %-20s %10.3f %12d %s %10.1f" % (scenario["name"], name, stage["wall"],
+                                                         stage["items"], rate,
+                                                         stage["peak_rss_mb"])
+        # written after every scenario, so long suites keep what finished
+        with open(out, "w") as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        with open(baseline) as fp:
+            slower = compare(report, json.load(fp), tolerance)
+        for name, stage, wall, old_wall in slower:
+            print "slower: %s %s %.3fs, baseline %.3fs" % (name, stage, wall, old_wall)
+        return len(slower) == 0
+    return True
+
+
+def parseScenario(string):
+    racks, slices = string.lower().split("x")
+    return int(racks), int(float(slices))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the simulation pipeline stage by stage.")
+    parser.add_argument("--scenario", action="append", type=parseScenario, default=None,
+                        help="RACKSxSLICES, e.g. 200x1e6; may be repeated")
+    parser.add_argument("--out", default="pipeline-" + strftime("%Y%m%d.%H.%M.%S") + ".json")
+    parser.add_argument("--baseline", default=None, help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown of a stage that counts as a regression")
+    parser.add_argument("--drs", default="LRC_16_12_2")
+    parser.add_argument("--timeline", choices=["units", "batched", "streaming"],
+                        default="batched",
+                        help="units: Unit.generateDurations, batched: TimelineBuilder, "
+                             "streaming: TimelineStream (durations timed within findConcurrent)")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the scenario directories")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or DEFAULT_SCENARIOS
+    if not main(scenarios, args.out, args.drs, args.timeline, args.baseline, args.tolerance,
+                args.keep):
+        sys.exit(1)
@@ -0,0 +1,65 @@
+"""
+Scaling benchmark for SSSDistribute placement.
+
+Usage: python -m benchmark.placement conf_file [size ...]
+conf_file is resolved like Simulation does. Default sizes run from 10^5 to
+10^7 slices, on the topology and coding scheme of conf_file.
+"""
+import os
+import sys
+from time import time
+
+import numpy as np
+
+from simulator.Configuration import Configuration, CONF_PATH
+from simulator.XMLParser import XMLParser
+from simulator.dataDistribute.SSSDistribute import SSSDistribute
+
+DEFAULT_SIZES = [10**5, 10**6, 10**7]
+
+
+def run(distributer, size):
+    distributer.clearSlices()
+    np.random.seed(size)
+
+    t = time()
+    distributer.distributeSlices(distributer.getRoot(), size)
+    place_time = time() - t
+
+    t = time()
+    distributer.getSliceIncidence()
+    index_time = time() - t
+
+    topology = distributer.getTopology()
+    leaf = topology.getLeafTier()
+    counts = topology.chunk_counts[leaf.first:leaf.first + leaf.size]
+    if counts.sum() != size * distributer.n:
+        raise Exception("Chunks are missing")
+    if counts.max() > distributer.conf.max_chunks_per_disk:
+        raise Exception("Disk over capacity")
+
+    return place_time, index_time, counts.max()
+
+
+def main(conf_path, sizes):
+    if not os.path.isabs(conf_path):
+        conf_path = CONF_PATH + conf_path
+    conf = Configuration(conf_path)
+    distributer = SSSDistribute(XMLParser(conf))
+    print "%10s %10s %10s %14s %12s" % ("slices", "place(s)", "index(s)",
+                                        "slices/s", "max chunks")
+    for size in sizes:
+        place_time, index_time, max_chunks = run(distributer, size)
+        rate = size/place_time if place_time > 0 else float("inf")
+        print "%10d %10.3f %10.3f %14.0f %12d" % (size, place_time, index_time,
+                                                  rate, max_chunks)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise Exception("Usage: python -m benchmark.placement conf_file [size ...]")
+    if len(sys.argv) > 2:
+        sizes = [int(float(item)) for item in sys.argv[2:]]
+    else:
+        sizes = DEFAULT_SIZES
+    main(sys.argv[1], sizes)
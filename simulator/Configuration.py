@@ -4,12 +4,15 @@ from math import ceil, floor
 from random import random
 
 from simulator.Log import info_logger
+from simulator.Tracer import Tracer
 from simulator.drs.Handler import getDRSHandler
+from simulator.drs.RepairTable import getRepairTable
 from simulator.utils import splitMethod, splitIntMethod, splitFloatMethod, \
     extractDRS, returnEventGenerator
 
 BASE_PATH = r"/root/SIMDDC/"
 CONF_PATH = BASE_PATH + "conf/"
+CACHE_PATH = BASE_PATH + "cache/"
 
 
 def getConfParser(conf_file_path):
@@ -19,6 +22,12 @@ def getConfParser(conf_file_path):
 
 
 class Configuration(object):
+    """
+    Settings of one run, parsed and checked once. Instances are read-only
+    after __init__ and picklable, so one instance is registered with
+    setConfiguration() and shared by the units, distributers and handlers
+    of the run, worker processes included.
+    """
     path = CONF_PATH + "simddc.conf"
 
     def __init__(self, path=None):
@@ -48,7 +57,13 @@ class Configuration(object):
         self.datacenters = 1
 
         self.xml_file_path = d.pop("xml_file_path")
-        self.event_file = d.pop("event_file", None)
+        # an empty event_file writes no events, as an unset one
+        self.event_file = d.pop("event_file", None) or None
+        # "binary" writes one EventLog per run, "text" one printAll file per
+        # iteration
+        self.event_format = d.pop("event_format", "binary")
+        if self.event_format not in ("binary", "text"):
+            raise Exception("event_format must be 'binary' or 'text'!")
 
         self.data_redundancy = d["data_redundancy"]
         data_redundancy = extractDRS(self.data_redundancy)
@@ -57,7 +72,51 @@ class Configuration(object):
         self.node_bandwidth = int(d["node_bandwidth"])
 
         self.parallel_repair = self._bool(d.pop("parallel_repair", "false"))
+        # keep durations in NumPy columns (DurationStore) instead of objects
+        self.columnar_durations = self._bool(d.pop("columnar_durations", "false"))
+        # generate the failure timeline tier by tier (TimelineBuilder)
+        self.batched_timeline = self._bool(d.pop("batched_timeline", "false"))
+        # stream the timeline window by window into HandleDuration (TimelineStream)
+        self.streaming_timeline = self._bool(d.pop("streaming_timeline", "false"))
+        self.timeline_window = float(d.pop("timeline_window", "8760"))
+        if self.timeline_window <= 0:
+            raise Exception("timeline_window must be positive!")
+        if self.streaming_timeline and self.event_file is not None and self.event_format != "binary":
+            raise Exception("streaming_timeline writes events in the binary format only!")
+        # hazard factor of the disk, machine and rack failure generators
+        # while a unit above them is lost, results are weighted by their
+        # likelihood ratios; 1 is plain sampling
+        self.failure_bias = float(d.pop("failure_bias", "1"))
+        if self.failure_bias <= 0:
+            raise Exception("failure_bias must be positive!")
+        if self.failure_bias != 1 and not (self.batched_timeline or self.streaming_timeline):
+            raise Exception("failure_bias needs batched_timeline or streaming_timeline!")
+        # fraction of the iterations the effective sample size of a biased
+        # run must reach, below it the run warns
+        self.failure_bias_min_ess = float(d.pop("failure_bias_min_ess", "0.1"))
+        if not 0 <= self.failure_bias_min_ess <= 1:
+            raise Exception("failure_bias_min_ess must be between 0 and 1!")
+        # JSON-lines trace of the hot paths, see Tracer; no tracing if not set
+        self.trace_file = d.pop("trace_file", None)
+        self.trace_level = d.pop("trace_level", "info").lower()
+        if self.trace_level not in Tracer.LEVELS:
+            raise Exception("trace_level must be one of " + ", ".join(Tracer.LEVELS.keys()) + "!")
+        self.trace_level = Tracer.LEVELS[self.trace_level]
+        self.trace_categories = [c.strip() for c in
+                                 splitMethod(d.pop("trace_categories", ",".join(Tracer.CATEGORIES)))]
+        # "category:n" pairs, keep one record in n of the category
+        self.trace_samples = {}
+        for item in splitMethod(d.pop("trace_sample", "")):
+            if not item.strip():
+                continue
+            category, n = splitMethod(item, ':')
+            self.trace_samples[category.strip()] = int(n)
         self.drs_handler = getDRSHandler(data_redundancy[0], data_redundancy[1:])
+        # precomputed repair tables of the DRS handlers are kept here
+        self.repair_table_dir = d.pop("repair_table_dir", CACHE_PATH + "drs/")
+        # placements of seeded runs are saved here and loaded again by later
+        # runs with the same layout, scheme and seed; no cache if not set
+        self.placement_cache_dir = d.pop("placement_cache_dir", None)
 
         # flat or hier, if hier, r is the distinct_racks
         self.hier = self._bool(d.pop("hierarchical", "false"))
@@ -65,6 +124,37 @@ class Configuration(object):
             self.r = int(d["distinct_racks"])
         else:
             self.r = self.drs_handler.n
+        # racks the chunks of a slice are spread over
+        self.num_chunks_diff_racks = self.r
+
+        # Settings of the event-driven EventHandler. A slice is repaired
+        # once it is down to recovery_threshold durable chunks, or available
+        # ones with availability_counts_for_recovery; lazy_recovery repairs
+        # all its damaged chunks at once.
+        self.lazy_recovery = self._bool(d.pop("lazy_recovery", "false"))
+        self.recovery_threshold = int(d.pop("recovery_threshold", str(self.drs_handler.n - 1)))
+        if not 0 <= self.recovery_threshold < self.drs_handler.n:
+            raise Exception("recovery_threshold must be between 0 and n - 1!")
+        self.availability_counts_for_recovery = \
+            self._bool(d.pop("availability_counts_for_recovery", "false"))
+        # repair at n - 1 chunks once more than max_degraded_slices of the
+        # slices are degraded
+        self.lazy_only_available = self._bool(d.pop("lazy_only_available", "false"))
+        self.max_degraded_slices = float(d.pop("max_degraded_slices", "0.1"))
+        # chunks repaired per installment of eager recovery
+        self.installment_size = int(d.pop("installment_size", "1000"))
+        if self.installment_size <= 0:
+            raise Exception("installment_size must be positive!")
+        # repairs start at once, otherwise they queue for the bandwidth of
+        # the racks; FIFO is the only contention model
+        self.queue_disable = self._bool(d.pop("queue_disable", "true"))
+        self.bandwidth_contention = d.pop("bandwidth_contention", "FIFO")
+        if self.bandwidth_contention != "FIFO":
+            raise Exception("bandwidth_contention must be FIFO!")
+        # slices are placed once, their number does not change during the run
+        self.system_scaling = False
+        # times of the hard upgrades that replace disks
+        self.upgrade_ts = []
 
         self.upgrades = False
         self.failure_generator = None
@@ -114,6 +204,12 @@ class Configuration(object):
         self.disk_repair_time, self.node_repair_time = self.comRepairTime()
 
         self.total_slices = int(ceil(self.total_active_storage*pow(2,30)/(self.drs_handler.k*self.chunk_size)))
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("_frozen", False):
+            raise Exception("Configuration is read-only, can not set " + name)
+        object.__setattr__(self, name, value)
 
     def _bool(self, string):
         if string.lower() == "true":
@@ -132,6 +228,20 @@ class Configuration(object):
     def getDRSHandler(self):
         return self.drs_handler
 
+    # None when the stripe is too wide for a table.
+    def getRepairTable(self):
+        return getRepairTable(self.drs_handler, self.repair_table_dir)
+
+    # [[start time, end time, slices at the start, slices added per hour], ...]
+    # over the run, one row since the number of slices is fixed.
+    def tableForTotalSlice(self):
+        return [[0, self.total_time, self.total_slices, 0]]
+
+    # Recovery threshold of eager recovery, 'time_since_failed' hours after
+    # the machine failed; recovery_threshold at any time.
+    def getAvailableLazyThreshold(self, time_since_failed):
+        return self.recovery_threshold
+
     def comRepairTime(self):
         repair_traffic = self.drs_handler.repairTraffic(self.hier, self.r)
         # in MB/s
@@ -148,7 +258,7 @@ class Configuration(object):
 
     # "True" means events record to file, and vice versa.
     def eventToFile(self):
-        return self.event_file is not None
+        return bool(self.event_file)
 
     def parserCorrelatedSetting(self, section_name):
         component = self.conf.get(section_name, "component")
@@ -168,10 +278,27 @@ class Configuration(object):
              "machines_per_rack": self.machines_per_rack,
              "xml_file_path": self.xml_file_path,
              "event_file": self.event_file,
+             "event_format": self.event_format,
              "data_redundancy": self.data_redundancy,
              "hierarchical": self.hier,
              "recovery_bandwidth_cross_rack": self.recovery_bandwidth_cross_rack,
              "parallel_repair": self.parallel_repair,
+             "columnar_durations": self.columnar_durations,
+             "batched_timeline": self.batched_timeline,
+             "streaming_timeline": self.streaming_timeline,
+             "timeline_window": self.timeline_window,
+             "failure_bias": self.failure_bias,
+             "failure_bias_min_ess": self.failure_bias_min_ess,
+             "lazy_recovery": self.lazy_recovery,
+             "recovery_threshold": self.recovery_threshold,
+             "availability_counts_for_recovery": self.availability_counts_for_recovery,
+             "lazy_only_available": self.lazy_only_available,
+             "max_degraded_slices": self.max_degraded_slices,
+             "installment_size": self.installment_size,
+             "queue_disable": self.queue_disable,
+             "bandwidth_contention": self.bandwidth_contention,
+             "trace_file": self.trace_file,
+             "trace_level": self.trace_level,
              "upgrades": self.upgrades,
              "correlated_failures": self.correlated_failures}
         if self.hier:
@@ -203,7 +330,7 @@ class Configuration(object):
                         ", hierarchical:" + str(self.hier) + \
                         ", recovery bandwidth cross rack: " + str(self.recovery_bandwidth_cross_rack) + \
                         ", xml file path: " + self.xml_file_path + \
-                        ", event file path: " + self.event_file + \
+                        ", event file path: " + str(self.event_file) + \
                         ", parallel repair: " + str(self.parallel_repair) + \
                         ", upgrade flag: " + str(self.upgrades) + \
                         ", correlated failures flag: " + str(self.correlated_failures)
@@ -218,8 +345,29 @@ class Configuration(object):
             info_logger.info("Correlated Failures Configurations: " + str(self.correlated_failures_infos))
 
 
+# The configuration of the running simulation, parsed from
+# Configuration.path on first use if none was registered.
+_configuration = None
+
+
+def getConfiguration():
+    if _configuration is None:
+        setConfiguration(Configuration())
+    return _configuration
+
+
+def setConfiguration(conf):
+    global _configuration
+    _configuration = conf
+    return conf
+
+
 if __name__ == "__main__":
+    import cPickle
+
     conf = Configuration("/root/SIMDDC/conf/simddc.conf")
+    copy = cPickle.loads(cPickle.dumps(conf, 2))
+    print "pickled copy equal:", copy.returnAll() == conf.returnAll()
     drs_handler = conf.getDRSHandler()
     conf.printTest()
     conf.printAll()
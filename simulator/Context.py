@@ -0,0 +1,78 @@
+from simulator.DurationQueue import DurationQueue
+from simulator.Result import Result
+
+
+class Context(object):
+    """
+    Per-run simulation state. The duration timeline, the result and the id
+    counters of units live here instead of in class attributes, so one
+    process can build the topology once and run many iterations, calling
+    reset() between them.
+
+    timeline_class is the container reset() creates for the durations,
+    DurationQueue or DurationStore.
+    """
+
+    def __init__(self, timeline_class=DurationQueue):
+        self.timeline_class = timeline_class
+        self.unit_count = 0
+        self.machine_count = 0
+        # counter values when the topology was built, restored by reset()
+        self.topology_unit_count = 0
+        self.topology_machine_count = 0
+        self.reset()
+
+    def nextUnitID(self):
+        unit_id = self.unit_count
+        self.unit_count += 1
+        return unit_id
+
+    def nextMachineID(self):
+        machine_id = self.machine_count
+        self.machine_count += 1
+        return machine_id
+
+    # Take 'count' consecutive unit ids at once and return the first.
+    def reserveUnitIDs(self, count):
+        unit_id = self.unit_count
+        self.unit_count += count
+        return unit_id
+
+    def reserveMachineIDs(self, count):
+        machine_id = self.machine_count
+        self.machine_count += count
+        return machine_id
+
+    # Units created so far belong to the topology and survive reset(). Units
+    # created afterwards (sectors, slice sets) are per iteration.
+    def markTopology(self):
+        self.topology_unit_count = self.unit_count
+        self.topology_machine_count = self.machine_count
+
+    def reset(self):
+        self.unit_count = self.topology_unit_count
+        self.machine_count = self.topology_machine_count
+        self.durations = self.timeline_class()
+        self.result = Result()
+
+
+_context = Context()
+
+
+def getContext():
+    return _context
+
+
+def setContext(context):
+    global _context
+    _context = context
+    return context
+
+
+if __name__ == "__main__":
+    context = getContext()
+    print context.nextUnitID(), context.nextUnitID()
+    context.markTopology()
+    context.nextUnitID()
+    context.reset()
+    print context.nextUnitID()
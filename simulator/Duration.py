@@ -2,7 +2,6 @@ from enum import Enum
 
 
 class Duration(object):
-    duration_id = 0
 
     class DurationType(Enum):
         Loss = 0
@@ -18,8 +17,8 @@ class Duration(object):
         self.info = info
         self.ignore = False
         self.attributes = {}
-        Duration.duration_id += 1
-        self.duration_id = Duration.duration_id
+        # numbered by the DurationQueue the duration is added to
+        self.duration_id = None
 
     def getType(self):
         return self.type
@@ -1,17 +1,61 @@
-from collections import OrderedDict
+from operator import attrgetter
+
 from simulator.Duration import Duration
 
 
 class DurationQueue(object):
-    durations = OrderedDict()
+    """
+    Durations are kept in one list ordered by start time and consumed through
+    a cursor. Sorting is deferred until the queue is read, so building a
+    timeline costs O(1) per duration and draining it costs O(n log n) in
+    total. Durations with the same start time keep their insertion order.
+    """
+    start_key = attrgetter("start_time")
+
+    def __init__(self):
+        self.durations = []
+        # index of the next duration returned by removeFirst()
+        self.cursor = 0
+        # end of the read-only view returned by clone(), None for the owner
+        self.limit = None
+        self.ordered = True
+        # ids handed out to durations added to this queue
+        self.duration_count = 0
+
+    def _end(self):
+        if self.limit is None:
+            return len(self.durations)
+        return self.limit
+
+    def _sort(self):
+        if self.ordered:
+            return
+        # Build a new list instead of sorting in place, views returned by
+        # clone() keep pointing at the old one.
+        self.durations = self.durations[:self.cursor] + \
+            sorted(self.durations[self.cursor:], key=DurationQueue.start_key)
+        self.ordered = True
+
+    def _checkWritable(self):
+        if self.limit is not None:
+            raise Exception("Duration queue is read-only")
 
     def addDuration(self, d):
-        if d.getStartTime() in DurationQueue.durations.keys():
-            DurationQueue.durations.get(d.getStartTime()).append(d)
-        else:
-            duration_list = []
-            duration_list.append(d)
-            DurationQueue.durations.setdefault(d.getStartTime(), duration_list)
+        self._checkWritable()
+        if self.ordered and len(self.durations) > self.cursor and \
+                d.getStartTime() < self.durations[-1].getStartTime():
+            self.ordered = False
+        self.duration_count += 1
+        d.duration_id = self.duration_count
+        self.durations.append(d)
+
+    # Object counterpart of DurationStore.addDurations: takes the units
+    # themselves instead of unit ids and a UnitLevel, one Duration per row.
+    def addDurations(self, d_type, starts, ends, units, info=-100, ignore=False):
+        for i in xrange(len(starts)):
+            d = Duration(d_type, starts[i], ends[i], units[i], info)
+            d.ignore = ignore
+            self.addDuration(d)
 
     def addDurationQueue(self, queue):
         all_durations = queue.getAllDurations()
@@ -19,88 +63,56 @@ class DurationQueue(object):
             self.addDuration(d)
 
     def remove(self, d):
-        ts = d.getStartTime()
-        durations = DurationQueue.durations.get(ts)
-        durations.remove(d)
-        if len(durations) == 0:
-            DurationQueue.durations.pop(ts)
+        self._checkWritable()
+        for i in xrange(self.cursor, len(self.durations)):
+            if self.durations[i] is d:
+                self.durations = self.durations[:i] + self.durations[i+1:]
+                return
+        raise ValueError("Duration not in queue")
 
     def removeFirst(self):
-        if DurationQueue.durations.keys() == []:
+        if self.size() == 0:
             return None
 
-        # pop and deal with duration based on the timestamp, so we need to
-        # sort at first.
-        keys = DurationQueue.durations.keys()
-        keys.sort()
-        first_key = keys[0]
-
-        first_value = DurationQueue.durations[first_key]
-        first_duration = first_value.pop(0)
-        if len(first_value) == 0:
-            DurationQueue.durations.pop(first_key)
-
+        self._sort()
+        first_duration = self.durations[self.cursor]
+        self.cursor += 1
         return first_duration
 
     def getAllDurations(self):
-        res = []
-        for d in DurationQueue.durations.values():
-            res.append(d)
-        return res
+        self._sort()
+        return self.durations[self.cursor:self._end()]
 
     def convertToArray(self):
-        duration_list = []
-        # check if we can operate OrderedDict like this?
-        # Yes, we can. This is normal operation for Dict.
-        iterator = DurationQueue.durations.itervalues()
-        for l in iterator:
-            for d in l:
-                duration_list.append(d)
+        return self.getAllDurations()
 
-        return duration_list
-
-    # override?
+    # Return a read-only cursor over the current durations. The clone shares
+    # the underlying list, so it costs O(1) and draining it leaves this queue
+    # untouched.
     def clone(self):
+        self._sort()
         ret = DurationQueue()
-        keys = DurationQueue.durations.keys()
-        keys.sort()
-        # this place will be self.durations or DurationQueue.durations?
-        for ts in keys:
-            list1 = DurationQueue.durations.get(ts)
-            list2 = []
-            for d in list1:
-                list2.append(d)
-            ret.durations.setdefault(ts, list2)
-
+        ret.durations = self.durations
+        ret.cursor = self.cursor
+        ret.limit = self._end()
         return ret
 
     def size(self):
-        size = 0
-        for item in DurationQueue.durations.values():
-            size += len(item)
-        return size
+        return self._end() - self.cursor
 
     def printAll(self, file_name, msg):
         with open(file_name, 'w+') as out:
             out.write(msg + "\n")
-            keys = DurationQueue.durations.keys()
-            keys.sort()
-            for t in keys:
-                res = DurationQueue.durations[t]
-                for d in res:
-                    if d.ignore is False:
-                        out.write(d.toString())
+            for d in self.getAllDurations():
+                if d.ignore is False:
+                    out.write(d.toString())
 
     def printDurations(self, file_name, msg, duration_type=Duration.DurationType.Unavailable, sort=True):
         with open(file_name, 'w') as fp:
             fp.write(msg + "\n")
-            keys = DurationQueue.durations.keys()
             if sort:
-                keys.sort()
-            for t in keys:
-                res = DurationQueue.durations[t]
-                for d in res:
-                    if (d.ignore is False) and \
-                            d.getType() == duration_type:
-                        fp.write(d.toString())
-
+                self._sort()
+            for d in self.durations[self.cursor:self._end()]:
+                if (d.ignore is False) and \
+                        d.getType() == duration_type:
+                    fp.write(d.toString())
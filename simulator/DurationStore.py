@@ -0,0 +1,238 @@
+from enum import Enum
+
+import numpy as np
+
+from simulator.Duration import Duration
+from simulator.unit.Rack import Rack
+from simulator.unit.Machine import Machine
+from simulator.unit.Disk import Disk
+from simulator.unit.Sector import Sector
+
+
+class DurationStore(object):
+    """
+    Columnar duration timeline, an alternative to DurationQueue.
+
+    Every duration is one row of parallel typed arrays instead of a Duration
+    object with its own attribute dict, about 30 bytes per duration instead
+    of several hundred. Units are kept once in a registry keyed by unit id.
+    A latent sector error is stored against its disk with level Sector, so
+    no Sector object has to outlive the generator that produced it.
+    """
+
+    class UnitLevel(Enum):
+        Rack = 0
+        Machine = 1
+        Disk = 2
+        Sector = 3
+        Other = 4
+
+    # column name -> dtype
+    COLUMNS = [("start", np.float64),
+               ("end", np.float64),
+               ("unit_id", np.int32),
+               ("unit_level", np.int8),
+               ("type", np.int8),
+               ("info", np.int16),
+               ("ignore", np.bool_),
+               ("duration_id", np.int32)]
+
+    def __init__(self, capacity=1024):
+        self.capacity = max(int(capacity), 1)
+        self.count = 0
+        self.columns = {}
+        for name, dtype in DurationStore.COLUMNS:
+            self.columns[name] = np.empty(self.capacity, dtype)
+        # unit id -> unit object
+        self.units = {}
+        # units missing from 'units' are looked up here, see registerTopology()
+        self.topology = None
+        # disk id -> Sector standing in for LSE rows of that disk
+        self.sectors = {}
+        self.ordered = True
+        self.duration_count = 0
+
+    def _reserve(self, n):
+        if self.count + n <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < self.count + n:
+            capacity *= 2
+        for name, dtype in DurationStore.COLUMNS:
+            column = np.empty(capacity, dtype)
+            column[:self.count] = self.columns[name][:self.count]
+            self.columns[name] = column
+        self.capacity = capacity
+
+    def registerUnit(self, unit):
+        if isinstance(unit, Sector):
+            unit = unit.getParent()
+            level = DurationStore.UnitLevel.Sector
+        elif isinstance(unit, Rack):
+            level = DurationStore.UnitLevel.Rack
+        elif isinstance(unit, Machine):
+            level = DurationStore.UnitLevel.Machine
+        elif isinstance(unit, Disk):
+            level = DurationStore.UnitLevel.Disk
+        else:
+            level = DurationStore.UnitLevel.Other
+        self.units[unit.getID()] = unit
+        return unit.getID(), level
+
+    def registerUnits(self, units):
+        for unit in units:
+            self.registerUnit(unit)
+
+    # Rows may refer to any unit of the topology by id without registering
+    # it, its view is created when the row is read.
+    def registerTopology(self, topology):
+        self.topology = topology
+
+    def addDuration(self, d):
+        unit_id, level = self.registerUnit(d.getUnit())
+        self._reserve(1)
+        i = self.count
+        if self.ordered and i and d.getStartTime() < self.columns["start"][i-1]:
+            self.ordered = False
+        self.columns["start"][i] = d.getStartTime()
+        self.columns["end"][i] = d.getEndTime()
+        self.columns["unit_id"][i] = unit_id
+        self.columns["unit_level"][i] = level.value
+        self.columns["type"][i] = d.getType().value
+        self.columns["info"][i] = d.info
+        self.columns["ignore"][i] = d.ignore
+        self.duration_count += 1
+        self.columns["duration_id"][i] = self.duration_count
+        self.count += 1
+
+    # Append many durations of one type and unit level at once. unit_ids
+    # must belong to units already known through registerUnit(s); starts,
+    # ends, unit_ids, info and ignore may be arrays or scalars.
+    def addDurations(self, d_type, starts, ends, unit_ids, level, info=-100,
+                     ignore=False):
+        starts = np.asarray(starts, np.float64)
+        n = starts.size
+        if n == 0:
+            return
+        self._reserve(n)
+        s = slice(self.count, self.count + n)
+        if self.ordered and (self.count and starts[0] < self.columns["start"][self.count-1] or
+                             np.any(np.diff(starts) < 0)):
+            self.ordered = False
+
+        self.columns["start"][s] = starts
+        self.columns["end"][s] = ends
+        self.columns["unit_id"][s] = unit_ids
+        self.columns["unit_level"][s] = level.value
+        self.columns["type"][s] = d_type.value
+        self.columns["info"][s] = info
+        self.columns["ignore"][s] = ignore
+        self.columns["duration_id"][s] = np.arange(self.duration_count + 1,
+                                                   self.duration_count + n + 1)
+        self.count += n
+        self.duration_count += n
+
+    def column(self, name):
+        return self.columns[name][:self.count]
+
+    def size(self):
+        return self.count
+
+    # Stable sort by start time, so equal start times keep insertion order
+    # as in DurationQueue.
+    def sort(self):
+        if self.ordered:
+            return
+        order = np.argsort(self.column("start"), kind="mergesort")
+        for name, dtype in DurationStore.COLUMNS:
+            self.columns[name][:self.count] = self.column(name)[order]
+        self.ordered = True
+
+    # Return a new store holding the rows where mask is True, sharing the
+    # unit registry with this one.
+    def select(self, mask):
+        indexes = np.flatnonzero(mask)
+        ret = DurationStore(len(indexes))
+        for name, dtype in DurationStore.COLUMNS:
+            ret.columns[name][:len(indexes)] = self.column(name)[indexes]
+        ret.count = len(indexes)
+        ret.units = self.units
+        ret.topology = self.topology
+        ret.sectors = self.sectors
+        ret.ordered = self.ordered
+        ret.duration_count = self.duration_count
+        return ret
+
+    def filter(self, duration_type=None, level=None, start_time=None,
+               end_time=None, include_ignored=True):
+        mask = np.ones(self.count, np.bool_)
+        if duration_type is not None:
+            mask &= self.column("type") == duration_type.value
+        if level is not None:
+            mask &= self.column("unit_level") == level.value
+        if start_time is not None:
+            mask &= self.column("end") > start_time
+        if end_time is not None:
+            mask &= self.column("start") < end_time
+        if not include_ignored:
+            mask &= ~self.column("ignore")
+        return self.select(mask)
+
+    # Unit of row i. LSE rows return a Sector of the disk, shared by all
+    # LSE rows of that disk.
+    def getUnit(self, i):
+        unit_id = int(self.columns["unit_id"][i])
+        unit = self.units.get(unit_id)
+        if unit is None:
+            if self.topology is None:
+                raise Exception("Unknown unit id " + str(unit_id))
+            unit = self.topology.getUnit(unit_id)
+        if self.columns["unit_level"][i] == DurationStore.UnitLevel.Sector.value:
+            sector = self.sectors.get(unit.getID())
+            if sector is None:
+                sector = Sector("sector", unit)
+                self.sectors[unit.getID()] = sector
+            unit = sector
+        return unit
+
+    def getUnits(self):
+        return [self.getUnit(i) for i in xrange(self.count)]
+
+    def toDuration(self, i):
+        d = Duration(Duration.DurationType(int(self.columns["type"][i])),
+                     float(self.columns["start"][i]),
+                     float(self.columns["end"][i]), self.getUnit(i),
+                     int(self.columns["info"][i]))
+        d.ignore = bool(self.columns["ignore"][i])
+        d.duration_id = int(self.columns["duration_id"][i])
+        return d
+
+    def printAll(self, file_name, msg):
+        self.sort()
+        with open(file_name, 'w+') as out:
+            out.write(msg + "\n")
+            ignores = self.column("ignore")
+            for i in xrange(self.count):
+                if not ignores[i]:
+                    out.write(self.toDuration(i).toString())
+
+    def nbytes(self):
+        return sum([self.column(name).nbytes for name, dtype in DurationStore.COLUMNS])
+
+
+if __name__ == "__main__":
+    from sys import getsizeof
+
+    rack = Rack("rack0", None, {})
+    store = DurationStore()
+    size = 100000
+    starts = np.random.uniform(0, 87600, size)
+    store.registerUnit(rack)
+    store.addDurations(Duration.DurationType.Unavailable, starts, starts + 1.0,
+                       rack.getID(), DurationStore.UnitLevel.Rack)
+    store.sort()
+    print "bytes per duration in store:", float(store.nbytes())/size
+
+    d = Duration(Duration.DurationType.Unavailable, 0.0, 1.0, rack)
+    print "bytes per Duration object:", getsizeof(d) + getsizeof(d.__dict__) + \
+        getsizeof(d.attributes) + getsizeof(d.start_time) + getsizeof(d.end_time)
@@ -0,0 +1,52 @@
+from enum import Enum
+
+
+class Event(object):
+
+    class EventType(Enum):
+        Failure = 0
+        Recovered = 1
+        EagerRecoveryStart = 2
+        EagerRecoveryInstallment = 3
+        LatentDefect = 4
+        LatentRecovered = 5
+        UpgradeCheck = 6
+
+    def __init__(self, e_type, time, unit, info=-100):
+        self.type = e_type
+        self.time = time
+        self.unit = unit
+        self.info = info
+        # recovery time of the failure this event starts, set by the
+        # generator of the event where the handler needs it
+        self.next_recovery_time = None
+        self.ignore = False
+        self.attributes = {}
+        # numbered by the EventQueue the event is added to
+        self.event_id = None
+        # True while the event waits in an EventQueue
+        self.queued = False
+
+    def getType(self):
+        return self.type
+
+    def getTime(self):
+        return self.time
+
+    def getUnit(self):
+        return self.unit
+
+    def getAttributes(self, key):
+        if self.attributes == {}:
+            return None
+        return self.attributes[key]
+
+    def setAttributes(self, key, value):
+        self.attributes[key] = value
+
+    # time + " " + unit + " " + type + " " + info + " " + ignore + " " + id
+    def toString(self):
+        format_string = str(self.time) + "  " + self.unit.toString() + "  " \
+            + str(self.type) + "  " + str(self.info) + "  " \
+            + str(self.ignore) + "  " + str(self.event_id) + "\n"
+        return format_string
@@ -0,0 +1,213 @@
+import os
+import json
+
+import numpy as np
+
+from simulator.Duration import Duration
+from simulator.DurationStore import DurationStore
+from simulator.unit.Sector import Sector
+
+
+class EventLog(object):
+    """
+    Binary event log, a columnar alternative to the text files written by
+    DurationQueue.printAll.
+
+    The file is a fixed header followed by records of RECORD, appended in
+    chunks of at most CHUNK rows, one write each. Appends from several
+    processes therefore never interleave inside a chunk. Full unit names
+    are written once per unit to the side file '<path>.units', as
+    "unit_id level name" lines.
+
+    Readers map the records without copying them, see records() and select().
+    toText() writes the text format of printAll for one iteration.
+    """
+    MAGIC = "SMRSUEVT"
+    HEADER_SIZE = 256
+    VERSION = 1
+    RECORD = np.dtype([("iteration", np.int32),
+                       ("duration_id", np.int32),
+                       ("start", np.float64),
+                       ("end", np.float64),
+                       ("unit_id", np.int32),
+                       ("unit_level", np.int8),
+                       ("type", np.int8),
+                       ("info", np.int16)])
+    # rows per write
+    CHUNK = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self.units_path = path + ".units"
+        # unit ids whose names this process already wrote
+        self.named = set()
+        self.names = None
+        self._records = None
+
+    # Write the header of a new, empty log. Appending processes (workers of
+    # one run) must only start after the log was created.
+    def create(self):
+        header = json.dumps({"version": EventLog.VERSION,
+                             "dtype": EventLog.RECORD.descr})
+        header = EventLog.MAGIC + header
+        if len(header) >= EventLog.HEADER_SIZE:
+            raise Exception("Event log header too long")
+        with open(self.path, "wb") as fp:
+            fp.write(header.ljust(EventLog.HEADER_SIZE - 1) + "\n")
+        open(self.units_path, "w").close()
+        return self
+
+    def _appendBytes(self, path, data):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _appendNames(self, unit_ids, levels, units):
+        lines = []
+        for unit_id, level, unit in zip(unit_ids, levels, units):
+            if unit_id in self.named:
+                continue
+            self.named.add(unit_id)
+            if isinstance(unit, Sector):
+                unit = unit.getParent()
+            lines.append("%d %d %s\n" % (unit_id, level, unit.toString()))
+        if lines:
+            self._appendBytes(self.units_path, "".join(lines))
+
+    # Append the durations of one iteration that are not ignored, from a
+    # DurationQueue or a DurationStore.
+    def append(self, durations, iteration):
+        if isinstance(durations, DurationStore):
+            durations.sort()
+            rows = np.flatnonzero(~durations.column("ignore"))
+            records = np.empty(len(rows), EventLog.RECORD)
+            for name in ("start", "end", "unit_id", "unit_level", "type", "info",
+                         "duration_id"):
+                records[name] = durations.column(name)[rows]
+            unit_ids, first = np.unique(records["unit_id"], return_index=True)
+            # names are keyed by disk id, sectors included
+            self._appendNames(unit_ids.tolist(), records["unit_level"][first].tolist(),
+                              [durations.getUnit(rows[i]) for i in first])
+        else:
+            all_durations = [d for d in durations.getAllDurations() if not d.ignore]
+            records = np.empty(len(all_durations), EventLog.RECORD)
+            register = DurationStore()
+            unit_ids = []
+            levels = []
+            for i, d in enumerate(all_durations):
+                unit_id, level = register.registerUnit(d.getUnit())
+                unit_ids.append(unit_id)
+                levels.append(level.value)
+                records[i] = (0, d.duration_id, d.getStartTime(), d.getEndTime(),
+                              unit_id, level.value, d.getType().value, d.info)
+            units = [register.units[unit_id] for unit_id in unit_ids]
+            self._appendNames(unit_ids, levels, units)
+        records["iteration"] = iteration
+
+        for i in xrange(0, len(records), EventLog.CHUNK):
+            self._appendBytes(self.path, records[i:i + EventLog.CHUNK].tobytes())
+        self._records = None
+        return len(records)
+
+    # All records, mapped read-only. Records still being appended by
+    # another process show up on the next call.
+    def records(self):
+        if self._records is None:
+            with open(self.path, "rb") as fp:
+                header = fp.read(EventLog.HEADER_SIZE)
+            if not header.startswith(EventLog.MAGIC):
+                raise Exception(self.path + " is not an event log")
+            meta = json.loads(header[len(EventLog.MAGIC):].strip())
+            if meta["version"] != EventLog.VERSION:
+                raise Exception("Unsupported event log version " + str(meta["version"]))
+            count = (os.path.getsize(self.path) - EventLog.HEADER_SIZE)/EventLog.RECORD.itemsize
+            if count == 0:
+                return np.empty(0, EventLog.RECORD)
+            self._records = np.memmap(self.path, EventLog.RECORD, "r",
+                                      EventLog.HEADER_SIZE, (count,))
+        return self._records
+
+    # Records of the given iteration(s), unit id(s), duration type that
+    # overlap [start_time, end_time). Without filters the mapping itself
+    # is returned, otherwise a copy of the matching rows.
+    def select(self, start_time=None, end_time=None, unit_ids=None,
+               duration_type=None, iteration=None):
+        records = self.records()
+        mask = None
+
+        def both(a, b):
+            if a is None:
+                return b
+            return a & b
+
+        if iteration is not None:
+            mask = both(mask, np.in1d(records["iteration"], np.atleast_1d(iteration)))
+        if unit_ids is not None:
+            mask = both(mask, np.in1d(records["unit_id"], np.atleast_1d(unit_ids)))
+        if duration_type is not None:
+            mask = both(mask, records["type"] == duration_type.value)
+        if start_time is not None:
+            mask = both(mask, records["end"] > start_time)
+        if end_time is not None:
+            mask = both(mask, records["start"] < end_time)
+        if mask is None:
+            return records
+        return np.asarray(records[mask])
+
+    def iterations(self):
+        return np.unique(self.records()["iteration"]).tolist()
+
+    # unit id -> full name, as Unit.toString() gave it when written.
+    def unitNames(self):
+        if self.names is None:
+            self.names = {}
+            with open(self.units_path) as fp:
+                for line in fp:
+                    unit_id, level, name = line.rstrip("\n").split(" ", 2)
+                    self.names[int(unit_id)] = name
+        return self.names
+
+    def unitName(self, record):
+        name = self.unitNames()[int(record["unit_id"])]
+        if record["unit_level"] == DurationStore.UnitLevel.Sector.value:
+            name += ".sector"
+        return name
+
+    # Write the records of one iteration in the text format of
+    # DurationQueue.printAll.
+    def toText(self, file_name, iteration, msg=None):
+        records = self.select(iteration=iteration)
+        # stable, so equal start times keep their order as in the queue
+        records = records[np.argsort(records["start"], kind="mergesort")]
+        if msg is None:
+            msg = "Iteration number: " + str(iteration)
+        with open(file_name, "w+") as out:
+            out.write(msg + "\n")
+            for record in records:
+                out.write(str(float(record["start"])) + "  " + str(float(record["end"])) +
+                          "  " + self.unitName(record) + "  " +
+                          str(Duration.DurationType(int(record["type"]))) + "  " +
+                          str(int(record["info"])) + "  False  " +
+                          str(int(record["duration_id"])) + "\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize or convert a binary event log.")
+    parser.add_argument("path")
+    parser.add_argument("--text", default=None,
+                        help="write each iteration to TEXT-<iteration> in the text format")
+    args = parser.parse_args()
+
+    log = EventLog(args.path)
+    records = log.records()
+    print "%d records, %d units, iterations %s" % (len(records), len(log.unitNames()),
+                                                    log.iterations())
+    for d_type in Duration.DurationType:
+        print "  %s: %d" % (d_type, np.count_nonzero(records["type"] == d_type.value))
+    if args.text is not None:
+        for iteration in log.iterations():
+            log.toText(args.text + "-" + str(iteration), iteration)
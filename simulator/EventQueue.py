@@ -0,0 +1,138 @@
+from heapq import heappush, heappop, heapify
+
+
+class EventQueue(object):
+    """
+    Pending events in a binary heap of (time, event_id, event) entries.
+    Event ids are handed out in insertion order, so events with the same
+    time come out in the order they were added and the heap never compares
+    the events themselves. addEvent() and removeFirst() cost O(log n).
+
+    cancel() only marks the event ignored, O(1); removeFirst() drops
+    ignored entries when they reach the top. Once cancelled entries make up
+    more than half of the heap it is rebuilt without them, which keeps the
+    heap within twice the live events at O(1) amortized cost per cancel.
+    """
+    # heaps smaller than this are never compacted
+    COMPACT_MIN = 1024
+
+    def __init__(self):
+        self.heap = []
+        # ids handed out to events added to this queue
+        self.event_count = 0
+        # cancelled events still in the heap
+        self.cancelled = 0
+
+    def addEvent(self, e):
+        if e.queued:
+            raise Exception("Event " + str(e.event_id) + " is already queued")
+        self.event_count += 1
+        e.event_id = self.event_count
+        e.queued = True
+        if e.ignore:
+            self.cancelled += 1
+        heappush(self.heap, (e.time, self.event_count, e))
+
+    def addEvents(self, events):
+        for e in events:
+            self.addEvent(e)
+
+    def cancel(self, e):
+        if e.ignore or not e.queued:
+            return
+        e.ignore = True
+        self.cancelled += 1
+        if self.cancelled*2 > len(self.heap) >= EventQueue.COMPACT_MIN:
+            self._compact()
+
+    def _compact(self):
+        for entry in self.heap:
+            if entry[2].ignore:
+                entry[2].queued = False
+        self.heap = [entry for entry in self.heap if not entry[2].ignore]
+        heapify(self.heap)
+        self.cancelled = 0
+
+    def _dropCancelled(self):
+        heap = self.heap
+        while heap and heap[0][2].ignore:
+            heappop(heap)[2].queued = False
+            self.cancelled -= 1
+
+    # The next live event, None if there is none.
+    def removeFirst(self):
+        self._dropCancelled()
+        if not self.heap:
+            return None
+        e = heappop(self.heap)[2]
+        e.queued = False
+        return e
+
+    def peek(self):
+        self._dropCancelled()
+        if not self.heap:
+            return None
+        return self.heap[0][2]
+
+    # Live events in the order removeFirst() returns them.
+    def getAllEvents(self):
+        return [entry[2] for entry in sorted(self.heap) if not entry[2].ignore]
+
+    def size(self):
+        return len(self.heap) - self.cancelled
+
+    # Hand events to handler.handleEvent(e, queue) in time order until the
+    # queue is empty or the next event is later than 'end_time'; handlers
+    # may add and cancel events meanwhile. Return the count handled.
+    def run(self, handler, end_time=None):
+        heap = self.heap
+        handle = handler.handleEvent
+        count = 0
+        while True:
+            # inlined removeFirst(), this runs once per event
+            while heap and heap[0][2].ignore:
+                heappop(heap)[2].queued = False
+                self.cancelled -= 1
+            if not heap or (end_time is not None and heap[0][0] > end_time):
+                break
+            e = heappop(heap)[2]
+            e.queued = False
+            handle(e, self)
+            count += 1
+            # _compact() builds a new list
+            heap = self.heap
+        return count
+
+    def printAll(self, file_name, msg):
+        with open(file_name, 'w+') as out:
+            out.write(msg + "\n")
+            for e in self.getAllEvents():
+                out.write(e.toString())
+
+
+if __name__ == "__main__":
+    from random import seed, uniform
+
+    from simulator.Event import Event
+
+    class Recorder(object):
+        def __init__(self):
+            self.events = []
+
+        def handleEvent(self, e, queue):
+            self.events.append(e)
+
+    seed(1)
+    queue = EventQueue()
+    events = [Event(Event.EventType.Failure, round(uniform(0, 100), 0), None)
+              for i in xrange(10000)]
+    queue.addEvents(events)
+    for e in events[::3]:
+        queue.cancel(e)
+    recorder = Recorder()
+    handled = queue.run(recorder, 50)
+    keys = [(e.getTime(), e.event_id) for e in recorder.events]
+    print "handled:", handled, "left:", queue.size()
+    print "ordered and stable:", keys == sorted(keys)
+    print "no cancelled events:", not any(e.ignore for e in recorder.events)
+    print "rest later than 50:", all(e.getTime() > 50 for e in queue.getAllEvents())
@@ -1,14 +1,26 @@
+import sys
+from collections import OrderedDict
+from itertools import izip
 from copy import deepcopy
+from heapq import heappush, heappop
 from random import random, choice
 
-from simulator.Configuration import Configuration
+import numpy as np
+from numpy.random import randint
+from numpy.random import random as np_random
+
+from simulator.Configuration import getConfiguration
 from simulator.Result import Result
 from simulator.Duration import Duration
 from simulator.DurationQueue import DurationQueue
+from simulator.DurationStore import DurationStore
+from simulator.TimelineStream import TimelineStream
+from simulator.Tracer import Tracer, getTracer
 
 from simulator.unit.Rack import Rack
 from simulator.unit.Machine import Machine
 from simulator.unit.Disk import Disk
+from simulator.unit.Unit import Unit
 from simulator.unit.Sector import Sector
 
 from simulator.dataDistribute.SSSDistribute import SSSDistribute, HierSSSDistribute
@@ -19,17 +31,26 @@ class HandleDuration(object):
     def __init__(self, durations):
         self.durations = durations
 
-        self.conf = Configuration()
+        self.conf = getConfiguration()
         self.drs_handler = self.conf.getDRSHandler()
         self.isMDS = self.drs_handler.isMDS
         ft = self.drs_handler.n - self.drs_handler.k
+        self.repair_table = None
         if self.isMDS:
             self.ft = ft
         else:
-            # We only consider LRC with l = 2, so we
-            # need to consider failures more than n-k-1
-            self.ft = ft - 1
+            # Stripes of other codes survive up to repair_table.ft failures,
+            # with more they are lost with the probability the table gives
+            # for their failure count.
+            self.repair_table = self.conf.getRepairTable()
+            if self.repair_table is not None:
+                self.ft = self.repair_table.ft
+            else:
+                # We only consider LRC with l = 2, so we
+                # need to consider failures more than n-k-1
+                self.ft = ft - 1
 
+        self.tracer = getTracer()
         self.concurrent_count = 0
         self.lost_concurrent_count = 0
         self.total_failure_slice_count = 0
@@ -43,31 +64,110 @@ class HandleDuration(object):
     def isHandleLost(self):
         return self.handle_only_lost
 
+    # Return start times, end times, loss flags and units of all durations,
+    # ordered by start time. Works on a DurationQueue or a DurationStore.
+    def _columns(self):
+        if isinstance(self.durations, DurationStore):
+            store = self.durations
+            store.sort()
+            is_loss = store.column("type") == Duration.DurationType.Loss.value
+            return (store.column("start").tolist(), store.column("end").tolist(),
+                    is_loss.tolist(), store.getUnits())
+
+        durations = self.durations.clone().getAllDurations()
+        return ([d.getStartTime() for d in durations],
+                [d.getEndTime() for d in durations],
+                [d.getType() == Duration.DurationType.Loss for d in durations],
+                [d.getUnit() for d in durations])
+
     # Return concurrent durations
     # format: {(start time, end time):[list of units], ...}
+    # Sweep line over the durations in start order. A min-heap of end times
+    # drops expired durations and gives the earliest end of the open ones,
+    # so each duration is pushed and popped once: O(n log n) plus the size
+    # of the unit lists returned. A TimelineStream is consumed as it is
+    # generated, only the open durations are held.
     def findConcurrent(self):
+        if isinstance(self.durations, TimelineStream):
+            ret = self._sweep(self.durations.records())
+            print "duration size:", self.durations.count
+            return ret
+
+        starts, ends, is_loss, units = self._columns()
+        print "duration size:", len(starts)
+        return self._sweep(izip(starts, ends, is_loss, units))
+
+    # Sweep over (start, end, is_loss, unit) records in start order.
+    def _sweep(self, records):
+        concurrent_durations = {}
+        lost_concurrent_durations = {}
+        last_concurrent_period = None
+
+        # (end time, index) of the open durations
+        end_heap = []
+        # index -> unit of the open durations, in arrival order
+        open_units = OrderedDict()
+        for i, (current_time, end_time, is_loss, unit) in enumerate(records):
+            while end_heap and end_heap[0][0] <= current_time:
+                del open_units[heappop(end_heap)[1]]
+
+            heappush(end_heap, (end_time, i))
+            open_units[i] = unit
+            if len(end_heap) <= self.ft:
+                continue
+
+            # durations arrive in start order, so the current one has the
+            # latest start of all open durations.
+            concurrent_period = (current_time, end_heap[0][0])
+            if last_concurrent_period is None:
+                last_concurrent_period = concurrent_period
+            else:
+                if concurrent_period[0] < last_concurrent_period[1]:
+                    pop_units = concurrent_durations.pop(last_concurrent_period)
+                    concurrent_durations[(last_concurrent_period[0], concurrent_period[0])] = pop_units
+                    if concurrent_period[1] < last_concurrent_period[1]:
+                        concurrent_durations[(concurrent_period[1], last_concurrent_period[1])] = pop_units
+
+            concurrent_units = open_units.values()
+            concurrent_durations[concurrent_period] = concurrent_units
+
+            if is_loss:
+                lost_concurrent_durations[concurrent_period] = concurrent_units
+                self.lost_concurrent_count += 1
+
+            last_concurrent_period = concurrent_period
+            self.concurrent_count += 1
+
+        print "lost concurrent count:", self.lost_concurrent_count
+        print "concurrent count:", self.concurrent_count
+        return lost_concurrent_durations, concurrent_durations
+
+    # Former O(n*k) implementation of findConcurrent, which rescans the open
+    # durations for every arrival. Kept as the reference for equivalence
+    # checks.
+    def findConcurrentByScan(self):
         tmp_durations = []
         concurrent_durations = {}
         lost_concurrent_durations = {}
         last_concurrent_period = None
 
-        durations = self.durations.clone()
-        print "duration size:", durations.size()
+        starts, ends, is_loss, units = self._columns()
+        print "duration size:", len(starts)
 
-        while durations.size() != 0:
-            d = durations.removeFirst()
-            current_time = d.getStartTime()
+        # tmp_durations holds the indexes of the durations still open
+        for i in xrange(len(starts)):
+            current_time = starts[i]
 
-            for tmp_d in reversed(tmp_durations):
-                if tmp_d.getEndTime() <= current_time:
-                    tmp_durations.remove(tmp_d)
+            for j in reversed(tmp_durations):
+                if ends[j] <= current_time:
+                    tmp_durations.remove(j)
 
-            tmp_durations.append(d)
+            tmp_durations.append(i)
             if len(tmp_durations) <= self.ft:
                 continue
 
-            concurrent_period = (max([tmp.getStartTime() for tmp in tmp_durations]),
-                    min([tmp.getEndTime() for tmp in tmp_durations]))
+            concurrent_period = (max([starts[j] for j in tmp_durations]),
+                    min([ends[j] for j in tmp_durations]))
             if last_concurrent_period is None:
                 last_concurrent_period = concurrent_period
             else:
@@ -77,10 +177,10 @@ class HandleDuration(object):
                     if concurrent_period[1] < last_concurrent_period[1]:
                         concurrent_durations[(concurrent_period[1], last_concurrent_period[1])] = pop_units
 
-            concurrent_units = [tmp.getUnit() for tmp in tmp_durations]
+            concurrent_units = [units[j] for j in tmp_durations]
             concurrent_durations[concurrent_period] = concurrent_units
 
-            if d.getType() == Duration.DurationType.Loss:
+            if is_loss[i]:
                 lost_concurrent_durations[concurrent_period] = concurrent_units
                 self.lost_concurrent_count += 1
 
@@ -91,6 +191,10 @@ class HandleDuration(object):
         print "concurrent count:", self.concurrent_count
         return lost_concurrent_durations, concurrent_durations
 
+    # Slices are counted per period with the disk -> slice incidence of the
+    # distributer: every failed rack, machine or disk contributes one
+    # contiguous range of slice indexes, and the ranges are counted with a
+    # single vectorized pass.
     def process(self, concurrent_durations, distributer):
         total_failure_times = 0
         self.total_failure_slice_count = 0
@@ -98,54 +202,47 @@ class HandleDuration(object):
         # failure_period * failure_slice_count
         failure_period_with_weight = 0.0
 
+        incidence = distributer.getSliceIncidence()
+        disk_usage = distributer.diskUsage()
+
         periods = concurrent_durations.keys()
         for period in periods:
-            # key:slice_index, value:failure count in slice
-            slice_failures = {}
+            segments = []
 
             f_units = concurrent_durations[period]
             for u in f_units:
                 if isinstance(u, Sector):
                     r = random()
                     # if no chunk is hited by sector error
-                    if r > distributer.diskUsage():
+                    if r > disk_usage:
+                        continue
+                    all_slices = incidence.slicesOf(u.parent)
+                    if len(all_slices) == 0:
                         continue
-                    all_slices = u.parent.getChildren()
-                    slice_index = choice(all_slices)
-                    slice_failures.setdefault(slice_index, slice_failures.pop(slice_index, 0) + 1)
+                    i = randint(len(all_slices))
+                    segments.append(all_slices[i:i+1])
                 else:
-                    disks = []
-                    if isinstance(u, Rack):
-                        distributer.getAllDisksInRack(u, disks)
-                    elif isinstance(u, Machine):
-                        disks += u.getChildren()
-                    elif isinstance(u, Disk):
-                        disks.append(u)
-                    else:
-                        raise Exception("Invalid unit")
-
-                    for disk in disks:
-                        slices = disk.getChildren()
-                        for slice_index in slices:
-                            slice_failures.setdefault(slice_index, slice_failures.pop(slice_index, 0) + 1)
-
-            failure_slice_count = 0
-            slice_failure_in_period_flag = False
-            failure_nums = slice_failures.values()
-            for num in failure_nums:
-                if self.isMDS and num > self.ft:
-                    slice_failure_in_period_flag = True
-                    failure_slice_count += 1
-                if not self.isMDS and num > self.ft:
-                    if num == self.ft + 1:
-                        r2 = random()
-                        if r2 < self.drs_handler.threshold:
-                            slice_failure_in_period_flag = True
-                            failure_slice_count += 1
-                            print "random:%f, failures:%d,period:%f, threshold:%f" % (r2, failure_slice_count, period[1]-period[0], self.drs_handler.threshold)
-                    else:
-                        slice_failure_in_period_flag = True
-                        failure_slice_count += 1
+                    segments.append(incidence.slicesOf(u))
+
+            slice_indexes, failure_nums = incidence.countFailures(segments, self.ft)
+            if self.isMDS:
+                failure_slice_count = len(slice_indexes)
+            else:
+                if self.repair_table is not None:
+                    probabilities = self.repair_table.loss_probability[np.minimum(failure_nums, self.drs_handler.n)]
+                else:
+                    # slices with exactly ft+1 failures are lost with the
+                    # probability given by the threshold of the code
+                    probabilities = np.where(failure_nums == self.ft + 1, self.drs_handler.threshold, 1.0)
+                uncertain = probabilities < 1.0
+                hits = np.count_nonzero(np_random(np.count_nonzero(uncertain)) < probabilities[uncertain])
+                failure_slice_count = len(slice_indexes) - np.count_nonzero(uncertain) + hits
+                if hits and self.tracer.concurrent:
+                    self.tracer.trace("concurrent", Tracer.INFO, random_hits=hits,
+                                      failures=failure_slice_count, start=period[0],
+                                      end=period[1])
+            slice_failure_in_period_flag = failure_slice_count > 0
+
             self.total_failure_slice_count += failure_slice_count
             failure_period_with_weight += failure_slice_count*(period[1] - period[0])
 
@@ -177,3 +274,47 @@ class HandleDuration(object):
 
     def printToFile(self, file_path, concurrent_durations):
         pass
+
+
+# Read a timeline written by DurationQueue.printAll back into a DurationQueue.
+# Units are rebuilt as plain units named after the recorded full names.
+def readDurations(file_path):
+    durations = DurationQueue()
+    units = {}
+    with open(file_path, 'r') as fp:
+        fp.readline()
+        for line in fp:
+            items = line.split()
+            if len(items) < 7:
+                continue
+            unit = units.get(items[2])
+            if unit is None:
+                unit = Unit(items[2], None, None)
+                units[items[2]] = unit
+            d_type = Duration.DurationType[items[3].split(".")[-1]]
+            durations.addDuration(Duration(d_type, float(items[0]), float(items[1]),
+                                           unit, int(items[4])))
+    return durations
+
+
+# Check findConcurrent against findConcurrentByScan on one timeline.
+def testEquivalence(durations):
+    def names(concurrent_durations):
+        res = {}
+        for period, units in concurrent_durations.items():
+            res[period] = [u.toString() for u in units]
+        return res
+
+    sweep = HandleDuration(durations).findConcurrent()
+    scan = HandleDuration(durations).findConcurrentByScan()
+    for sweep_periods, scan_periods in zip(sweep, scan):
+        if names(sweep_periods) != names(scan_periods):
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    # usage: python -m simulator.HandleDuration event_file [event_file ...]
+    for file_path in sys.argv[1:]:
+        equivalent = testEquivalence(readDurations(file_path))
+        print file_path, "equivalent:", equivalent
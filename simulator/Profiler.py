@@ -0,0 +1,84 @@
+import resource
+from contextlib import contextmanager
+from time import time
+
+
+def cpuTime():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peakRSS():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+
+class Profiler(object):
+    """
+    Wall time, CPU time and peak memory of the phases of one run, with
+    counters of what each phase handled.
+
+    Phases are timed with 'with profiler.phase(name):'. The peak RSS of a
+    phase is that of the process when the phase ends; it only grows, so
+    'rss_growth_mb' tells the phases that raised it. The phase named
+    'profile_phase' also runs under cProfile, its stats are dumped to
+    'profile_path'.
+    """
+
+    def __init__(self, profile_phase=None, profile_path=None):
+        self.phases = []
+        self.counts = {}
+        self.profile_phase = profile_phase
+        self.profile_path = profile_path
+
+    @contextmanager
+    def phase(self, name):
+        profile = None
+        if name == self.profile_phase:
+            import cProfile
+            profile = cProfile.Profile()
+        rss = peakRSS()
+        wall = time()
+        cpu = cpuTime()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self.profile_path)
+            end_rss = peakRSS()
+            self.phases.append({"name": name, "wall": time() - wall, "cpu": cpuTime() - cpu,
+                                "peak_rss_mb": end_rss, "rss_growth_mb": end_rss - rss})
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def get(self, name):
+        for phase in self.phases:
+            if phase["name"] == name:
+                return phase
+        return None
+
+    def toDict(self):
+        return {"phases": self.phases, "counts": self.counts}
+
+    def toString(self):
+        lines = ["%-20s %10s %10s %10s" % ("phase", "wall(s)", "cpu(s)", "rss(MB)")]
+        for phase in self.phases:
+            lines.append("%-20s %10.3f %10.3f %10.1f" % (phase["name"], phase["wall"],
+                                                          phase["cpu"], phase["peak_rss_mb"]))
+        for name in sorted(self.counts):
+            lines.append("%s: %s" % (name, self.counts[name]))
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    profiler = Profiler("sum", "/tmp/profiler-sum.prof")
+    with profiler.phase("list"):
+        values = range(10**6)
+    with profiler.phase("sum"):
+        total = sum([v*v for v in values])
+    profiler.count("values", len(values))
+    print profiler.toString()
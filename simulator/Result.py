@@ -1,25 +1,52 @@
 
 
 class Result(object):
-    lost_slice_count = 0
-    unavailable_slice_count = 0
+    """
+    Result of one iteration. Every run gets a fresh instance from its
+    Context, so iterations in the same process never share values.
+    """
 
-    PDL = 0.0  # PDL = (lost slices)/(total slices)
-    PDLT = 0.0  # PDLT = (lost times)/(total slices)
-    PUA = 0.0  # PUA = (unavailable period)/(mission time)
-    PUAW = 0.0  # PUAW = (unavailable duration* unavailable slices)/(total slices * mission time)
+    def __init__(self):
+        self.lost_slice_count = 0
+        self.unavailable_slice_count = 0
 
-    # total repair cost
-    TRT = 0.0
+        self.PDL = 0.0  # PDL = (lost slices)/(total slices)
+        self.PDLT = 0.0  # PDLT = (lost times)/(total slices)
+        self.PUA = 0.0  # PUA = (unavailable period)/(mission time)
+        self.PUAW = 0.0  # PUAW = (unavailable duration* unavailable slices)/(total slices * mission time)
+        self.PUS = 0.0  # PUS = (unavailable slice durations)/(total slices * mission time)
+
+        # normalized magnitude of data loss, bytes per TB
+        self.NOMDL = 0.0
+        self.MTTR = 0.0
+        self.MTBF = 0.0
+        # mean time to data loss of the system, in hours
+        self.MTTDL = 0.0
+        # expected unavailable time of a slice over the mission time, in ms
+        self.unavailable_ms = 0.0
+
+        # total repair cost
+        self.TRT = 0.0
+
+        # likelihood ratio of the iteration under failure biasing and its
+        # log, estimates are means of weight*value
+        self.likelihood_ratio = 1.0
+        self.log_likelihood_ratio = 0.0
+
+        # phases and counters of the iteration, see Profiler.toDict()
+        self.profile = None
+
+        # slice_index:[[failure time, recovery time],...]
+        self.unavailable_slice_durations = {}
 
     def toString(self):
-        return "lost=" + str(Result.lost_slice_count) + \
-            "; unavailable=" + str(Result.unavailable_slice_count) + \
-            "; PDL=" + str(Result.PDL) + \
-            "; PDLT=" + str(Result.PDLT) + \
-            "; PUA=" + str(Result.PUA) + \
-            "; PUAW=" + str(Result.PUAW) + \
-            "; TRT=" + str(Result.TRT) + "TiB"
+        return "lost=" + str(self.lost_slice_count) + \
+            "; unavailable=" + str(self.unavailable_slice_count) + \
+            "; PDL=" + str(self.PDL) + \
+            "; PDLT=" + str(self.PDLT) + \
+            "; PUA=" + str(self.PUA) + \
+            "; PUAW=" + str(self.PUAW) + \
+            "; TRT=" + str(self.TRT) + "TiB"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+from math import sqrt
+
+from scipy.stats import t as student_t
+
+
+class RunningStatistics(object):
+    """
+    Running mean and variance of per-iteration metrics (Welford's
+    algorithm), with Student-t confidence intervals of the means.
+
+    Iterations are added one at a time as they finish, so a run can stop
+    as soon as the intervals of the metrics it cares about are narrow
+    enough, see reached().
+    """
+    # metrics Simulation.run() sets; repair traffic (TRT) is only counted
+    # by EventHandler, so it can not be tracked here
+    METRICS = ["PDL", "PUA", "PUS", "NOMDL"]
+
+    def __init__(self, metrics=None, confidence=0.95):
+        if metrics is None:
+            metrics = RunningStatistics.METRICS
+        if not 0 < confidence < 1:
+            raise Exception("Confidence must be between 0 and 1")
+        self.metrics = list(metrics)
+        self.confidence = confidence
+        self.count = 0
+        self.means = dict([(name, 0.0) for name in self.metrics])
+        # sums of squared deviations from the running means
+        self.m2 = dict([(name, 0.0) for name in self.metrics])
+
+    # values: metric name -> value of one iteration.
+    def add(self, values):
+        self.count += 1
+        for name in self.metrics:
+            x = float(values[name])
+            delta = x - self.means[name]
+            self.means[name] += delta/self.count
+            self.m2[name] += delta*(x - self.means[name])
+
+    def mean(self, name):
+        return self.means[name]
+
+    def variance(self, name):
+        if self.count < 2:
+            return float("inf")
+        return self.m2[name]/(self.count - 1)
+
+    # Half-width of the confidence interval of the mean.
+    def halfWidth(self, name):
+        if self.count < 2:
+            return float("inf")
+        quantile = student_t.ppf((1 + self.confidence)/2.0, self.count - 1)
+        return quantile*sqrt(self.variance(name)/self.count)
+
+    # Half-width relative to the mean, infinite while the mean is 0.
+    def relativeHalfWidth(self, name):
+        mean = abs(self.means[name])
+        if mean == 0:
+            return float("inf")
+        return self.halfWidth(name)/mean
+
+    # True when every metric in 'names' has a relative half-width of at
+    # most 'target'.
+    def reached(self, target, names=None):
+        if names is None:
+            names = self.metrics
+        for name in names:
+            if self.relativeHalfWidth(name) > target:
+                return False
+        return True
+
+    def toString(self, name):
+        relative = self.relativeHalfWidth(name)
+        if relative == float("inf"):
+            relative = "n/a"
+        else:
+            relative = "%.1f%%" % (100*relative)
+        return "%s: %.4e +- %.4e (%s) at %g%%" % (name, self.means[name], self.halfWidth(name),
+                                                 relative, 100*self.confidence)
+
+
+if __name__ == "__main__":
+    import numpy as np
+
+    # intervals of exponential samples with mean 2 should cover it about
+    # 95% of the time
+    np.random.seed(1)
+    covered = 0
+    for i in xrange(1000):
+        stats = RunningStatistics(["x"])
+        for x in np.random.exponential(2.0, 50):
+            stats.add({"x": x})
+        if abs(stats.mean("x") - 2.0) <= stats.halfWidth("x"):
+            covered += 1
+    print "coverage of 95% intervals:", covered/1000.0
+    print stats.toString("x")
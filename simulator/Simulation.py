@@ -1,44 +1,134 @@
 import os
 import sys
 import csv
+import json
+import argparse
+import traceback
 
-from random import uniform, sample
+from math import exp
+from random import uniform, sample, seed, Random
 from copy import deepcopy
-from time import strftime
+from time import strftime, time, sleep
+from multiprocessing import Pool, RawArray, active_children
+from signal import SIGKILL
+
+from numpy import random as np_random
 
 from simulator.Duration import Duration
-from simulator.Result import Result
-from simulator.utils import splitMethod
+from simulator.Context import Context, setContext
 from simulator.DurationQueue import DurationQueue
+from simulator.DurationStore import DurationStore
+from simulator.utils import splitMethod
 from simulator.Log import info_logger, error_logger
-from simulator.Configuration import Configuration
+from simulator.Configuration import Configuration, setConfiguration
 from simulator.XMLParser import XMLParser
 from simulator.HandleDuration import HandleDuration
+from simulator.RunningStatistics import RunningStatistics
+from simulator.Profiler import Profiler
+from simulator.Tracer import Tracer, setTracer
+from simulator.TimelineBuilder import TimelineBuilder
+from simulator.TimelineStream import TimelineStream
+from simulator.EventLog import EventLog
+from simulator.models.MarkovChain import MarkovChain
+from simulator.failure.WeibullGenerator import WeibullGenerator
+from simulator.failure.BiasedWeibullGenerator import BiasedWeibullGenerator
 
 from simulator.unit.Rack import Rack
 from simulator.unit.Machine import Machine
 from simulator.unit.Disk import Disk
 
 from simulator.dataDistribute.SSSDistribute import SSSDistribute, HierSSSDistribute
+from simulator.dataDistribute.PlacementCache import PlacementCache
 
 DEFAULT = r"/root/SIMDDC/conf/"
 RESULT = r"/root/SIMDDC/log/"
 
+# Simulation shared with the worker processes, set before the pool forks.
+_simulation = None
+# pid of the worker that took each task, 0 until one does; shared memory
+# set before the pool forks
+_owners = None
 
-class Simulation(object):
 
-    def __init__(self, conf_path):
+# Run one iteration in a worker process. Errors are returned instead of
+# raised, so one failing iteration does not stop the others.
+def _runIteration(args):
+    slot, iteration, iteration_seed = args
+    _owners[slot] = os.getpid()
+    try:
+        return iteration, _simulation.runIteration(iteration, iteration_seed), None
+    except Exception:
+        return iteration, None, traceback.format_exc()
+
+
+class Simulation(object):
+    # phases of run(), in order
+    PHASES = ["placement", "durations", "event_log", "findConcurrent", "process_loss",
+              "process_unavailable"]
+    # seconds between checks of the worker processes
+    POLL = 0.05
+
+    # profile_phase: phase of run() to profile with cProfile in every
+    # iteration, see Profiler.
+    def __init__(self, conf_path, profile_phase=None):
         self.iteration_times = 1
         self.ts = strftime("%Y%m%d.%H.%M.%S")
         self.total_events_handled = 0
-
-        self.conf = Configuration(conf_path)
-        xml = XMLParser(self.conf)
-        if self.conf.hier:
-            self.distributer = HierSSSDistribute(xml)
-        else:
-            self.distributer = SSSDistribute(xml)
-        # self.conf = self.distributer.returnConf()
+        self.profile_phase = profile_phase
+
+        # configuration, XML and topology
+        self.setup_profiler = Profiler()
+        with self.setup_profiler.phase("parse"):
+            self.conf = setConfiguration(Configuration(conf_path))
+            self.tracer = setTracer(Tracer.fromConf(self.conf))
+            if self.conf.columnar_durations:
+                self.context = setContext(Context(DurationStore))
+            else:
+                self.context = setContext(Context(DurationQueue))
+            xml = XMLParser(self.conf)
+            if self.conf.hier:
+                self.distributer = HierSSSDistribute(xml)
+            else:
+                self.distributer = SSSDistribute(xml)
+            # self.conf = self.distributer.returnConf()
+            self.context.markTopology()
+        self.setup_profiler.count("units", self.distributer.getTopology().size)
+
+        self.placement_cache = None
+        if self.conf.placement_cache_dir is not None:
+            self.placement_cache = PlacementCache(self.conf.placement_cache_dir)
+        # seed of the running iteration, placements are only cached for
+        # seeded iterations
+        self.iteration_seed = None
+        # binary event log of this run, created before workers fork
+        self.event_log = None
+
+        # failure generators of the tier prototypes, biased for importance
+        # sampling
+        self.biased_generators = []
+        if self.conf.failure_bias != 1:
+            self.biasFailures(self.conf.failure_bias)
+
+    # Replace the failure generators of racks, machines and disks with
+    # BiasedWeibullGenerators, every iteration then carries a likelihood ratio.
+    def biasFailures(self, bias):
+        topology = self.distributer.getTopology()
+        for unit_class in (Rack, Machine, Disk):
+            tier = topology.getTier(unit_class)
+            if tier is None or tier.prototype.failure_generator is None:
+                continue
+            generator = tier.prototype.failure_generator
+            if not isinstance(generator, WeibullGenerator):
+                raise Exception("failure_bias supports Weibull failure generators only, not " +
+                                generator.__class__.__name__)
+            biased = BiasedWeibullGenerator(generator, bias)
+            tier.prototype.failure_generator = biased
+            self.biased_generators.append(biased)
+
+    # Clear the state left by the previous iteration, the topology is kept.
+    def reset(self):
+        self.context.reset()
+        self.distributer.clearSlices()
 
     def insertUpgradeDurations(self, upgrade_infos):
         freq = int(upgrade_infos[0])
@@ -128,69 +218,370 @@ class Simulation(object):
     def getDistributer(self):
         return self.distributer
 
+    def eventLog(self):
+        if self.event_log is None:
+            self.event_log = EventLog(self.conf.event_file + '-' + self.ts + ".evlog").create()
+        return self.event_log
+
     def writeToCSV(self, res_file_path, contents):
         with open(res_file_path, "w") as fp:
             writer = csv.writer(fp, lineterminator='\n')
             for item in contents:
                 writer.writerow(item)
 
+    def distributeSlices(self, root):
+        if self.placement_cache is None or self.iteration_seed is None:
+            self.distributer.distributeSlices(root, self.conf.total_slices)
+            return
+        key = self.placement_cache.key(self.distributer, self.iteration_seed)
+        if not self.placement_cache.load(key, self.distributer):
+            self.distributer.distributeSlices(root, self.conf.total_slices)
+            self.placement_cache.save(key, self.distributer, self.conf.data_redundancy +
+                                      " seed " + str(self.iteration_seed))
+
+    # Stats file of the profiled phase of the running iteration.
+    def profilePath(self):
+        return self.resultFilePath()[:-len(".csv")] + "-" + str(self.profile_phase) + "-" + \
+            str(self.iteration_times) + ".prof"
+
     def run(self):
         root = self.distributer.getRoot()
+        result = self.context.result
+        profiler = Profiler(self.profile_phase, self.profilePath())
 
-        self.distributer.distributeSlices(root, conf.total_slices)
+        with profiler.phase("placement"):
+            self.distributeSlices(root)
         durations_handled = 0
-        durations = DurationQueue()
-
-        root.generateDurations(durations, 0, self.conf.total_time, True)
+        durations = self.context.durations
+        for generator in self.biased_generators:
+            generator.resetWeight()
+
+        with profiler.phase("durations"):
+            if self.conf.streaming_timeline:
+                # generated while findConcurrent consumes it
+                durations = TimelineStream(self.distributer.getTopology(), self.conf.total_time,
+                                           self.conf.timeline_window)
+                if self.conf.eventToFile():
+                    durations.logTo(self.eventLog(), self.iteration_times)
+            elif self.conf.batched_timeline:
+                TimelineBuilder(self.distributer.getTopology(), self.conf.total_time).build(durations)
+            else:
+                root.generateDurations(durations, 0, self.conf.total_time, True)
 
-        duration_file = self.conf.event_file + '-' + self.ts
-        durations.printAll(duration_file, "Iteration number: "+str(self.iteration_times))
+        if self.conf.eventToFile() and not self.conf.streaming_timeline:
+            with profiler.phase("event_log"):
+                if self.conf.event_format == "binary":
+                    self.eventLog().append(durations, self.iteration_times)
+                else:
+                    duration_file = self.conf.event_file + '-' + self.ts + '-' + str(self.iteration_times)
+                    durations.printAll(duration_file, "Iteration number: "+str(self.iteration_times))
 
         duration_handler = HandleDuration(durations)
 
-        lost_concurrent, concurrent = duration_handler.findConcurrent()
-        lost_times, lost_slice_count, _null, _null1 = duration_handler.process(lost_concurrent, self.distributer)
-        Result.lost_slice_count = lost_slice_count
-        Result.PDL = format(float(lost_slice_count)/self.conf.total_slices, ".4e")
-        Result.PDLT = format(float(lost_slice_count)/self.conf.total_slices, ".4e")
-        print "Lost: "+ str(Result.lost_slice_count) + " PDL:" + Result.PDL + " PDLT:" + Result.PDLT
-
-        _null, _null1, unavailable_period, unavailable_period_with_weight = duration_handler.process(concurrent, self.distributer)
-        Result.unavailable_slice_count = duration_handler.returnFailureSliceCount()
-        Result.PUA = format(unavailable_period/conf.total_time, ".4e")
-        Result.PUAW = format(unavailable_period_with_weight/(conf.total_time*conf.total_slices), ".4e")
-
-        print "Unavailable: " + str(Result.unavailable_slice_count) + \
-                " PUA:" + Result.PUA + "  PUAW:" + Result.PUAW
-
-
-    def main(self, num_iterations):
-        contents = []
-
-        for i in xrange(num_iterations):
-            result = self.run()
-            contents.append([result.PDL, result.NOMDL, result.MTTR, result.MTBF, result.PUA, result.PUS, result.TRT])
-            unavailable_slices = result.unavailable_slice_durations.keys()
-            for slice_index in unavailable_slices:
-                print "slice %d unavailable duration %s" % (slice_index, str(result.unavailable_slice_durations[slice_index]))
-
+        with profiler.phase("findConcurrent"):
+            lost_concurrent, concurrent = duration_handler.findConcurrent()
+        if self.conf.streaming_timeline:
+            profiler.count("durations", durations.count)
+        else:
+            profiler.count("durations", durations.size())
+        profiler.count("lost_concurrent_periods", len(lost_concurrent))
+        profiler.count("concurrent_periods", len(concurrent))
+
+        with profiler.phase("process_loss"):
+            lost_times, lost_slice_count, _null, _null1 = duration_handler.process(lost_concurrent, self.distributer)
+        profiler.count("lost_slices", lost_slice_count)
+        result.lost_slice_count = lost_slice_count
+        result.PDL = format(float(lost_slice_count)/self.conf.total_slices, ".4e")
+        result.PDLT = format(float(lost_slice_count)/self.conf.total_slices, ".4e")
+        # bytes lost per TB stored, as EventHandler.NOMDL
+        result.NOMDL = lost_slice_count*(self.conf.chunk_size*pow(2, 20)) / \
+            (self.conf.total_active_storage*pow(2, 10))
+        print "Lost: "+ str(result.lost_slice_count) + " PDL:" + result.PDL + " PDLT:" + result.PDLT
+
+        with profiler.phase("process_unavailable"):
+            _null, _null1, unavailable_period, unavailable_period_with_weight = duration_handler.process(concurrent, self.distributer)
+        result.unavailable_slice_count = duration_handler.returnFailureSliceCount()
+        profiler.count("unavailable_slices", result.unavailable_slice_count)
+        result.PUA = format(unavailable_period/self.conf.total_time, ".4e")
+        result.PUAW = format(unavailable_period_with_weight/(self.conf.total_time*self.conf.total_slices), ".4e")
+        # the periods are weighted by their unavailable slices, so PUAW is
+        # the unavailable slice time over all slice time
+        result.PUS = result.PUAW
+
+        print "Unavailable: " + str(result.unavailable_slice_count) + \
+                " PUA:" + result.PUA + "  PUAW:" + result.PUAW
+
+        if self.biased_generators:
+            # the timeline is complete once findConcurrent consumed it
+            result.log_likelihood_ratio = sum([g.log_weight for g in self.biased_generators])
+            result.likelihood_ratio = exp(result.log_likelihood_ratio)
+            print "Likelihood ratio: %.4e (log %.2f)" % (result.likelihood_ratio,
+                                                     result.log_likelihood_ratio)
+
+        result.profile = profiler.toDict()
+        self.tracer.flush()
+        return result
+
+    # Seeds of all iterations, derived from one base seed. An iteration gets
+    # the same seed whichever process runs it, so results do not depend on
+    # the number of jobs.
+    def iterationSeeds(self, num_iterations, base_seed=None):
+        if base_seed is None:
+            base_seed = Random().randint(0, 2**31 - 1)
+        info_logger.info("base seed: " + str(base_seed))
+        rng = Random(base_seed)
+        return [rng.randint(0, 2**31 - 1) for i in xrange(num_iterations)]
+
+    # Run iteration number 'iteration' (starting at 1) from a clean state.
+    def runIteration(self, iteration, iteration_seed):
+        self.iteration_times = iteration
+        self.iteration_seed = iteration_seed
+        self.reset()
+        seed(iteration_seed)
+        np_random.seed(iteration_seed)
+        return self.run()
+
+    def resultRow(self, result):
+        row = [result.PDL, result.NOMDL, result.MTTR, result.MTBF, result.PUA, result.PUS, result.TRT]
+        if self.biased_generators:
+            row.append(result.log_likelihood_ratio)
+        return row
+
+    def resultFilePath(self):
         res_file_path = RESULT + self.conf.data_redundancy + '-'
-        if self.conf.system_upgrade:
+        if self.conf.upgrades:
             res_file_path += "upgrade-"
         res_file_path += self.ts + ".csv"
-        self.writeToCSV(res_file_path, contents)
-
+        return res_file_path
+
+    # Iterations whose results come back are written to the CSV as soon as
+    # they arrive, in iteration order.
+    # mode "simulation" runs the iterations, "analytic" only solves the
+    # Markov chain model, "both" reports the model next to the iterations.
+    # num_iterations is the iteration budget. With a 'target', the run
+    # stops as soon as the confidence intervals of the 'stop_on' metrics
+    # are within +-target of their means, after at least min_iterations.
+    # max_time bounds the wall-clock time of the run in seconds.
+    def main(self, num_iterations, jobs=1, base_seed=None, timeout=None, mode="simulation",
+             target=None, confidence=0.95, stop_on=("PDL",), min_iterations=10,
+             max_time=None):
+        if mode == "analytic":
+            self.printEstimate(self.analytic())
+            return
+
+        seeds = self.iterationSeeds(num_iterations, base_seed)
+        tasks = [(i + 1, seeds[i]) for i in xrange(num_iterations)]
+        if self.conf.eventToFile() and self.conf.event_format == "binary":
+            self.eventLog()
+
+        stats = RunningStatistics(RunningStatistics.METRICS, confidence)
+        profiles = []
+        stop_reason = "iteration budget"
+        start_time = time()
+        iterations = self._iterate(tasks, jobs, timeout)
+        with open(self.resultFilePath(), "w") as fp:
+            writer = csv.writer(fp, lineterminator='\n')
+            results = []
+            for iteration, result, error in iterations:
+                if error is not None:
+                    error_logger.error("iteration " + str(iteration) + " failed: " + error)
+                    continue
+                writer.writerow(self.resultRow(result))
+                fp.flush()
+                results.append(result)
+                profile = {"iteration": iteration, "seed": seeds[iteration - 1]}
+                profile.update(result.profile)
+                profiles.append(profile)
+                unavailable_slices = result.unavailable_slice_durations.keys()
+                for slice_index in unavailable_slices:
+                    print "slice %d unavailable duration %s" % (slice_index, str(result.unavailable_slice_durations[slice_index]))
+
+                stats.add(self.metricValues(result))
+                if target is not None and stats.count >= min_iterations and \
+                        stats.reached(target, stop_on):
+                    stop_reason = "target reached"
+                    break
+                if max_time is not None and time() - start_time >= max_time:
+                    stop_reason = "time budget"
+                    break
+        # stops the workers still running
+        iterations.close()
+        self.writeProfile(profiles)
+
+        self.printStatistics(stats, stop_reason, results)
+        if mode == "both":
+            self.printEstimate(self.analytic(), results)
+
+    # Phases and counters of the setup and of every iteration, as JSON next
+    # to the result CSV.
+    def writeProfile(self, profiles):
+        with open(self.resultFilePath()[:-len(".csv")] + "-profile.json", "w") as fp:
+            json.dump({"setup": self.setup_profiler.toDict(), "iterations": profiles}, fp,
+                      indent=2, sort_keys=True)
+
+    # Metrics of one iteration for RunningStatistics, weighted by the
+    # likelihood ratio under failure biasing.
+    def metricValues(self, result):
+        return dict([(name, result.likelihood_ratio*float(getattr(result, name)))
+                     for name in RunningStatistics.METRICS])
+
+    def printStatistics(self, stats, stop_reason, results):
+        if stats.count == 0:
+            print "no iteration finished"
+            return
+        print "%d iterations (%s)" % (stats.count, stop_reason)
+        if self.biased_generators:
+            ess = self.effectiveSampleSize(results)
+            print "effective sample size: %.1f of %d iterations" % (ess, len(results))
+            # a few iterations carry all the weight, the intervals below
+            # understate the error
+            if ess < self.conf.failure_bias_min_ess*len(results):
+                message = "effective sample size %.1f is below failure_bias_min_ess " \
+                    "(%s) of %d iterations, lower failure_bias" % \
+                    (ess, self.conf.failure_bias_min_ess, len(results))
+                error_logger.error(message)
+                print "WARNING: " + message
+        for name in stats.metrics:
+            if self.biased_generators:
+                print "weighted " + stats.toString(name)
+            else:
+                print stats.toString(name)
+
+    # (sum w)^2/sum w^2 of the likelihood ratios, in log space since the
+    # weights of strongly biased runs underflow.
+    def effectiveSampleSize(self, results):
+        top = max([result.log_likelihood_ratio for result in results])
+        scaled = [exp(result.log_likelihood_ratio - top) for result in results]
+        return sum(scaled)**2/sum([w*w for w in scaled])
+
+    # Analytic estimate of this configuration, see MarkovChain.
+    def analytic(self):
+        return MarkovChain(self.conf, self.distributer.getTopology()).estimate()
+
+    # Print the analytic estimate, and the mean of the Monte Carlo results
+    # if there are any, weighted by their likelihood ratios as in
+    # metricValues.
+    def printEstimate(self, estimate, results=None):
+        print "analytic:    PDL: %s PUAW: %s MTTDL: %.4e h unavailable: %.3f ms" % \
+            (estimate.PDL, estimate.PUAW, estimate.MTTDL, estimate.unavailable_ms)
+        if results:
+            pdl = sum([result.likelihood_ratio*float(result.PDL)
+                       for result in results])/len(results)
+            puaw = sum([result.likelihood_ratio*float(result.PUAW)
+                        for result in results])/len(results)
+            mean = "weighted mean" if self.biased_generators else "mean"
+            print "Monte Carlo: PDL: %.4e PUAW: %.4e (%s of %d iterations)" % \
+                (pdl, puaw, mean, len(results))
+
+    # Yield (iteration, result, error) for every task, in task order. With
+    # jobs > 1 the iterations run in a process pool forked from this
+    # process, so workers start with the configuration and topology already
+    # built. At most 'jobs' tasks are dispatched at a time and each gets
+    # 'timeout' seconds from its dispatch. Each worker records its pid for
+    # the task it takes: a task whose worker dies is failed, one that times
+    # out is failed and its worker killed. The pool replaces the lost
+    # workers, the other tasks run on.
+    def _iterate(self, tasks, jobs, timeout):
+        if jobs <= 1:
+            for iteration, iteration_seed in tasks:
+                yield iteration, self.runIteration(iteration, iteration_seed), None
+            return
+
+        global _simulation, _owners
+        _simulation = self
+        _owners = RawArray('i', len(tasks))
+        order = [task[0] for task in tasks]
+        remaining = list(enumerate(tasks))
+        # iteration -> (slot in _owners, async result, deadline)
+        running = {}
+        # finished iterations not yielded yet
+        done = {}
+        position = 0
+        pool = Pool(jobs)
+        try:
+            while position < len(order):
+                while remaining and len(running) < jobs:
+                    slot, task = remaining.pop(0)
+                    deadline = None if timeout is None else time() + timeout
+                    running[task[0]] = (slot, pool.apply_async(_runIteration, ((slot,) + task,)),
+                                        deadline)
+
+                for iteration in running.keys():
+                    if running[iteration][1].ready():
+                        done[iteration] = running.pop(iteration)[1].get()
+                # also reaps workers that died, the pool starts new ones
+                alive = set([process.pid for process in active_children()])
+                now = time()
+                for iteration in running.keys():
+                    slot, _null, deadline = running[iteration]
+                    pid = _owners[slot]
+                    # not taken by a worker yet, nothing to kill
+                    if pid == 0:
+                        continue
+                    if pid not in alive:
+                        done[iteration] = (iteration, None, "worker process died")
+                        del running[iteration]
+                    elif deadline is not None and now >= deadline:
+                        os.kill(pid, SIGKILL)
+                        done[iteration] = (iteration, None,
+                                           "timeout after " + str(timeout) + "s")
+                        del running[iteration]
+
+                while position < len(order) and order[position] in done:
+                    yield done.pop(order[position])
+                    position += 1
+                if running:
+                    sleep(Simulation.POLL)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            _simulation = None
+            _owners = None
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        raise Exception("Usage: python Test.py conf_path num_iterations")
-    path = sys.argv[1]
-    num_iterations = int(sys.argv[2])
-
-    if not os.path.isabs(path):
-        conf_path = DEFAULT + path
+    parser = argparse.ArgumentParser(description="Simulate reliability of a storage system.")
+    parser.add_argument("conf_path")
+    parser.add_argument("num_iterations", type=int)
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="base seed of the iteration seeds")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds one iteration may run in a worker, counted from its "
+                             "dispatch; timed-out workers are killed")
+    parser.add_argument("--mode", choices=["simulation", "analytic", "both"],
+                        default="simulation",
+                        help="analytic: Markov chain estimate only, both: estimate "
+                             "next to the simulation results")
+    parser.add_argument("--target", type=float, default=None,
+                        help="stop when the relative half-width of the confidence "
+                             "intervals is at most TARGET, e.g. 0.1; num_iterations "
+                             "is then the iteration budget")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="confidence level of the intervals")
+    parser.add_argument("--stop-on", default="PDL",
+                        help="comma separated metrics the target applies to, of " +
+                             ",".join(RunningStatistics.METRICS))
+    parser.add_argument("--min-iterations", type=int, default=10,
+                        help="iterations to run before checking the target")
+    parser.add_argument("--max-time", type=float, default=None,
+                        help="wall-clock budget of the run in seconds")
+    parser.add_argument("--profile", choices=Simulation.PHASES, default=None,
+                        help="run this phase under cProfile and save the stats of "
+                             "every iteration next to the result CSV")
+    args = parser.parse_args()
+
+    if not os.path.isabs(args.conf_path):
+        conf_path = DEFAULT + args.conf_path
     else:
-        conf_path = path
+        conf_path = args.conf_path
+
+    stop_on = splitMethod(args.stop_on)
+    for name in stop_on:
+        if name not in RunningStatistics.METRICS:
+            parser.error("unknown metric " + name)
 
-    sim = Simulation(conf_path)
-    sim.run()
+    sim = Simulation(conf_path, args.profile)
+    sim.main(args.num_iterations, args.jobs, args.seed, args.timeout, args.mode,
+             args.target, args.confidence, stop_on, args.min_iterations, args.max_time)
@@ -0,0 +1,366 @@
+from time import time
+
+import numpy as np
+
+from simulator.Duration import Duration
+from simulator.DurationStore import DurationStore
+from simulator.unit.Rack import Rack
+from simulator.unit.Machine import Machine
+from simulator.unit.Disk import Disk
+from simulator.unit.DiskWithScrubbing import DiskWithScrubbing
+from simulator.unit.Sector import Sector
+from simulator.failure.Trace import Trace
+from simulator.failure.BiasedWeibullGenerator import BiasedWeibullGenerator
+
+
+class TimelineBuilder(object):
+    """
+    Builds the failure timeline of the whole system one tier at a time.
+
+    Unit.generateDurations walks the tree unit by unit, draws one event at a
+    time and re-enters every disk once per up-interval of its machine. Here
+    every round draws the next event of all units of a tier in one call,
+    and the up-intervals of a tier are handed to the tier below as flat
+    arrays (owner, start, end), so a parent outage masks its children
+    without recursion. The tiers, parent indexes and generator parameters
+    come from the Topology, whose tier prototypes stand in for all units of
+    their tier.
+    """
+
+    def __init__(self, topology, end_time):
+        self.topology = topology
+        self.end_time = float(end_time)
+
+    def build(self, durations):
+        topology = self.topology
+        root_tier = topology.tiers[0]
+        owner = np.arange(root_tier.size)
+        starts = np.zeros(root_tier.size)
+        ends = np.repeat(self.end_time, root_tier.size)
+        # (owner, start, end) of the machine losses drawn so far
+        self.losses = _Intervals()
+
+        for level in xrange(len(topology.tiers)):
+            topology_tier = topology.tiers[level]
+            unit_starts = topology.start_times[topology_tier.first:
+                                               topology_tier.first + topology_tier.size]
+            starts = np.maximum(starts, unit_starts[owner])
+            tier = _Tier(durations, topology, topology_tier)
+            unit = topology_tier.prototype
+            for generator in unit.getEventGenerators():
+                if isinstance(generator, Trace):
+                    raise Exception("Trace generators need Unit.generateDurations")
+            if isinstance(unit.failure_generator, BiasedWeibullGenerator):
+                # balanced failure biasing: raised only while a unit above is lost
+                unit.failure_generator.setWindows(*self.losses.arrays()[1:])
+
+            if isinstance(unit, DiskWithScrubbing):
+                self._scrubbingDisks(tier, owner, starts, ends)
+                break
+            elif isinstance(unit, Disk):
+                self._disks(tier, owner, starts, ends)
+                break
+            elif isinstance(unit, Machine):
+                owner, starts, ends = self._machines(tier, owner, starts, ends)
+            elif unit.failure_generator is None:
+                pass
+            else:
+                # racks, and any other unit with its own failures
+                owner, starts, ends = self._racks(tier, owner, starts, ends,
+                                                  isinstance(unit, Rack))
+
+            if topology_tier.leaf:
+                break
+            parents = topology.tiers[level + 1].parent - topology_tier.first
+            owner, starts, ends = self._expand(owner, starts, ends, topology_tier.size,
+                                               parents)
+
+    # Hand the up-intervals of every parent to each of its children. The
+    # result is ordered by child, then by start time.
+    def _expand(self, owner, starts, ends, parent_count, parents):
+        keep = starts <= ends
+        owner, starts, ends = owner[keep], starts[keep], ends[keep]
+        order = np.lexsort((starts, owner))
+        owner, starts, ends = owner[order], starts[order], ends[order]
+
+        counts = np.bincount(owner, minlength=parent_count)
+        first = np.cumsum(counts) - counts
+        child_counts = counts[parents]
+        total = child_counts.sum()
+        child_owner = np.repeat(np.arange(len(parents)), child_counts)
+        within = np.arange(total) - np.repeat(np.cumsum(child_counts) - child_counts, child_counts)
+        indexes = first[parents][child_owner] + within
+        return child_owner, starts[indexes], ends[indexes]
+
+    # Racks fail and recover independently in every up-interval of their
+    # parent, the generators restart at every event.
+    def _racks(self, tier, owner, starts, ends, emit):
+        unit = tier.prototype
+        current = starts.copy()
+        last_recover = starts.copy()
+        rows = np.arange(len(starts))
+        up = _Intervals()
+
+        while rows.size:
+            failure = unit.failure_generator.generateNextEvents(current[rows], current[rows])
+            unit.failure_generator.censor(ends[rows])
+            recovery = unit.recovery_generator.generateNextEvents(failure, failure)
+            if np.any(recovery <= failure):
+                raise Exception("Recovery time is not after failure time")
+
+            over = failure > ends[rows]
+            up.add(owner[rows[over]], last_recover[rows[over]], ends[rows[over]])
+            rows, failure, recovery = rows[~over], failure[~over], recovery[~over]
+
+            if emit:
+                tier.add(Duration.DurationType.Unavailable, failure, recovery,
+                         owner[rows], DurationStore.UnitLevel.Rack,
+                         ignore=unit.fast_forward)
+            up.add(owner[rows], last_recover[rows], failure)
+
+            current[rows] = recovery
+            last_recover[rows] = recovery
+            rows = rows[recovery <= ends[rows]]
+
+        return up.arrays()
+
+    # Machines as in Machine.generateDurations: a fail_fraction of failures
+    # is permanent, transient failures longer than fail_timeout are type 2
+    # and turn into losses with eager recovery.
+    def _machines(self, tier, owner, starts, ends):
+        unit = tier.prototype
+        current = starts.copy()
+        last_recover = starts.copy()
+        rows = np.arange(len(starts))
+        up = _Intervals()
+
+        while rows.size:
+            failure = unit.failure_generator.generateNextEvents(current[rows], current[rows])
+            unit.failure_generator.censor(ends[rows])
+            over = failure > ends[rows]
+            up.add(owner[rows[over]], last_recover[rows[over]], ends[rows[over]])
+            rows, failure = rows[~over], failure[~over]
+            if not rows.size:
+                break
+
+            recovery = unit.recovery_generator.generateNextEvents(failure, failure)
+            if np.any(recovery <= failure):
+                raise Exception("Recovery time is not after failure time")
+            up.add(owner[rows], last_recover[rows], failure)
+            recovery = np.minimum(recovery, ends[rows])
+
+            # failure type: tempAndShort=1, tempAndLong=2, permanent=3
+            permanent = np.random.random(rows.size) < unit.fail_fraction
+            recovery[permanent] = unit.recovery_generator2.generateNextEvents(
+                failure[permanent]) + unit.machine_repair_time
+            long_failure = ~permanent & (recovery - failure > unit.fail_timeout)
+            if unit.eager_recovery_enabled:
+                recovery[long_failure] = failure[long_failure] + unit.fail_timeout + \
+                    unit.machine_repair_time
+                loss = permanent | long_failure
+            else:
+                loss = permanent
+            failure_type = np.where(permanent, 3, np.where(long_failure, 2, 1))
+            if not unit.fast_forward:
+                self.losses.add(owner[rows[loss]], failure[loss], recovery[loss])
+
+            for t in (1, 2, 3):
+                for d_type, mask in ((Duration.DurationType.Loss, loss),
+                                     (Duration.DurationType.Unavailable, ~loss)):
+                    mask = mask & (failure_type == t)
+                    tier.add(d_type, failure[mask], recovery[mask], owner[rows[mask]],
+                             DurationStore.UnitLevel.Machine, t, unit.fast_forward)
+
+            current[rows] = recovery
+            last_recover[rows] = recovery
+            rows = rows[recovery < ends[rows] - 1E-5]
+
+        return up.arrays()
+
+    # Disks without scrubbing restart their failure generator in every
+    # up-interval of the machine and after every recovery.
+    def _disks(self, tier, owner, starts, ends):
+        unit = tier.prototype
+        current = starts.copy()
+        rows = np.arange(len(starts))
+
+        while rows.size:
+            failure = unit.failure_generator.generateNextEvents(current[rows], current[rows])
+            unit.failure_generator.censor(ends[rows])
+            keep = failure <= ends[rows]
+            rows, failure = rows[keep], failure[keep]
+            if not rows.size:
+                break
+
+            recovery = unit.recovery_generator.generateNextEvents(failure, failure) + \
+                unit.disk_repair_time
+            if np.any(recovery <= failure):
+                raise Exception("Recovery time is not after failure time")
+            tier.add(Duration.DurationType.Loss, failure, recovery, owner[rows],
+                     DurationStore.UnitLevel.Disk)
+
+            current[rows] = recovery
+            rows = rows[recovery <= ends[rows]]
+
+    # Disks as in DiskWithScrubbing.generateDurations. The failure generator
+    # is never reset, a disk ages from time 0 and its next failure is drawn
+    # given it survived its last recovery and the start of the current
+    # up-interval, which is what the rejection loop there samples. State is
+    # carried from one up-interval of a disk to the next, so every round
+    # moves each disk one event or one interval forward.
+    def _scrubbingDisks(self, tier, owner, starts, ends):
+        unit = tier.prototype
+        disk_count = tier.size
+        counts = np.bincount(owner, minlength=disk_count)
+        position = np.cumsum(counts) - counts
+        last_interval = np.cumsum(counts)
+        last_recovery = np.zeros(disk_count)
+        # lifetime of latent errors starts at the last reconstruction
+        latent_start = np.zeros(disk_count)
+        current = np.zeros(disk_count)
+
+        disks = np.flatnonzero(counts)
+        current[disks] = starts[position[disks]]
+        windows = _Intervals()
+
+        while disks.size:
+            interval = position[disks]
+            interval_end = ends[interval]
+            failure = unit.failure_generator.generateNextEvents(
+                np.maximum(last_recovery[disks], starts[interval]))
+            unit.failure_generator.censor(interval_end)
+
+            # no failure before the machine goes down, move to its next up-interval
+            over = failure > interval_end
+            done = disks[over]
+            windows.add(done, current[done], interval_end[over], latent_start[done])
+            position[done] += 1
+            done = done[position[done] < last_interval[done]]
+            current[done] = starts[position[done]]
+
+            failed = disks[~over]
+            failure = failure[~over]
+            recovery = unit.recovery_generator.generateNextEvents(failure, failure) + \
+                unit.disk_repair_time
+            recovery = np.minimum(recovery, interval_end[~over])
+            tier.add(Duration.DurationType.Loss, failure, recovery, failed,
+                     DurationStore.UnitLevel.Disk)
+            windows.add(failed, current[failed], failure, latent_start[failed])
+
+            last_recovery[failed] = recovery
+            latent_start[failed] = recovery
+            current[failed] = recovery
+            disks = np.concatenate((done, failed))
+
+        self._latentErrors(tier, *windows.arrays())
+
+    # Latent sector errors and their scrub repairs inside every window
+    # (disk, start, end, lifetime start).
+    def _latentErrors(self, tier, disks, starts, ends, latent_starts):
+        unit = tier.prototype
+        current = starts.copy()
+        rows = np.flatnonzero(starts <= ends)
+
+        while rows.size:
+            latent_error = unit.latent_error_generator.generateNextEvents(
+                current[rows], latent_starts[rows])
+            keep = latent_error <= ends[rows]
+            rows, latent_error = rows[keep], latent_error[keep]
+            if not rows.size:
+                break
+
+            scrub_recovery = unit.scrub_generator.generateNextEvents(latent_error)
+            tier.add(Duration.DurationType.Loss, latent_error, scrub_recovery, disks[rows],
+                     DurationStore.UnitLevel.Sector, 0)
+
+            current[rows] = scrub_recovery
+            rows = rows[scrub_recovery <= ends[rows]]
+
+
+# Growing set of (owner, start, end, ...) columns.
+class _Intervals(object):
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, *columns):
+        self.parts.append(columns)
+
+    def arrays(self):
+        if not self.parts:
+            return np.empty(0, np.int64), np.empty(0), np.empty(0)
+        return tuple([np.concatenate(column) for column in zip(*self.parts)])
+
+
+# Durations of one tier, written to a DurationStore as columns or to a
+# DurationQueue as Duration objects. Rows refer to units by their position
+# in the tier.
+class _Tier(object):
+
+    def __init__(self, durations, topology, tier):
+        self.durations = durations
+        self.topology = topology
+        self.prototype = tier.prototype
+        self.size = tier.size
+        self.unit_ids = (topology.first_id + tier.indexes()).astype(np.int32)
+        self.columnar = isinstance(durations, DurationStore)
+        if self.columnar:
+            durations.registerTopology(topology)
+
+    def add(self, d_type, starts, ends, indexes, level, info=-100, ignore=False):
+        if len(indexes) == 0:
+            return
+        if self.columnar:
+            self.durations.addDurations(d_type, starts, ends, self.unit_ids[indexes],
+                                        level, info, ignore)
+            return
+        units = [self.topology.getUnit(self.unit_ids[i]) for i in indexes]
+        if level == DurationStore.UnitLevel.Sector:
+            units = [Sector("sector", unit) for unit in units]
+        self.durations.addDurations(d_type, starts.tolist(), ends.tolist(), units,
+                                    info, ignore)
+
+
+# Build the timeline of one configuration both ways and compare the number
+# of durations and their mean length per type, unit level and info.
+def compare(conf_path, seed=1):
+    from random import seed as py_seed
+
+    from simulator.Simulation import Simulation
+
+    sim = Simulation(conf_path)
+    root = sim.getDistributer().getRoot()
+    topology = sim.getDistributer().getTopology()
+    summaries = []
+    for batched in (False, True):
+        sim.reset()
+        py_seed(seed)
+        np.random.seed(seed)
+        durations = sim.context.durations
+        t = time()
+        if batched:
+            TimelineBuilder(topology, sim.conf.total_time).build(durations)
+        else:
+            root.generateDurations(durations, 0, sim.conf.total_time, True)
+        elapsed = time() - t
+
+        summary = {}
+        for d in durations.clone().getAllDurations():
+            key = (d.getType().name, d.getUnit().__class__.__name__, d.info)
+            count, length = summary.get(key, (0, 0.0))
+            summary[key] = (count + 1, length + d.getEndTime() - d.getStartTime())
+        summaries.append((elapsed, summary))
+    return summaries
+
+
+if __name__ == "__main__":
+    import sys
+
+    (unit_time, unit_summary), (batch_time, batch_summary) = compare(sys.argv[1])
+    print "Unit.generateDurations: %.2fs, TimelineBuilder: %.2fs" % (unit_time, batch_time)
+    for key in sorted(set(unit_summary.keys() + batch_summary.keys())):
+        print key,
+        for summary in (unit_summary, batch_summary):
+            count, length = summary.get(key, (0, 0.0))
+            print "%8d %10.3f" % (count, length/max(count, 1)),
+        print
@@ -0,0 +1,498 @@
+from heapq import merge
+from time import time
+
+import numpy as np
+
+from simulator.Duration import Duration
+from simulator.DurationStore import DurationStore
+from simulator.unit.Rack import Rack
+from simulator.unit.Machine import Machine
+from simulator.unit.Disk import Disk
+from simulator.unit.DiskWithScrubbing import DiskWithScrubbing
+from simulator.failure.Trace import Trace
+from simulator.failure.BiasedWeibullGenerator import BiasedWeibullGenerator
+
+
+class TimelineStream(object):
+    """
+    The failure timeline as a lazy stream of durations in start order.
+
+    TimelineBuilder generates the whole timeline before it is handled. Here
+    time is cut into windows of 'window' hours and all tiers advance one
+    window at a time, with the rules of TimelineBuilder. A unit keeps an
+    event drawn beyond the window pending for the next one, and up-intervals
+    reaching past the window are handed to the tier below again in the next
+    window, as continued intervals. Each tier writes the durations of a
+    window to its own DurationStore, and records() merges the tiers with a
+    heap. Only the durations of one window and the intervals still open are
+    held, so memory does not grow with the simulated time.
+    """
+
+    def __init__(self, topology, end_time, window):
+        self.topology = topology
+        self.end_time = float(end_time)
+        self.window = float(window)
+        self.event_log = None
+        self.iteration = None
+        # durations streamed so far, and ids given out
+        self.count = 0
+        self.duration_count = 0
+
+    # Append the durations of every window to 'event_log' as 'iteration'.
+    def logTo(self, event_log, iteration):
+        self.event_log = event_log
+        self.iteration = iteration
+
+    # (start, end, is_loss, unit) of all durations, ordered by start time.
+    def records(self):
+        self._start()
+        window_start = 0.0
+        while True:
+            window_end = min(window_start + self.window, self.end_time)
+            stores = self._advance(window_start, window_end)
+            if self.event_log is not None:
+                for store in stores:
+                    self.event_log.append(store, self.iteration)
+
+            for record in merge(*[self._rows(rank, store)
+                                  for rank, store in enumerate(stores)]):
+                self.count += 1
+                yield record[0], record[3], record[4], record[5]
+
+            if window_end >= self.end_time:
+                break
+            window_start = window_end
+
+    # Rows of one tier, in start order. Rank and row number come before the
+    # rest, so the heap never compares units.
+    def _rows(self, rank, store):
+        store.sort()
+        starts = store.column("start").tolist()
+        ends = store.column("end").tolist()
+        is_loss = (store.column("type") == Duration.DurationType.Loss.value).tolist()
+        for i in xrange(store.size()):
+            yield starts[i], rank, i, ends[i], is_loss[i], store.getUnit(i)
+
+    def _start(self):
+        topology = self.topology
+        self.tiers = []
+        for topology_tier in topology.tiers:
+            unit = topology_tier.prototype
+            for generator in unit.getEventGenerators():
+                if isinstance(generator, Trace):
+                    raise Exception("Trace generators need Unit.generateDurations")
+
+            if isinstance(unit, DiskWithScrubbing):
+                tier = _Tier(topology, topology_tier, DurationStore.UnitLevel.Disk)
+                tier.last_recovery = np.zeros(tier.size)
+                tier.latent_start = np.zeros(tier.size)
+                tier.current = np.zeros(tier.size)
+                self.latent_tier = _Tier(topology, topology_tier,
+                                         DurationStore.UnitLevel.Sector)
+            elif isinstance(unit, Disk):
+                tier = _Tier(topology, topology_tier, DurationStore.UnitLevel.Disk)
+            elif isinstance(unit, Machine):
+                tier = _Tier(topology, topology_tier, DurationStore.UnitLevel.Machine)
+            else:
+                tier = _Tier(topology, topology_tier, DurationStore.UnitLevel.Rack)
+            self.tiers.append(tier)
+            if isinstance(unit, Disk) or topology_tier.leaf:
+                break
+
+        # (start, end) of the machine losses not over yet
+        self.losses = (np.empty(0), np.empty(0))
+        root_size = topology.tiers[0].size
+        self.root = _OpenIntervals()
+        self.root.add(np.arange(root_size), np.zeros(root_size),
+                      np.repeat(self.end_time, root_size))
+
+    # Advance every tier to window_end, returns the DurationStores of the
+    # window.
+    def _advance(self, window_start, window_end):
+        topology = self.topology
+        stores = []
+        owner, starts, ends, cont = self.root.window(window_start, window_end)
+        loss_starts, loss_ends = self.losses
+        over = loss_ends <= window_start
+        self.losses = (loss_starts[~over], loss_ends[~over])
+
+        for level, tier in enumerate(self.tiers):
+            topology_tier = topology.tiers[level]
+            unit_starts = topology.start_times[topology_tier.first:
+                                               topology_tier.first + topology_tier.size]
+            starts = np.maximum(starts, unit_starts[owner])
+            pieces = (owner, starts, ends, cont)
+            unit = tier.prototype
+            tier.newWindow()
+            stores.append(tier.store)
+            if isinstance(unit.failure_generator, BiasedWeibullGenerator):
+                # balanced failure biasing: raised only while a unit above is lost
+                unit.failure_generator.setWindows(*self.losses)
+
+            if isinstance(unit, DiskWithScrubbing):
+                self._scrubbingDisks(tier, pieces, window_end)
+                self.latent_tier.newWindow()
+                stores.append(self.latent_tier.store)
+                self._latentErrors(self.latent_tier,
+                                   tier.latent.window(window_start, window_end),
+                                   window_end)
+                break
+            elif isinstance(unit, Disk):
+                self._disks(tier, pieces, window_end)
+                break
+            elif isinstance(unit, Machine):
+                self._machines(tier, pieces, window_end)
+                owner, starts, ends, cont = tier.up.window(window_start, window_end)
+            elif unit.failure_generator is None:
+                pass
+            else:
+                self._racks(tier, pieces, window_end, isinstance(unit, Rack))
+                owner, starts, ends, cont = tier.up.window(window_start, window_end)
+
+            if topology_tier.leaf:
+                break
+            parents = topology.tiers[level + 1].parent - topology_tier.first
+            owner, starts, ends, cont = self._expand(topology_tier.size, parents,
+                                                     owner, starts, ends, cont)
+
+        # ids follow on from the last window
+        for store in stores:
+            store.column("duration_id")[:] += self.duration_count
+            self.duration_count += store.size()
+        return stores
+
+    # TimelineBuilder._expand, for any number of columns.
+    def _expand(self, parent_count, parents, owner, starts, ends, *columns):
+        keep = starts <= ends
+        columns = [column[keep] for column in (starts, ends) + columns]
+        owner = owner[keep]
+        order = np.lexsort((columns[0], owner))
+        owner = owner[order]
+        columns = [column[order] for column in columns]
+
+        counts = np.bincount(owner, minlength=parent_count)
+        first = np.cumsum(counts) - counts
+        child_counts = counts[parents]
+        total = child_counts.sum()
+        child_owner = np.repeat(np.arange(len(parents)), child_counts)
+        within = np.arange(total) - np.repeat(np.cumsum(child_counts) - child_counts, child_counts)
+        indexes = first[parents][child_owner] + within
+        return tuple([child_owner] + [column[indexes] for column in columns])
+
+    # First events of a window: continued intervals resume with the event
+    # their unit left pending, the others restart the generator at their
+    # start.
+    def _firstEvents(self, tier, generator, owner, starts, ends, cont, start_times=None):
+        events = np.empty(len(owner))
+        events[cont] = tier.pending[owner[cont]]
+        new = np.flatnonzero(~cont)
+        if start_times is None:
+            start_times = starts
+        events[new] = generator.generateNextEvents(starts[new], start_times[new])
+        generator.censor(ends[new])
+        return events, new
+
+    # Rows whose next event is beyond the window or their interval stop for
+    # this window. The units of those whose interval goes on keep the event.
+    def _hold(self, tier, rows, events, ends, owner, window_end):
+        wait = events[rows] > np.minimum(ends[rows], window_end)
+        held = rows[wait & (ends[rows] > window_end)]
+        tier.pending[owner[held]] = events[held]
+        return rows[~wait]
+
+    # Rows that ran past the end of their interval. Units whose interval
+    # goes on stay down to its end.
+    def _finish(self, tier, rows, done, ends, owner, window_end):
+        held = rows[done & (ends[rows] > window_end)]
+        tier.pending[owner[held]] = np.inf
+        return rows[~done]
+
+    # As TimelineBuilder._racks. Up-intervals are added when the failure
+    # that ends them is drawn.
+    def _racks(self, tier, pieces, window_end, emit):
+        owner, starts, ends, cont = pieces
+        unit = tier.prototype
+        failure, new = self._firstEvents(tier, unit.failure_generator, owner, starts, ends,
+                                           cont)
+        tier.up.add(owner[new], starts[new], np.minimum(failure[new], ends[new]))
+        rows = np.arange(len(owner))
+
+        while rows.size:
+            rows = self._hold(tier, rows, failure, ends, owner, window_end)
+            recovery = unit.recovery_generator.generateNextEvents(failure[rows], failure[rows])
+            if np.any(recovery <= failure[rows]):
+                raise Exception("Recovery time is not after failure time")
+            if emit:
+                tier.add(Duration.DurationType.Unavailable, failure[rows], recovery,
+                         owner[rows], ignore=unit.fast_forward)
+
+            done = recovery > ends[rows]
+            recovery = recovery[~done]
+            rows = self._finish(tier, rows, done, ends, owner, window_end)
+            failure[rows] = unit.failure_generator.generateNextEvents(recovery, recovery)
+            unit.failure_generator.censor(ends[rows])
+            tier.up.add(owner[rows], recovery, np.minimum(failure[rows], ends[rows]))
+
+    # As TimelineBuilder._machines.
+    def _machines(self, tier, pieces, window_end):
+        owner, starts, ends, cont = pieces
+        unit = tier.prototype
+        failure, new = self._firstEvents(tier, unit.failure_generator, owner, starts, ends,
+                                           cont)
+        tier.up.add(owner[new], starts[new], np.minimum(failure[new], ends[new]))
+        rows = np.arange(len(owner))
+
+        while rows.size:
+            rows = self._hold(tier, rows, failure, ends, owner, window_end)
+            if not rows.size:
+                break
+            row_failure = failure[rows]
+            recovery = unit.recovery_generator.generateNextEvents(row_failure, row_failure)
+            if np.any(recovery <= row_failure):
+                raise Exception("Recovery time is not after failure time")
+            recovery = np.minimum(recovery, ends[rows])
+
+            # failure type: tempAndShort=1, tempAndLong=2, permanent=3
+            permanent = np.random.random(rows.size) < unit.fail_fraction
+            recovery[permanent] = unit.recovery_generator2.generateNextEvents(
+                row_failure[permanent]) + unit.machine_repair_time
+            long_failure = ~permanent & (recovery - row_failure > unit.fail_timeout)
+            if unit.eager_recovery_enabled:
+                recovery[long_failure] = row_failure[long_failure] + unit.fail_timeout + \
+                    unit.machine_repair_time
+                loss = permanent | long_failure
+            else:
+                loss = permanent
+            failure_type = np.where(permanent, 3, np.where(long_failure, 2, 1))
+            if not unit.fast_forward:
+                self.losses = (np.append(self.losses[0], row_failure[loss]),
+                               np.append(self.losses[1], recovery[loss]))
+
+            for t in (1, 2, 3):
+                for d_type, mask in ((Duration.DurationType.Loss, loss),
+                                     (Duration.DurationType.Unavailable, ~loss)):
+                    mask = mask & (failure_type == t)
+                    tier.add(d_type, row_failure[mask], recovery[mask], owner[rows[mask]],
+                             t, unit.fast_forward)
+
+            done = recovery >= ends[rows] - 1E-5
+            recovery = recovery[~done]
+            rows = self._finish(tier, rows, done, ends, owner, window_end)
+            failure[rows] = unit.failure_generator.generateNextEvents(recovery, recovery)
+            unit.failure_generator.censor(ends[rows])
+            tier.up.add(owner[rows], recovery, np.minimum(failure[rows], ends[rows]))
+
+    # As TimelineBuilder._disks.
+    def _disks(self, tier, pieces, window_end):
+        owner, starts, ends, cont = pieces
+        unit = tier.prototype
+        failure, new = self._firstEvents(tier, unit.failure_generator, owner, starts, ends,
+                                           cont)
+        rows = np.arange(len(owner))
+
+        while rows.size:
+            rows = self._hold(tier, rows, failure, ends, owner, window_end)
+            recovery = unit.recovery_generator.generateNextEvents(failure[rows], failure[rows]) + \
+                unit.disk_repair_time
+            if np.any(recovery <= failure[rows]):
+                raise Exception("Recovery time is not after failure time")
+            tier.add(Duration.DurationType.Loss, failure[rows], recovery, owner[rows])
+
+            done = recovery > ends[rows]
+            recovery = recovery[~done]
+            rows = self._finish(tier, rows, done, ends, owner, window_end)
+            failure[rows] = unit.failure_generator.generateNextEvents(recovery, recovery)
+            unit.failure_generator.censor(ends[rows])
+
+    # As TimelineBuilder._scrubbingDisks. A disk goes through its intervals
+    # of the window in order, its age, last recovery and pending failure
+    # are kept from one window to the next. The latent error windows are
+    # added to tier.latent when the failure that ends them is drawn.
+    def _scrubbingDisks(self, tier, pieces, window_end):
+        owner, starts, ends, cont = pieces
+        unit = tier.prototype
+        counts = np.bincount(owner, minlength=tier.size)
+        position = np.cumsum(counts) - counts
+        last_interval = np.cumsum(counts)
+        failure = tier.pending.copy()
+
+        def draw(disks):
+            interval = position[disks]
+            failure[disks] = unit.failure_generator.generateNextEvents(
+                np.maximum(tier.last_recovery[disks], starts[interval]))
+            unit.failure_generator.censor(ends[interval])
+            tier.latent.add(disks, tier.current[disks],
+                            np.minimum(failure[disks], ends[interval]),
+                            tier.latent_start[disks])
+
+        disks = np.flatnonzero(counts)
+        fresh = disks[~cont[position[disks]]]
+        tier.current[fresh] = starts[position[fresh]]
+        draw(fresh)
+
+        while disks.size:
+            interval = position[disks]
+            interval_end = ends[interval]
+            disk_failure = failure[disks]
+            wait = np.minimum(disk_failure, interval_end) > window_end
+            tier.pending[disks[wait]] = disk_failure[wait]
+            disks, interval, interval_end = disks[~wait], interval[~wait], interval_end[~wait]
+            disk_failure = disk_failure[~wait]
+
+            # no failure before the machine goes down, move to its next up-interval
+            over = disk_failure > interval_end
+            done = disks[over]
+            position[done] += 1
+            done = done[position[done] < last_interval[done]]
+            tier.current[done] = starts[position[done]]
+            draw(done)
+
+            failed = disks[~over]
+            disk_failure = disk_failure[~over]
+            recovery = unit.recovery_generator.generateNextEvents(disk_failure, disk_failure) + \
+                unit.disk_repair_time
+            recovery = np.minimum(recovery, interval_end[~over])
+            tier.add(Duration.DurationType.Loss, disk_failure, recovery, failed)
+
+            tier.last_recovery[failed] = recovery
+            tier.latent_start[failed] = recovery
+            tier.current[failed] = recovery
+            draw(failed)
+            disks = np.concatenate((done, failed))
+
+    # As TimelineBuilder._latentErrors, on the latent error windows of the
+    # disks.
+    def _latentErrors(self, tier, pieces, window_end):
+        owner, starts, ends, cont, latent_starts = pieces
+        unit = tier.prototype
+        latent_error, new = self._firstEvents(tier, unit.latent_error_generator, owner,
+                                              starts, ends, cont, latent_starts)
+        rows = np.arange(len(owner))
+
+        while rows.size:
+            rows = self._hold(tier, rows, latent_error, ends, owner, window_end)
+            scrub_recovery = unit.scrub_generator.generateNextEvents(latent_error[rows])
+            tier.add(Duration.DurationType.Loss, latent_error[rows], scrub_recovery,
+                     owner[rows], 0)
+
+            done = scrub_recovery > ends[rows]
+            scrub_recovery = scrub_recovery[~done]
+            rows = self._finish(tier, rows, done, ends, owner, window_end)
+            latent_error[rows] = unit.latent_error_generator.generateNextEvents(
+                scrub_recovery, latent_starts[rows])
+
+
+# Intervals (owner, start, end, ...) of a tier, handed out window by window.
+# An interval is given to every window it overlaps, flagged as continued in
+# all but the first.
+class _OpenIntervals(object):
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, *columns):
+        self.parts.append(columns)
+
+    # (owner, start, end, continued, ...) of the intervals starting before
+    # window_end, those ending after it are kept for the next window.
+    def window(self, window_start, window_end):
+        if not self.parts:
+            return np.empty(0, np.int64), np.empty(0), np.empty(0), np.empty(0, np.bool_)
+        columns = [np.concatenate(column) for column in zip(*self.parts)]
+        starts, ends = columns[1], columns[2]
+        now = starts < window_end
+        later = ~now | (ends > window_end)
+        self.parts = [tuple([column[later] for column in columns])]
+        columns = [column[now] for column in columns]
+        return tuple(columns[:3] + [columns[1] < window_start] + columns[3:])
+
+
+# Streaming state of one tier: the event every unit left pending, the
+# up-intervals handed to the tier below and the durations of the current
+# window.
+class _Tier(object):
+
+    def __init__(self, topology, tier, level):
+        self.topology = topology
+        self.prototype = tier.prototype
+        self.size = tier.size
+        self.level = level
+        self.unit_ids = (topology.first_id + tier.indexes()).astype(np.int32)
+        self.pending = np.repeat(np.inf, tier.size)
+        self.up = _OpenIntervals()
+        self.latent = _OpenIntervals()
+        self.store = None
+        # one Sector per disk for all windows, as in a single DurationStore
+        self.sectors = {}
+
+    def newWindow(self):
+        self.store = DurationStore()
+        self.store.registerTopology(self.topology)
+        self.store.sectors = self.sectors
+
+    def add(self, d_type, starts, ends, indexes, info=-100, ignore=False):
+        if len(indexes) == 0:
+            return
+        self.store.addDurations(d_type, starts, ends, self.unit_ids[indexes],
+                                self.level, info, ignore)
+
+
+# Stream the timeline of one configuration with window 'window' and build
+# it with TimelineBuilder, and compare the number of durations and their
+# mean length per type, unit level and info. The stream must come in start
+# order.
+def compare(conf_path, window, seed=1):
+    from random import seed as py_seed
+
+    from simulator.Simulation import Simulation
+    from simulator.TimelineBuilder import TimelineBuilder
+
+    sim = Simulation(conf_path)
+    topology = sim.getDistributer().getTopology()
+    summaries = []
+    for streaming in (False, True):
+        sim.reset()
+        py_seed(seed)
+        np.random.seed(seed)
+        t = time()
+        if streaming:
+            stream = TimelineStream(topology, sim.conf.total_time, window)
+            durations = []
+            last_start = 0.0
+            for start, end, is_loss, unit in stream.records():
+                if start < last_start:
+                    raise Exception("Stream out of order at " + str(start))
+                last_start = start
+                durations.append((start, end, unit, is_loss))
+        else:
+            store = DurationStore()
+            TimelineBuilder(topology, sim.conf.total_time).build(store)
+            store.sort()
+            durations = [(float(store.column("start")[i]), float(store.column("end")[i]),
+                          store.getUnit(i), store.column("type")[i] ==
+                          Duration.DurationType.Loss.value) for i in xrange(store.size())]
+        elapsed = time() - t
+
+        summary = {}
+        for start, end, unit, is_loss in durations:
+            key = (is_loss, unit.__class__.__name__)
+            count, length = summary.get(key, (0, 0.0))
+            summary[key] = (count + 1, length + end - start)
+        summaries.append((elapsed, summary))
+    return summaries
+
+
+if __name__ == "__main__":
+    import sys
+
+    window = 8760
+    if len(sys.argv) > 2:
+        window = float(sys.argv[2])
+    (batch_time, batch_summary), (stream_time, stream_summary) = compare(sys.argv[1], window)
+    print "TimelineBuilder: %.2fs, TimelineStream: %.2fs" % (batch_time, stream_time)
+    for key in sorted(set(batch_summary.keys() + stream_summary.keys())):
+        print "loss" if key[0] else "unavailable", key[1],
+        for summary in (batch_summary, stream_summary):
+            count, length = summary.get(key, (0, 0.0))
+            print "%8d %10.3f" % (count, length/max(count, 1)),
+        print
@@ -0,0 +1,267 @@
+import numpy as np
+
+from simulator.unit.Machine import Machine
+from simulator.unit.UnitView import viewClass
+from simulator.failure.GeneratorView import newStates
+
+
+class Topology(object):
+    """
+    Units of the system as arrays, one Tier per component of the XML layer
+    file (layer, datacenter, rack, machine, disk).
+
+    Units are numbered tier by tier and, inside a tier, parent by parent, so
+    the children of a unit are one contiguous range of the next tier and the
+    disks of a rack or machine are consecutive. Unit i has id first_id + i.
+    Parameters and generators are kept once per tier in a prototype unit,
+    unit objects are views created on first use, see getUnit().
+    """
+
+    class Tier(object):
+
+        def __init__(self, name, count, prototype, first, parent):
+            self.name = name
+            # children per parent unit
+            self.count = count
+            # unit that holds the parameters and generators of the tier
+            self.prototype = prototype
+            self.unit_class = prototype.__class__
+            # index of the first unit of this tier in the topology
+            self.first = first
+            self.size = len(parent)
+            # topology index of the parent of every unit, -1 for the root tier
+            self.parent = parent
+            self.leaf = True
+
+        def indexes(self):
+            return np.arange(self.first, self.first + self.size)
+
+    def __init__(self):
+        self.tiers = []
+        self.size = 0
+        self.first_id = 0
+        self.first_machine_id = 0
+        self.start_times = np.zeros(0)
+        # topology index -> view
+        self.views = {}
+        # (tier name, generator attribute) -> per-unit generator states
+        self.generator_states = {}
+        self.clearSlices()
+
+    def addTier(self, name, count, prototype):
+        if self.tiers:
+            last = self.tiers[-1]
+            last.leaf = False
+            parent = np.repeat(last.indexes(), count).astype(np.int32)
+        else:
+            parent = np.repeat(np.int32(-1), count)
+        tier = Topology.Tier(name, count, prototype, self.size, parent)
+        self.tiers.append(tier)
+        self.size += tier.size
+        self.start_times = np.zeros(self.size)
+        self.chunk_counts = np.zeros(self.size, np.int64)
+        return tier
+
+    # Take ids for all units from the context counters, after the tiers are
+    # added.
+    def assignIDs(self, context):
+        self.first_id = context.reserveUnitIDs(self.size)
+        machines = 0
+        for tier in self.tiers:
+            if issubclass(tier.unit_class, Machine):
+                machines += tier.size
+        self.first_machine_id = context.reserveMachineIDs(machines)
+
+    def tierOf(self, index):
+        for tier in self.tiers:
+            if index < tier.first + tier.size:
+                return tier
+        raise Exception("Invalid unit index")
+
+    def getTier(self, unit_class):
+        for tier in self.tiers:
+            if issubclass(tier.unit_class, unit_class):
+                return tier
+        return None
+
+    def getLeafTier(self):
+        return self.tiers[-1]
+
+    def childIndexes(self, index):
+        tier = self.tierOf(index)
+        count = self.tiers[self.tiers.index(tier) + 1].count
+        first = tier.first + tier.size + (index - tier.first) * count
+        return xrange(first, first + count)
+
+    def index(self, unit_id):
+        index = unit_id - self.first_id
+        if 0 <= index < self.size:
+            return index
+        return None
+
+    def getUnit(self, unit_id):
+        index = unit_id - self.first_id
+        view = self.views.get(index)
+        if view is None:
+            if not 0 <= index < self.size:
+                raise Exception("Invalid unit id")
+            tier = self.tierOf(index)
+            view_class = viewClass(tier.unit_class)
+            view = view_class.__new__(view_class)
+            view.topology = self
+            view.tier = tier
+            view.index = index
+            self.views[index] = view
+        return view
+
+    # States of the generator 'name' of the prototype of 'tier', one per
+    # unit of the tier, see GeneratorView. None for stateless generators.
+    def generatorStates(self, tier, name):
+        key = (tier.name, name)
+        if key not in self.generator_states:
+            self.generator_states[key] = newStates(getattr(tier.prototype, name), tier.size)
+        return self.generator_states[key]
+
+    def getUnits(self, tier):
+        return [self.getUnit(self.first_id + i) for i in tier.indexes()]
+
+    def getRoot(self):
+        return self.getUnit(self.first_id)
+
+    # Leaf units below every unit, as [first, last + 1) ranges of leaf tier
+    # positions, indexed by topology index. Leaf units have a range of one.
+    def leafRanges(self):
+        lo = np.zeros(self.size, np.int64)
+        hi = np.zeros(self.size, np.int64)
+        leaf = self.getLeafTier()
+        positions = np.arange(leaf.size)
+        lo[leaf.first:] = positions
+        hi[leaf.first:] = positions + 1
+        for i in xrange(len(self.tiers) - 2, -1, -1):
+            tier = self.tiers[i]
+            child = self.tiers[i + 1]
+            first_child = child.first + np.arange(tier.size) * child.count
+            lo[tier.first:tier.first + tier.size] = lo[first_child]
+            hi[tier.first:tier.first + tier.size] = hi[first_child + child.count - 1]
+        return lo, hi
+
+    # Chunks are kept in 'placement', the (slices, n) matrix of disk ids of
+    # DataDistribute, which reports every chunk it writes there through
+    # addChunk() or addChunks(). They are grouped by disk on the first read
+    # after a change, see chunkIndex().
+    def setPlacement(self, placement):
+        self.placement = placement
+        self.chunk_indptr = None
+
+    def addChunk(self, unit_id):
+        self.chunk_counts[unit_id - self.first_id] += 1
+        self.chunk_indptr = None
+
+    def addChunks(self, unit_ids):
+        indexes = np.asarray(unit_ids, np.int64) - self.first_id
+        self.chunk_counts += np.bincount(indexes, minlength=self.size)
+        self.chunk_indptr = None
+
+    # CSR view of all chunks: the chunks of leaf unit 'first + row' of the
+    # leaf tier are chunks[indptr[row]:indptr[row+1]], ordered by slice.
+    # Chunk c is chunk c % n of slice c / n.
+    def chunkIndex(self):
+        if self.chunk_indptr is None:
+            leaf = self.getLeafTier()
+            chunks = np.empty(0, np.int64)
+            if self.placement is not None:
+                flat = self.placement.ravel()
+                chunks = np.flatnonzero(flat >= 0)
+                # one sort of (disk, chunk) keys groups the chunks by disk
+                keys = (flat[chunks] - np.int64(self.first_id + leaf.first)) * flat.size + chunks
+                keys.sort()
+                chunks = keys % flat.size
+            self.chunk_indptr = np.zeros(leaf.size + 1, np.int64)
+            np.cumsum(self.chunk_counts[leaf.first:leaf.first + leaf.size],
+                      out=self.chunk_indptr[1:])
+            if self.chunk_indptr[-1] != len(chunks):
+                raise Exception("Chunk counts do not match the placement")
+            if len(chunks) < 2**31:
+                chunks = chunks.astype(np.int32)
+            self.chunks = chunks
+        return self.chunk_indptr, self.chunks
+
+    # Chunk width of the placement, n.
+    def chunkWidth(self):
+        return self.placement.shape[1]
+
+    def _chunksOf(self, unit_id):
+        indptr, chunks = self.chunkIndex()
+        row = unit_id - self.first_id - self.getLeafTier().first
+        if not 0 <= row < len(indptr) - 1:
+            return chunks[:0]
+        return chunks[indptr[row]:indptr[row + 1]]
+
+    def chunkCount(self, unit_id):
+        return int(self.chunk_counts[unit_id - self.first_id])
+
+    # Slice indexes of the chunks on a leaf unit.
+    def getSlices(self, unit_id):
+        chunks = self._chunksOf(unit_id)
+        if len(chunks) == 0:
+            return []
+        return (chunks / self.chunkWidth()).tolist()
+
+    # (slice index, chunk position) of every chunk on a leaf unit.
+    def getChunks(self, unit_id):
+        chunks = self._chunksOf(unit_id)
+        if len(chunks) == 0:
+            return []
+        n = self.chunkWidth()
+        return zip((chunks / n).tolist(), (chunks % n).tolist())
+
+    # Take all chunks off a leaf unit, their places in the placement become
+    # empty (-1).
+    def removeChunks(self, unit_id):
+        if self.placement is not None:
+            self.placement[self.placement == unit_id] = -1
+        self.chunk_counts[unit_id - self.first_id] = 0
+        self.chunk_indptr = None
+
+    # Take chunk counts and a chunk index saved from an earlier chunkIndex()
+    # of the same placement.
+    def loadChunkIndex(self, placement, chunk_counts, chunk_indptr, chunks):
+        self.placement = placement
+        self.chunk_counts = chunk_counts
+        self.chunk_indptr = chunk_indptr
+        self.chunks = chunks
+
+    def clearSlices(self):
+        self.chunk_counts = np.zeros(self.size, np.int64)
+        self.placement = None
+        self.chunk_indptr = None
+        self.chunks = None
+
+    def nbytes(self):
+        total = self.start_times.nbytes + self.chunk_counts.nbytes
+        for tier in self.tiers:
+            total += tier.parent.nbytes
+        if self.chunk_indptr is not None:
+            total += self.chunk_indptr.nbytes + self.chunks.nbytes
+        for states in self.generator_states.values():
+            if states is not None:
+                total += len(states)*states.itemsize
+        return total
+
+
+if __name__ == "__main__":
+    import sys
+    from time import time
+
+    from simulator.Configuration import Configuration
+    from simulator.XMLParser import XMLParser
+
+    xml = XMLParser(Configuration(sys.argv[1]))
+    t = time()
+    topology = xml.readTopology()
+    print "topology of %d units built in %.2fs, %d bytes of arrays" % \
+        (topology.size, time() - t, topology.nbytes())
+    for tier in topology.tiers:
+        print tier.name, tier.unit_class.__name__, tier.size
+    disk = topology.getUnit(topology.first_id + topology.size - 1)
+    print disk.toString(), disk.getID(), disk.getParent().my_id, disk.failure_generator.lamda
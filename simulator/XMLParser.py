@@ -20,8 +20,11 @@ from simulator.failure.Real import Real
 from simulator.failure.Period import Period
 from simulator.failure.GFSAvailability import GFSAvailability
 from simulator.failure.GFSAvailability2 import GFSAvailability2
+from simulator.failure.GeneratorView import newStates, share
 
-from simulator.Configuration import Configuration, CONF_PATH
+from simulator.Configuration import Configuration, CONF_PATH, setConfiguration
+from simulator.Context import getContext
+from simulator.Topology import Topology
 
 
 class XMLParser(object):
@@ -31,7 +34,8 @@ class XMLParser(object):
         # layer_path = CONF_PATH + os.sep + "layer.xml"
         self.tree = ET.parse(layer_path)
         self.root = self.tree.getroot()
-        self.conf = conf
+        # the units built from the layer file look it up
+        self.conf = setConfiguration(conf)
 
     def _component_class(self, class_name):
         name = class_name.split(".")[-1]
@@ -83,13 +87,30 @@ class XMLParser(object):
     def readFile(self):
         return self.readComponent(self.root, None)
 
-    def readComponent(self, node, parent):
-        # self.i += 1
-        # print "*"*50
-        # print "this is the %d times of executing readComponent" % self.i
+    # Read the topology as arrays, see Topology. Every component becomes a
+    # tier whose parameters and generators are held by one prototype unit.
+    def readTopology(self):
+        topology = Topology()
+        context = getContext()
+        counters = (context.unit_count, context.machine_count)
+        component = self.root
+        while component is not None:
+            name, class_name, count, attributes = self.readComponentHeader(component)
+            unit_class = self._component_class(class_name)
+            prototype = unit_class(name, None, attributes)
+            if name.lower() != "layer":
+                for event in component.iterfind("eventGenerator"):
+                    prototype.addEventGenerator(self.readEventGenerator(event))
+            topology.addTier(name, count, prototype)
+            component = component.find("component")
+        # prototypes are not units of the system, give their ids back
+        context.unit_count, context.machine_count = counters
+        topology.assignIDs(context)
+        return topology
+
+    def readComponentHeader(self, node):
         name = None
         class_name = None
-        next_component = None
         count = 1
         attributes = {}
         component = node
@@ -99,7 +120,7 @@ class XMLParser(object):
                 if child.tag == "name":
                     name = child.text
                 elif child.tag == "count":
-                    count = child.text
+                    count = int(child.text)
                 elif child.tag == "class":
                     class_name = child.text
                 elif child.tag == "component":
@@ -125,20 +146,26 @@ class XMLParser(object):
         else:
             pass
 
+        return name, class_name, count, attributes
+
+    def readComponent(self, node, parent):
+        next_component = None
+        component = node
+        name, class_name, count, attributes = self.readComponentHeader(component)
+
         units = []
+        unit_class = self._component_class(class_name)
+        # generators are read once and shared by the units, see GeneratorView;
+        # layer is logic, has not failure and recovery events
+        generators = []
+        if name.lower() != "layer":
+            generators = [self.readEventGenerator(event)
+                          for event in component.iterfind("eventGenerator")]
+        states = [newStates(generator, count) for generator in generators]
         for i in xrange(count):
-            # print "class_name:" + class_name
-            unit_class = self._component_class(class_name)
             units.append(unit_class(name+str(i), parent, attributes))
-            # layer is logic, has not failure and recovery events
-            if name.lower() != "layer":
-                e_generators = component.iterfind("eventGenerator")
-                # if name.lower() == "disk":
-                #     print "e generators:", e_generators
-                if e_generators is not None:
-                    for event in e_generators:
-                        units[i].addEventGenerator(
-                            self.readEventGenerator(event))
+            for generator, generator_states in zip(generators, states):
+                units[i].addEventGenerator(share(generator, generator_states, i))
 
         if component is not None:
             next_component = component.find("component")
@@ -0,0 +1,176 @@
+import os
+import json
+import shutil
+import cPickle
+from hashlib import sha1
+from random import getstate, setstate
+from tempfile import mkdtemp
+from time import time
+
+import numpy as np
+
+from simulator.Log import info_logger
+
+
+def currentUmask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+class PlacementCache(object):
+    """
+    Placements saved on disk, one directory per placement named by a hash
+    of everything the placement depends on: distribution class, layout,
+    coding scheme, capacity, the XML layer file and the seed.
+
+    Every array is a plain .npy file, so later runs and worker processes
+    map them copy-on-write instead of placing the slices again. The random
+    states after placement are saved too, so a run that loads a placement
+    continues with the same random numbers as one that computed it.
+    """
+    # bump when the saved arrays change meaning
+    VERSION = 1
+    ARRAYS = ["slice_locations", "chunk_counts", "chunk_indptr", "chunks"]
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, distributer, iteration_seed):
+        conf = distributer.returnConf()
+        with open(conf.xml_file_path) as fp:
+            layer = sha1(fp.read()).hexdigest()
+        params = [PlacementCache.VERSION, distributer.__class__.__name__,
+                  conf.rack_count, conf.machines_per_rack, conf.disks_per_machine,
+                  conf.total_active_storage, conf.chunk_size, conf.data_redundancy,
+                  conf.hier, conf.r, conf.max_chunks_per_disk, conf.total_slices,
+                  distributer.getTopology().first_id, layer, iteration_seed]
+        return sha1(repr(params)).hexdigest()[:20]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def save(self, key, distributer, description=None):
+        topology = distributer.getTopology()
+        chunk_indptr, chunks = topology.chunkIndex()
+        arrays = {"slice_locations": distributer.returnSliceLocations(),
+                  "chunk_counts": topology.chunk_counts,
+                  "chunk_indptr": chunk_indptr,
+                  "chunks": chunks}
+        meta = {"created": time(), "total_slices": distributer.total_slices,
+                "description": description}
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # write aside and rename, so concurrent runs never see half an entry
+        tmp_path = mkdtemp(dir=self.directory, prefix=".tmp-")
+        saved = False
+        try:
+            for name in PlacementCache.ARRAYS:
+                np.save(os.path.join(tmp_path, name + ".npy"), arrays[name])
+            with open(os.path.join(tmp_path, "random_state.pickle"), "wb") as fp:
+                cPickle.dump((getstate(), np.random.get_state()), fp, 2)
+            with open(os.path.join(tmp_path, "meta.json"), "w") as fp:
+                json.dump(meta, fp)
+            # mkdtemp() makes the directory private, entries of a shared
+            # cache must be readable by the other users
+            os.chmod(tmp_path, 0755 & ~currentUmask())
+            try:
+                os.rename(tmp_path, self._path(key))
+                saved = True
+            except OSError, e:
+                # most likely another process saved the same placement first
+                info_logger.info("placement not saved to cache " + key + ": " + str(e))
+        finally:
+            if not saved:
+                shutil.rmtree(tmp_path, True)
+        if saved:
+            info_logger.info("placement saved to cache " + key)
+
+    # Map the placement 'key' into 'distributer' and restore the random
+    # states. Returns False when the cache has no such placement.
+    def load(self, key, distributer):
+        path = self._path(key)
+        if not os.path.isfile(os.path.join(path, "meta.json")):
+            return False
+        arrays = {}
+        for name in PlacementCache.ARRAYS:
+            arrays[name] = np.load(os.path.join(path, name + ".npy"), mmap_mode="c")
+        distributer.loadPlacement(arrays["slice_locations"], arrays["chunk_counts"],
+                                  arrays["chunk_indptr"], arrays["chunks"])
+        with open(os.path.join(path, "random_state.pickle"), "rb") as fp:
+            python_state, numpy_state = cPickle.load(fp)
+        setstate(python_state)
+        np.random.set_state(numpy_state)
+        # the modification time of meta.json is the last use
+        os.utime(os.path.join(path, "meta.json"), None)
+        info_logger.info("placement loaded from cache " + key)
+        return True
+
+    # [(key, meta, bytes on disk, last use)], most recently used first.
+    def entries(self):
+        ret = []
+        if not os.path.isdir(self.directory):
+            return ret
+        for key in os.listdir(self.directory):
+            meta_path = os.path.join(self._path(key), "meta.json")
+            if key.startswith(".") or not os.path.isfile(meta_path):
+                continue
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+            size = sum([os.path.getsize(os.path.join(self._path(key), name))
+                        for name in os.listdir(self._path(key))])
+            ret.append((key, meta, size, os.path.getmtime(meta_path)))
+        ret.sort(key=lambda entry: entry[3], reverse=True)
+        return ret
+
+    def evict(self, key):
+        path = self._path(key)
+        if not os.path.isdir(path):
+            raise Exception("No cached placement " + key)
+        shutil.rmtree(path)
+
+    # Evict all but the 'keep' most recently used entries and those not
+    # used for 'max_age' seconds. Returns the evicted keys.
+    def prune(self, keep=None, max_age=None):
+        evicted = []
+        now = time()
+        for i, (key, meta, size, last_use) in enumerate(self.entries()):
+            if (keep is not None and i >= keep) or \
+                    (max_age is not None and now - last_use > max_age):
+                self.evict(key)
+                evicted.append(key)
+        return evicted
+
+
+if __name__ == "__main__":
+    import argparse
+    from time import ctime
+
+    from simulator.Configuration import CACHE_PATH
+
+    parser = argparse.ArgumentParser(description="List or evict cached placements.")
+    parser.add_argument("--dir", default=CACHE_PATH + "placement/")
+    parser.add_argument("action", choices=["list", "evict", "prune"])
+    parser.add_argument("keys", nargs="*", help="entries to evict")
+    parser.add_argument("--keep", type=int, default=None,
+                        help="prune: most recently used entries to keep")
+    parser.add_argument("--days", type=float, default=None,
+                        help="prune: evict entries unused for this many days")
+    args = parser.parse_args()
+
+    cache = PlacementCache(args.dir)
+    if args.action == "list":
+        for key, meta, size, last_use in cache.entries():
+            print "%s %10d slices %8.1f MB  last used %s  %s" % \
+                (key, meta["total_slices"], size/2.0**20, ctime(last_use),
+                 meta["description"] or "")
+    elif args.action == "evict":
+        for key in args.keys:
+            cache.evict(key)
+    else:
+        max_age = None
+        if args.days is not None:
+            max_age = args.days * 86400
+        for key in cache.prune(args.keep, max_age):
+            print "evicted", key
@@ -1,72 +1,138 @@
 from math import floor
-from random import randint, sample, choice
+from random import sample, choice
+
+import numpy as np
 
 from simulator.Configuration import Configuration
 from simulator.XMLParser import XMLParser
 from simulator.dataDistribute.base import DataDistribute
 from simulator.Log import error_logger
+from simulator.unit.Rack import Rack
 
 
 class SSSDistribute(DataDistribute):
     """
     SSS: Spread placement Strategy System.
     All stripes of one file randomly spread, so the file spreads more than n disks.
+
+    The n chunks of a slice go to n distinct racks, drawn one after another
+    from the racks with room left, and inside each rack to a random disk
+    that is not full (max_chunks_per_disk). Slices are drawn in blocks with
+    NumPy. A block is cut after the first slice that fills a disk and the
+    rest is drawn again without that disk, so the placement has the same
+    distribution as placing one slice after the other.
     """
+    # random numbers drawn for the racks of one block, at most
+    MAX_BLOCK_DRAWS = 1 << 22
 
     def distributeSlices(self, root, total_slices):
-        disks = []
-
-        self.getAllDisks(root, disks)
-        for i in xrange(total_slices):
-            self.slice_locations.append([])
-            tmp_racks = [item for item in disks]
-            for j in xrange(self.n):
-                self.distributeSliceToDisk(i, disks, tmp_racks)
-
-            self._my_assert(len(tmp_racks) == (self.conf.rack_count - self.n))
-            self._my_assert(len(self.slice_locations[i]) == self.n)
-
-        self._my_assert(len(self.slice_locations) == total_slices)
-
-    def distributeSliceToDisk(self, slice_index, disks, available_racks):
-        retry_count = 0
-        same_rack_count = 0
-        same_disk_count = 0
-        full_disk_count = 0
-        while True:
-            retry_count += 1
-            # choose disk from the right rack
-            if len(available_racks) == 0:
+        leaf = self.topology.getLeafTier()
+        cap = self.conf.max_chunks_per_disk
+        # chunks on every disk, by position in the leaf tier
+        counts = self.topology.chunk_counts[leaf.first:leaf.first + leaf.size].copy()
+        rack_of, free, free_counts = self._freeDisks(counts, cap)
+        racks = np.flatnonzero(free_counts)
+        max_block = max(1, SSSDistribute.MAX_BLOCK_DRAWS/max(len(racks), 1))
+        block = max_block
+
+        first = self.addSlices(total_slices)
+        done = 0
+        while done < total_slices:
+            if len(racks) < self.n:
                 raise Exception("No racks left")
-            prev_racks_index = randint(0, len(available_racks)-1)
-            rack_disks = available_racks[prev_racks_index]
-
-            disk_index_in_rack = randint(0, len(rack_disks)-1)
-            disk = rack_disks[disk_index_in_rack]
-            slice_count = len(disk.getChildren())
-            if slice_count >= self.conf.max_chunks_per_disk:
-                full_disk_count += 1
-                rack_disks.remove(disk)
-
-                if len(rack_disks) == 0:
-                    error_logger.error("One rack is completely full" + str(disk.getParent().getParent().getID()))
-                    available_racks.remove(rack_disks)
-                    disks.remove(rack_disks)
-                if retry_count > 100:
-                    error_logger.error("Unable to distribute slice " + str(slice_index) + "; picked full disk " +
-                                       str(full_disk_count) + " times, same rack " + str(same_rack_count) +
-                                       " times, and same disk " + str(same_disk_count) + " times")
-                    raise Exception("Disk distribution failed")
-                continue
-
-            available_racks.remove(rack_disks)
-
-            # LZR
-            self.slice_locations[slice_index].append(disk)
-
-            # add slice indexs to children list of disks
-            disk.addChild(slice_index)
-            break
+            size = min(block, total_slices - done)
+            chosen, fractions = self._sampleRacks(size, racks)
+            picks = (fractions * free_counts[chosen]).astype(np.int64)
+            disks = free[chosen, picks]
+
+            accepted = self._acceptedSlices(disks, counts, cap)
+            disks = disks[:accepted]
+            self.placeSlices(first + done, disks + (self.topology.first_id + leaf.first))
+            disks = disks.ravel()
+            done += accepted
+
+            filled = np.unique(disks[counts[disks] >= cap])
+            if len(filled):
+                for disk in filled:
+                    self._removeFullDisk(disk, rack_of[disk], free, free_counts)
+                racks = np.flatnonzero(free_counts)
+            if accepted < size:
+                block = max(2*accepted, 16)
+            else:
+                block = min(2*block, max_block)
+
+        self._my_assert(self.slice_locations[first:first + total_slices].min() >= 0)
+
+    # Rack of every disk, and the disks of every rack that are not full,
+    # free[r, :free_counts[r]] for rack r (racks and disks by tier position).
+    def _freeDisks(self, counts, cap):
+        rack_tier = self.topology.getTier(Rack)
+        lo, hi = self.topology.leafRanges()
+        starts = lo[rack_tier.first:rack_tier.first + rack_tier.size]
+        ends = hi[rack_tier.first:rack_tier.first + rack_tier.size]
+        rack_of = np.repeat(np.arange(rack_tier.size), ends - starts)
+
+        free = np.full((rack_tier.size, (ends - starts).max()), -1, np.int64)
+        free_counts = np.zeros(rack_tier.size, np.int64)
+        for r in xrange(rack_tier.size):
+            disks = np.arange(starts[r], ends[r])
+            disks = disks[counts[disks] < cap]
+            free[r, :len(disks)] = disks
+            free_counts[r] = len(disks)
+        return rack_of, free, free_counts
+
+    def _removeFullDisk(self, disk, rack, free, free_counts):
+        last = free_counts[rack] - 1
+        i = np.flatnonzero(free[rack, :last + 1] == disk)[0]
+        free[rack, i] = free[rack, last]
+        free[rack, last] = -1
+        free_counts[rack] = last
+        if last == 0:
+            rack_id = self.topology.first_id + self.topology.getTier(Rack).first + rack
+            error_logger.error("One rack is completely full" + str(rack_id))
+
+    # n distinct racks out of 'racks' for each of 'size' slices, in draw
+    # order, by a partial Fisher-Yates shuffle of every row. The fraction
+    # left over from scaling each draw to the racks still to choose from is
+    # uniform on [0, 1) as well, and picks the disk in the chosen rack.
+    def _sampleRacks(self, size, racks):
+        rack_count = len(racks)
+        perm = np.tile(np.arange(rack_count, dtype=np.int32), size)
+        # one row per chunk position, so every step works on contiguous rows
+        steps = np.arange(self.n)[:, np.newaxis]
+        scaled = np.random.random((self.n, size)) * (rack_count - steps)
+        columns = scaled.astype(np.int64)
+        fractions = scaled - columns
+        heads = np.arange(0, size * rack_count, rack_count)
+        columns += steps
+        columns += heads
+
+        chosen = np.empty((self.n, size), np.int32)
+        for i in xrange(self.n):
+            j = columns[i]
+            chosen[i] = perm[j]
+            perm[j] = perm[heads + i]
+        return racks[chosen.T], fractions.T
+
+    # Number of leading slices of a block (rows of disks) that can be
+    # placed: all of them, or up to the first slice that fills a disk.
+    # 'counts' is advanced by the chunks of the accepted slices.
+    def _acceptedSlices(self, disks, counts, cap):
+        flat = disks.ravel()
+        added = np.bincount(flat, minlength=len(counts))
+        if not np.any(counts[added > 0] + added[added > 0] >= cap):
+            counts += added
+            return len(disks)
+        # rank of every chunk among the chunks of the block on the same disk
+        order = np.argsort(flat, kind="mergesort")
+        ordered = flat[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        ranks = np.empty(len(flat), np.int64)
+        ranks[order] = np.arange(len(flat)) - np.repeat(starts, np.diff(np.r_[starts, len(flat)])) + 1
+        fills = np.flatnonzero(ranks >= cap - counts[flat])
+        accepted = fills[0]/self.n + 1
+        counts += np.bincount(flat[:accepted * self.n], minlength=len(counts))
+        return accepted
 
 
 class HierSSSDistribute(SSSDistribute):
@@ -86,19 +152,17 @@ class HierSSSDistribute(SSSDistribute):
 
     def distributeSlices(self, root, increase_slices):
         machines = self.getAllMachines()
-        self.total_slices += increase_slices
-        for slice_index in xrange(self.total_slices - increase_slices, self.total_slices):
-            self.slice_locations.append([])
+        first = self.addSlices(increase_slices)
+        for slice_index in xrange(first, self.total_slices):
             self.distributeSliceToDisk(slice_index, machines)
 
-            self._my_assert(len(self.slice_locations[slice_index]) == self.n)
-
-        self._my_assert(len(self.slice_locations) == self.total_slices)
+            self._my_assert(self.slice_locations[slice_index].min() >= 0)
 
     def distributeSliceToDisk(self, slice_index, machines):
         retry_count = 0
         full_machine_count = 0
-        locations = []
+        full_disk_count = 0
+        position = 0
 
         if len(machines) < self.r:
             raise Exception("No enough racks left")
@@ -123,9 +187,9 @@ class HierSSSDistribute(SSSDistribute):
             machines_for_slice = sample(rack, self.slices_chunks_on_racks[i])
             for machine in machines_for_slice:
                 disk = choice(machine.getChildren())
-                locations.append(disk)
-                disk.addChild(slice_index)
-                slice_count = len(disk.getChildren())
+                self.addChunk(slice_index, position, disk)
+                position += 1
+                slice_count = self.topology.chunkCount(disk.getID())
                 if slice_count >= self.conf.max_chunks_per_disk:
                     full_disk_count += 1
                     error_logger.info("One disk is completely full " + str(disk.toString()))
@@ -134,8 +198,6 @@ class HierSSSDistribute(SSSDistribute):
                 if len(rack) == 0:
                     error_logger.error("One rack is completely full" + str(machine.getParent().getID()))
                     machines.remove(rack)
-        # LZR
-        self.slice_locations[slice_index] = locations
 
 
 if __name__ == "__main__":
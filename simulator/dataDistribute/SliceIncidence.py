@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class SliceIncidence(object):
+    """
+    Disk -> slice incidence in CSR form, built once per placement.
+
+    Rows are the disks in topology order, so the disks of one rack or
+    machine are consecutive rows and the slices they hold are one
+    contiguous range of 'indices'.
+    """
+
+    def __init__(self, topology, total_slices):
+        self.total_slices = total_slices
+        self.topology = topology
+        # topology index -> [first row, last row + 1) of the disks below it
+        self.row_starts, self.row_ends = topology.leafRanges()
+
+        # the chunk index of the topology already is in CSR form
+        self.indptr, chunks = topology.chunkIndex()
+        if len(chunks):
+            self.indices = (chunks / topology.chunkWidth()).astype(np.int32)
+        else:
+            self.indices = np.empty(0, np.int32)
+
+    # Slices held by a rack, machine or disk, as a view into 'indices'.
+    def slicesOf(self, unit):
+        index = self.topology.index(unit.getID())
+        if index is None:
+            raise Exception("Invalid unit")
+        return self.indices[self.indptr[self.row_starts[index]]:self.indptr[self.row_ends[index]]]
+
+    # Count how often each slice appears in 'segments' and return the slices
+    # counted more than 'ft' times together with their counts.
+    def countFailures(self, segments, ft):
+        if len(segments) == 0:
+            return np.empty(0, np.int32), np.empty(0, np.int64)
+        touched = np.concatenate(segments)
+        # a dense bincount is cheaper once a good part of all slices is hit
+        if len(touched) * 8 >= self.total_slices:
+            counts = np.bincount(touched, minlength=self.total_slices)
+            slice_indexes = np.flatnonzero(counts > ft)
+            return slice_indexes, counts[slice_indexes]
+        slice_indexes, counts = np.unique(touched, return_counts=True)
+        over = counts > ft
+        return slice_indexes[over], counts[over]
@@ -1,9 +1,12 @@
 from time import strftime, time
 
+import numpy as np
+
 from simulator.Configuration import Configuration
 from simulator.Log import error_logger
 from simulator.XMLParser import XMLParser
 from simulator.unit.Rack import Rack
+from simulator.dataDistribute.SliceIncidence import SliceIncidence
 
 
 class DataDistribute(object):
@@ -15,10 +18,15 @@ class DataDistribute(object):
         self.k = self.conf.drs_handler.k
 
         # scaling up and heteogeneous layer need XMLParser module supports rebuild.
-        units = self.xml.readFile()
-        self.root = units[0]
+        self.topology = self.xml.readTopology()
+        self.root = self.topology.getRoot()
 
-        self.slice_locations = []
+        # disk id of every chunk, one row of n chunks per slice. Rows past
+        # total_slices are spare capacity, see addSlices().
+        self.slice_locations = np.empty((0, self.n), np.int32)
+        self.total_slices = 0
+        # disk -> slice incidence of the current placement, see getSliceIncidence()
+        self.incidence = None
 
         # groups of pss and copyset data placement
         self.groups = None
@@ -36,11 +44,14 @@ class DataDistribute(object):
         return (self.n, self.k)
 
     def returnSliceLocations(self):
-        return self.slice_locations
+        return self.slice_locations[:self.total_slices]
 
     def getRoot(self):
         return self.root
 
+    def getTopology(self):
+        return self.topology
+
     def getGroups(self):
         return self.groups
 
@@ -53,6 +64,64 @@ class DataDistribute(object):
     def distributeSlices(self, root, total_slices):
         pass
 
+    # Append 'count' empty slices (all chunks -1) and return the index of
+    # the first one.
+    def addSlices(self, count):
+        first = self.total_slices
+        self.total_slices += count
+        if self.total_slices > len(self.slice_locations):
+            capacity = max(self.total_slices, 2*len(self.slice_locations))
+            locations = np.full((capacity, self.n), -1, np.int32)
+            locations[:first] = self.slice_locations[:first]
+            self.slice_locations = locations
+        self.topology.setPlacement(self.slice_locations)
+        return first
+
+    # Place chunk 'position' of a slice on a disk.
+    def addChunk(self, slice_index, position, disk):
+        self.slice_locations[slice_index, position] = disk.getID()
+        self.topology.addChunk(disk.getID())
+
+    # Place consecutive slices at once, row i of disk_ids holds the disk ids
+    # of the chunks of slice first + i.
+    def placeSlices(self, first, disk_ids):
+        self.slice_locations[first:first + len(disk_ids)] = disk_ids
+        self.topology.addChunks(disk_ids.ravel())
+
+    # (slice index, chunk position) of every chunk on a disk.
+    def getChunks(self, disk):
+        return self.topology.getChunks(disk.getID())
+
+    def chunkPosition(self, slice_index, disk):
+        positions = np.flatnonzero(self.slice_locations[slice_index] == disk.getID())
+        if len(positions) == 0:
+            raise Exception("Slice " + str(slice_index) + " has no chunk on disk " +
+                            str(disk.getID()))
+        return int(positions[0])
+
+    # Take a placement saved earlier (see PlacementCache) instead of calling
+    # distributeSlices().
+    def loadPlacement(self, slice_locations, chunk_counts, chunk_indptr, chunks):
+        self.slice_locations = slice_locations
+        self.total_slices = len(slice_locations)
+        self.incidence = None
+        self.topology.loadChunkIndex(slice_locations, chunk_counts, chunk_indptr, chunks)
+
+    # Drop the current placement so the next distributeSlices() starts from
+    # empty disks.
+    def clearSlices(self):
+        self.slice_locations = np.empty((0, self.n), np.int32)
+        self.total_slices = 0
+        self.incidence = None
+        self.topology.clearSlices()
+
+    # Built lazily and rebuilt when slices were added since the last call.
+    def getSliceIncidence(self):
+        if self.incidence is None or \
+                self.incidence.total_slices != self.total_slices:
+            self.incidence = SliceIncidence(self.topology, self.total_slices)
+        return self.incidence
+
     def getAllRacks(self):
         r = self.root
         if not isinstance(r.getChildren()[0], Rack):
@@ -87,10 +156,10 @@ class DataDistribute(object):
         ts = strftime("%Y%m%d.%H.%M.%S")
         file_path += '-' + ts
         with open(file_path, 'w') as fp:
-            for i, item in enumerate(self.slice_locations):
+            for i, item in enumerate(self.returnSliceLocations()):
                 info = "slice " + str(i) + ": "
-                for d in item:
-                    info += d.toString() + ", "
+                for disk_id in item:
+                    info += self.topology.getUnit(disk_id).toString() + ", "
                 info += "\n"
                 fp.write(info)
 
@@ -1,3 +1,5 @@
+from itertools import combinations
+
 from simulator.drs.base import Base
 
 
@@ -12,6 +14,7 @@ class LRC(Base):
         self.ll = int(params[2])
         self.m0 = 1
         self.m1 = self.n - self.k - self.ll * self.m0
+        self._threshold = None
 
     def _check(self):
         if self.k < 0 or self.ll < 0 or self.m0 < 0 or self.m1 < 0:
@@ -51,12 +54,18 @@ class LRC(Base):
         """
         failure property when one stripe has n-k failures
         """
-        if self.n == 10 and self.k == 6:
-            return 0.143
-        elif self.n == 16 and self.k == 12:
-            return 0.138
-        else:
-            raise Exception("Not support")
+        if self._threshold is None:
+            lost = 0
+            total = 0
+            for failed in combinations(xrange(self.n), self.n - self.k):
+                state = [1] * self.n
+                for i in failed:
+                    state[i] = -1
+                total += 1
+                if not self.isRepairable(state):
+                    lost += 1
+            self._threshold = float(lost)/total
+        return self._threshold
 
     def repairTraffic(self, hier=False, d_racks=0):
         rt = float(self.m1*self.RC + (self.n-self.m1)*self.ORC)/self.n
@@ -177,3 +186,4 @@ if __name__ == "__main__":
     print lrc.repair(state, 4)
     print lrc.parallRepair(state, True)
     print lrc.repairTraffic(True, 3)
+    print lrc.threshold
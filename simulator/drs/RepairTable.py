@@ -0,0 +1,161 @@
+import os
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+
+# tables already loaded in this process, keyed by RepairTable.key()
+_tables = {}
+
+
+class RepairTable(object):
+    """
+    Repairability and repair costs of every state of one stripe, indexed by
+    the bitmask of its non-available blocks (bit i is set when block i is
+    not in state 1).
+
+        repairable[mask]      : state can be recovered
+        repair_costs[mask, i] : cost of repair(state, i), for i in mask
+        parallel_costs[mask]  : cost of parallRepair(state)
+        loss_probability[f]   : share of states with f failed blocks that
+                                can not be recovered
+
+    Entries are filled by calling the DRS handler once per state, so the
+    table follows the handler exactly, and only costs a lookup afterwards.
+    A repair cost below handler.RC is an optimal repair.
+    """
+    # 2^n states are enumerated, larger stripes are left to the handler
+    MAX_N = 16
+    # bump when the handlers change, so cached tables are rebuilt
+    VERSION = 1
+
+    def __init__(self, handler, arrays=None):
+        self.handler = handler
+        self.n = handler.n
+        if arrays is None:
+            arrays = self._build()
+        self.repairable = arrays["repairable"]
+        self.repair_costs = arrays["repair_costs"]
+        self.parallel_costs = arrays["parallel_costs"]
+        self.loss_probability = arrays["loss_probability"]
+        # the most failed blocks every stripe survives
+        self.ft = int(np.flatnonzero(self.loss_probability > 0)[0]) - 1
+
+    @staticmethod
+    def key(handler):
+        return "%s_%d_%d_%d_%d_v%d" % (handler.__class__.__name__, handler.n,
+                                       handler.k, getattr(handler, "ll", 0),
+                                       getattr(handler, "d", 0), RepairTable.VERSION)
+
+    def _build(self):
+        n = self.n
+        size = 1 << n
+        repairable = np.zeros(size, np.bool_)
+        repair_costs = np.zeros((size, n), np.float64)
+        parallel_costs = np.zeros(size, np.float64)
+        failures = np.zeros(size, np.int64)
+
+        for mask in xrange(size):
+            state = [1] * n
+            failed = [i for i in xrange(n) if mask >> i & 1]
+            for i in failed:
+                state[i] = -1
+            failures[mask] = len(failed)
+            if not self.handler.isRepairable(state):
+                continue
+            repairable[mask] = True
+            for i in failed:
+                repair_costs[mask, i] = self.handler.repair(list(state), i)
+            parallel_costs[mask] = self.handler.parallRepair(list(state))
+
+        totals = np.bincount(failures, minlength=n+1)
+        losses = np.bincount(failures[~repairable], minlength=n+1)
+        loss_probability = losses.astype(np.float64)/totals
+
+        return {"repairable": repairable, "repair_costs": repair_costs,
+                "parallel_costs": parallel_costs,
+                "loss_probability": loss_probability}
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # write aside and rename, so concurrent runs never read half a file
+        with NamedTemporaryFile(dir=directory, delete=False) as out:
+            np.savez(out, repairable=self.repairable, repair_costs=self.repair_costs,
+                     parallel_costs=self.parallel_costs,
+                     loss_probability=self.loss_probability)
+        os.rename(out.name, path)
+
+    @staticmethod
+    def load(handler, path):
+        with np.load(path) as f:
+            arrays = dict([(name, f[name]) for name in f.files])
+        return RepairTable(handler, arrays)
+
+    # Mask of the blocks of 'state' that are not in state 1.
+    @staticmethod
+    def maskOf(state):
+        mask = 0
+        for i, s in enumerate(state):
+            if s != 1:
+                mask |= 1 << i
+        return mask
+
+
+# Table of 'handler', built once per (scheme, n, k, l, d) and cached in
+# 'cache_dir'. Returns None for stripes wider than RepairTable.MAX_N.
+def getRepairTable(handler, cache_dir=None):
+    if handler.n > RepairTable.MAX_N:
+        return None
+    key = RepairTable.key(handler)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, key + ".npz")
+    if path is not None and os.path.isfile(path):
+        table = RepairTable.load(handler, path)
+    else:
+        table = RepairTable(handler)
+        if path is not None:
+            try:
+                table.save(path)
+            except (IOError, OSError):
+                pass
+    _tables[key] = table
+    return table
+
+
+# Compare every table entry with a direct call of the handler.
+def verify(handler):
+    table = RepairTable(handler)
+    mismatches = 0
+    for mask in xrange(1 << handler.n):
+        state = [1 if not mask >> i & 1 else -1 for i in xrange(handler.n)]
+        repairable = handler.isRepairable(state)
+        if repairable != table.repairable[mask]:
+            mismatches += 1
+        elif repairable:
+            for i in xrange(handler.n):
+                if state[i] != 1 and handler.repair(list(state), i) != table.repair_costs[mask, i]:
+                    mismatches += 1
+            if handler.parallRepair(list(state)) != table.parallel_costs[mask]:
+                mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    from time import time
+
+    from simulator.drs.Handler import getDRSHandler
+
+    for name, params in [("RS", [9, 6]), ("LRC", [10, 6, 2]), ("XORBAS", [10, 6, 2]),
+                         ("MSR", [9, 6, 7]), ("MBR", [9, 6, 7])]:
+        handler = getDRSHandler(name, params)
+        t = time()
+        table = RepairTable(handler)
+        print name, params, "built in %.2fs," % (time() - t), "ft:", table.ft, \
+            "mismatches:", verify(handler)
+        print "  loss probability:", np.round(table.loss_probability, 4).tolist()
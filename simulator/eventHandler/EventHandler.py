@@ -1,12 +1,15 @@
 from collections import OrderedDict
 from math import sqrt, ceil
-from random import randint, choice
+from random import randint, choice, random, randrange, seed
 from copy import deepcopy
 
+import numpy as np
+
 from simulator.Event import Event
-from simulator.Result import Result
+from simulator.Context import getContext
 from simulator.utils import FIFO
 from simulator.Log import info_logger, error_logger
+from simulator.Tracer import Tracer, getTracer
 from simulator.unit.Rack import Rack
 from simulator.unit.Machine import Machine
 from simulator.unit.Disk import Disk
@@ -19,18 +22,24 @@ class EventHandler(object):
     def __init__(self, distributer):
         self.distributer = distributer
         self.conf = self.distributer.returnConf()
-        self.drs_handler = self.conf.getDRSHandler()
-        self.n, self.k = self.distributer.returnCodingParameters()
+        self.tracer = getTracer()
         self.slice_locations = self.distributer.returnSliceLocations()
 
         self.num_chunks_diff_racks = self.conf.num_chunks_diff_racks
-        self.lost_slice = -100
 
         self.end_time = self.conf.total_time
         self.total_slices_table = self.conf.tableForTotalSlice()
         # the final total slices
         self.total_slices = self.total_slices_table[-1][2]
 
+        # Codes that are not MDS look up repairability and repair costs in
+        # the table of the handler, see initStatus().
+        drs_handler = self.conf.getDRSHandler()
+        repair_table = None
+        if not drs_handler.isMDS:
+            repair_table = self.conf.getRepairTable()
+        self.initStatus(drs_handler, self.total_slices, repair_table, self.conf.chunk_size)
+
         # A slice is recovered when recoveryThreshold number of chunks are
         # 'lost', where 'lost' can include durability events (disk failure,
         # latent failure), as well as availability events (temporary machine
@@ -70,10 +79,6 @@ class EventHandler(object):
         # True means there is scaling during mission time.
         self.scaling = self.conf.system_scaling
 
-        # for each block, 1 means Normal, 0 means Unavailable, -1 means Lost(caused by disk or node lost),
-        # -2 means Lost(caused by LSE)
-        self.status = [[1 for i in xrange(self.n)] for j in xrange(self.total_slices)]
-
         self.unavailable_slice_count = 0
 
         # [(slice_index, occur_time, caused by what kind of component failure), ...],
@@ -124,7 +129,6 @@ class EventHandler(object):
 
         self.total_repairs = 0
         self.total_repair_transfers = 0
-        self.total_optimal_repairs = 0
 
         # self.slices_degraded_list = []
         # self.slices_degraded_avail_list = []
@@ -132,22 +136,77 @@ class EventHandler(object):
         # degraded slice statistic dict
         # self.slices_degraded_durations = {}
 
+    # Block states of 'total_slices' stripes coded by 'drs_handler', all
+    # normal, with everything setChunk() to isLost() use. Kept apart from
+    # __init__ so verifyBookkeeping() can check it without a distributer.
+    def initStatus(self, drs_handler, total_slices, repair_table, chunk_size):
+        self.drs_handler = drs_handler
+        self.n, self.k = drs_handler.n, drs_handler.k
+        self.chunk_size = chunk_size
+        self.lost_slice = -100
+        self.total_optimal_repairs = 0
+
+        # for each block, 1 means Normal, 0 means Unavailable, -1 means Lost(caused by disk or node lost),
+        # -2 means Lost(caused by LSE). Change blocks through setChunk(), which
+        # keeps the per-slice counts below up to date.
+        self.status = np.ones((total_slices, self.n), np.int8)
+        self.available_counts = np.full(total_slices, self.n, np.int8)
+        self.durable_counts = np.full(total_slices, self.n, np.int8)
+        self.lse_counts = np.zeros(total_slices, np.int8)
+        # slices whose data is lost, they are not tracked any further
+        self.lost = np.zeros(total_slices, np.bool_)
+
+        # Codes with a repair table look up repairability and repair costs
+        # by the masks of the blocks not in state 1 and of the lost blocks,
+        # which setChunk() keeps up to date as well.
+        self.repair_table = repair_table
+        if self.repair_table is not None:
+            self.bits = np.left_shift(1, np.arange(self.n, dtype=np.int64))
+            self.unavailable_masks = np.zeros(total_slices, np.int64)
+            self.lost_masks = np.zeros(total_slices, np.int64)
+
     def _my_assert(self, expression):
         if not expression:
             raise Exception("My Assertion failed!")
         return True
 
+    def setChunk(self, slice_index, index, state):
+        old = self.status[slice_index, index]
+        if old == state:
+            return
+        self.status[slice_index, index] = state
+        self.available_counts[slice_index] += int(state == 1) - int(old == 1)
+        self.durable_counts[slice_index] += int(state >= 0) - int(old >= 0)
+        self.lse_counts[slice_index] += int(state == -2) - int(old == -2)
+        if self.repair_table is not None:
+            if (old == 1) != (state == 1):
+                self.unavailable_masks[slice_index] ^= 1 << index
+            if (old < 0) != (state < 0):
+                self.lost_masks[slice_index] ^= 1 << index
+
+    # Write back a stripe state changed by the DRS handler.
+    def setStripe(self, slice_index, state):
+        row = self.status[slice_index]
+        row[:] = state
+        self.available_counts[slice_index] = np.count_nonzero(row == 1)
+        self.durable_counts[slice_index] = np.count_nonzero(row >= 0)
+        self.lse_counts[slice_index] = np.count_nonzero(row == -2)
+        if self.repair_table is not None:
+            self.unavailable_masks[slice_index] = np.dot(row != 1, self.bits)
+            self.lost_masks[slice_index] = np.dot(row < 0, self.bits)
+
     def durableCount(self, slice_index):
-        if isinstance(self.status[slice_index], int):
-            return self.status[slice_index]
-        else:
-            return self.status[slice_index].count(1) + self.status[slice_index].count(0)
+        if self.lost[slice_index]:
+            return self.lost_slice
+        return int(self.durable_counts[slice_index])
 
     def availableCount(self, slice_index):
-        if isinstance(self.status[slice_index], int):
-            return self.status[slice_index]
-        else:
-            return self.status[slice_index].count(1)
+        if self.lost[slice_index]:
+            return self.lost_slice
+        return int(self.available_counts[slice_index])
+
+    def lseCount(self, slice_index):
+        return int(self.lse_counts[slice_index])
 
     def sliceRecovered(self, slice_index):
         if self.durableCount(slice_index) == self.n:
@@ -176,32 +235,57 @@ class EventHandler(object):
             self.current_avail_slice_degraded += 1
 
     def repair(self, slice_index, repaired_index):
-        rc = self.drs_handler.repair(self.status[slice_index], repaired_index)
+        if self.repair_table is None:
+            rc = self.drs_handler.repair(self.status[slice_index].tolist(), repaired_index)
+        else:
+            mask = int(self.unavailable_masks[slice_index])
+            if not self.repair_table.repairable[mask]:
+                raise Exception("state can not be repaired!")
+            if not mask >> repaired_index & 1:
+                raise Exception("index:" + str(repaired_index) + " of slice " +
+                                str(slice_index) + " is normal state")
+            rc = float(self.repair_table.repair_costs[mask, repaired_index])
+        self.setChunk(slice_index, repaired_index, 1)
         if rc < self.drs_handler.RC:
             self.total_optimal_repairs += 1
 
-        return rc * self.conf.chunk_size
+        return rc * self.chunk_size
 
     def parallelRepair(self, slice_index, only_lost=False):
-        rc = self.drs_handler.parallRepair(self.status[slice_index], only_lost)
-        return rc * self.conf.chunk_size
-
+        if self.repair_table is not None and not only_lost:
+            mask = int(self.unavailable_masks[slice_index])
+            if not self.repair_table.repairable[mask]:
+                raise Exception("state can not be repaired!")
+            self.setStripe(slice_index, 1)
+            return float(self.repair_table.parallel_costs[mask]) * self.chunk_size
+        state = self.status[slice_index].tolist()
+        rc = self.drs_handler.parallRepair(state, only_lost)
+        self.setStripe(slice_index, state)
+        return rc * self.chunk_size
+
+    # MDS codes only need the count of available blocks, other codes look
+    # at which blocks are available.
     def isRepairable(self, slice_index):
-        return self.drs_handler.isRepairable(self.status[slice_index])
+        if self.lost[slice_index]:
+            return False
+        if self.drs_handler.isMDS:
+            return self.available_counts[slice_index] >= self.k
+        if self.repair_table is not None:
+            return bool(self.repair_table.repairable[self.unavailable_masks[slice_index]])
+        return self.drs_handler.isRepairable(self.status[slice_index].tolist())
 
     # corresponding slice is lost or not.
     # True means lost, False means not lost
     def isLost(self, slice_index):
-        state = []
-
-        if isinstance(self.status[slice_index], int):
+        if self.lost[slice_index]:
             return True
-        for s in self.status[slice_index]:
-            if s == 1 or s == 0:
-                state.append(1)
-            else:
-                state.append(s)
-        return not self.drs_handler.isRepairable(state)
+        if self.drs_handler.isMDS:
+            return self.durable_counts[slice_index] < self.k
+        if self.repair_table is not None:
+            return not self.repair_table.repairable[self.lost_masks[slice_index]]
+        # unavailable blocks come back, only lost blocks count
+        state = np.where(self.status[slice_index] == 0, 1, self.status[slice_index])
+        return not self.drs_handler.isRepairable(state.tolist())
 
     def avgTotalSlices(self):
         if not self.scaling:
@@ -260,7 +344,6 @@ class EventHandler(object):
         TTFs.append(FTs[0])
         for i in xrange(len(FTs)-1):
             TTFs.append(FTs[i+1] - FTs[i])
-        unavailability = round(MTTR/(MTTR+MTTF), 5)
 
         return (TTFs, TTRs)
 
@@ -314,12 +397,10 @@ class EventHandler(object):
     def handleEvent(self, e, queue):
         if e.ignore:
             return
-        print "********event info********"
-        print "event ID: ", e.event_id
-        print "event type: ", e.getType()
-        print "event unit: ", e.getUnit().toString()
-        print "event Time: ", e.getTime()
-        print "event next reovery time: ", e.next_recovery_time
+        if self.tracer.event:
+            self.tracer.trace("event", Tracer.DEBUG, event_id=e.event_id, type=str(e.getType()),
+                              unit=e.getUnit().toString(), time=e.getTime(),
+                              next_recovery_time=e.next_recovery_time)
 
         if e.getType() == Event.EventType.Failure:
             self.handleFailure(e.getUnit(), e.getTime(), e, queue)
@@ -363,11 +444,10 @@ class EventHandler(object):
 
             disks = u.getChildren()
             for child in disks:
-                slice_indexes = child.getChildren()
-                for slice_index in slice_indexes:
+                for slice_index, index in self.distributer.getChunks(child):
                     if slice_index >= current_total_slices:
                         continue
-                    if self.status[slice_index] == self.lost_slice:
+                    if self.lost[slice_index]:
                         continue
 
                     if e.info == 3:
@@ -376,15 +456,14 @@ class EventHandler(object):
                         self.sliceDegradedAvailability(slice_index)
 
                     repairable_before = self.isRepairable(slice_index)
-                    index = self.slice_locations[slice_index].index(child)
-                    if self.status[slice_index][index] == -1:
+                    if self.status[slice_index, index] == -1:
                         continue
                     if e.info == 3:
-                        self.status[slice_index][index] = -1
+                        self.setChunk(slice_index, index, -1)
                         self._my_assert(self.durableCount(slice_index) >= 0)
                     else:
-                        if self.status[slice_index][index] == 1:
-                            self.status[slice_index][index] = 0
+                        if self.status[slice_index, index] == 1:
+                            self.setChunk(slice_index, index, 0)
                         self._my_assert(self.availableCount(slice_index) >= 0)
 
                     repairable_current = self.isRepairable(slice_index)
@@ -408,7 +487,7 @@ class EventHandler(object):
                                 "time: " + str(time) + " slice:" + str(slice_index) +
                                 " durCount:" + str(self.durableCount(slice_index)) +
                                 " due to machine " + str(u.getID()))
-                            self.status[slice_index] = self.lost_slice
+                            self.lost[slice_index] = True
                             self.undurable_slice_count += 1
                             self.undurable_slice_infos.append((slice_index, time, "machine "+ str(u.getID())))
                             continue
@@ -419,20 +498,18 @@ class EventHandler(object):
             # need to compute projected reovery b/w needed
             projected_bandwidth_need = 0.0
 
-            slice_indexes = u.getChildren()
-            for slice_index in slice_indexes:
+            for slice_index, index in self.distributer.getChunks(u):
                 if slice_index >= current_total_slices:
                     continue
-                if self.status[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     continue
 
                 self.sliceDegraded(slice_index)
                 repairable_before = self.isRepairable(slice_index)
 
-                index = self.slice_locations[slice_index].index(u)
-                if self.status[slice_index][index] == -1:
+                if self.status[slice_index, index] == -1:
                     continue
-                self.status[slice_index][index] = -1
+                self.setChunk(slice_index, index, -1)
 
                 self._my_assert(self.durableCount(slice_index) >= 0)
 
@@ -449,7 +526,7 @@ class EventHandler(object):
                         "time: " + str(time) + " slice:" + str(slice_index) +
                         " durCount:" + str(self.durableCount(slice_index)) +
                         " due to disk " + str(u.getID()))
-                    self.status[slice_index] = self.lost_slice
+                    self.lost[slice_index] = True
                     self.undurable_slice_count += 1
                     self.undurable_slice_infos.append((slice_index, time, "disk "+ str(u.getID())))
                     continue
@@ -471,11 +548,10 @@ class EventHandler(object):
             if e.info != 3 and e.info != 4:
                 disks = u.getChildren()
                 for child in disks:
-                    slice_indexes = child.getChildren()
-                    for slice_index in slice_indexes:
+                    for slice_index, index in self.distributer.getChunks(child):
                         if slice_index >= current_total_slices:
                             continue
-                        if self.status[slice_index] == self.lost_slice:
+                        if self.lost[slice_index]:
                             if slice_index in self.unavailable_slice_durations.keys() and \
                                 len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                                 self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -483,9 +559,8 @@ class EventHandler(object):
 
                         if self.availableCount(slice_index) < self.n:
                             repairable_before = self.isRepairable(slice_index)
-                            index = self.slice_locations[slice_index].index(child)
-                            if self.status[slice_index][index] == 0:
-                                self.status[slice_index][index] = 1
+                            if self.status[slice_index, index] == 0:
+                                self.setChunk(slice_index, index, 1)
                             self.sliceRecoveredAvailability(slice_index)
                             if not repairable_before and self.isRepairable(slice_index):
                                 self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -497,11 +572,10 @@ class EventHandler(object):
                 transfer_required = 0.0
                 disks = u.getChildren()
                 for disk in disks:
-                    indexes = disk.getChildren()
-                    for slice_index in indexes:
+                    for slice_index, index in self.distributer.getChunks(disk):
                         if slice_index >= current_total_slices:
                             continue
-                        if self.status[slice_index] == self.lost_slice:
+                        if self.lost[slice_index]:
                             if slice_index in self.unavailable_slice_durations.keys() and \
                                 len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                                 self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -524,8 +598,7 @@ class EventHandler(object):
                                 threshold_crossed = True
 
                         if threshold_crossed:
-                            index = self.slice_locations[slice_index].index(disk)
-                            if self.status[slice_index][index] == -1 or self.status[slice_index][index] == -2:
+                            if self.status[slice_index, index] == -1 or self.status[slice_index, index] == -2:
                                 if self.lazy_recovery or self.parallel_repair:
                                     rc = self.parallelRepair(slice_index)
                                 else:
@@ -562,10 +635,10 @@ class EventHandler(object):
                     num = self.conf.drs_handler.d
                 else:
                     num = self.conf.drs_handler.k
-                print "disk contention model start"
                 recovery_time = self.contention_model.occupy(disk_repair_start, chosen_racks, num, disk_repair_time)
-                print "original recovery time for disk:", time
-                print "recovery time for disk:", recovery_time
+                if self.tracer.recovery:
+                    self.tracer.trace("recovery", Tracer.DEBUG, unit=u.toString(), time=time,
+                                      recovery_time=recovery_time)
                 recovery_event = Event(Event.EventType.Recovered, recovery_time, u, 4)
                 queue.addEvent(recovery_event)
                 return
@@ -573,11 +646,10 @@ class EventHandler(object):
             self.total_disk_repairs += 1
 
             transfer_required = 0.0
-            slice_indexes = u.getChildren()
-            for slice_index in slice_indexes:
+            for slice_index, index in self.distributer.getChunks(u):
                 if slice_index >= current_total_slices:
                     continue
-                if self.status[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     if slice_index in self.unavailable_slice_durations.keys() and \
                         len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                         self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -600,8 +672,7 @@ class EventHandler(object):
                         threshold_crossed = True
 
                 if threshold_crossed:
-                    index = self.slice_locations[slice_index].index(u)
-                    if self.status[slice_index][index] == -1 or self.status[slice_index][index] == -2:
+                    if self.status[slice_index, index] == -1 or self.status[slice_index, index] == -2:
 
                         if self.lazy_recovery or self.parallel_repair:
                             rc = self.parallelRepair(slice_index)
@@ -629,26 +700,25 @@ class EventHandler(object):
                 return
             self._my_assert(slice_count > 10)
 
-            slice_index = choice(u.getChildren())
+            slice_index, index = choice(self.distributer.getChunks(u))
             if slice_index >= current_total_slices:
                 return
 
-            if self.status[slice_index] == self.lost_slice:
+            if self.lost[slice_index]:
                 self.total_skipped_latent += 1
                 return
 
             repairable_before = self.isRepairable(slice_index)
 
-            index = self.slice_locations[slice_index].index(u)
             # A LSE cannot hit lost blocks or a same block multiple times
-            if self.status[slice_index][index] == -1 or self.status[slice_index][index] == -2:
+            if self.status[slice_index, index] == -1 or self.status[slice_index, index] == -2:
                 self.total_skipped_latent += 1
                 return
 
             self._my_assert(self.durableCount(slice_index) >= 0)
             self.sliceDegraded(slice_index)
 
-            self.status[slice_index][index] = -2
+            self.setChunk(slice_index, index, -2)
             u.slices_hit_by_LSE.append(slice_index)
             self.total_latent_failures += 1
 
@@ -673,7 +743,7 @@ class EventHandler(object):
                     str(u.getID()))
                 self.undurable_slice_count += 1
                 self.undurable_slice_infos.append((slice_index, time, "LSE "+ str(u.getID())))
-                self.status[slice_index] = self.lost_slice
+                self.lost[slice_index] = True
         else:
             raise Exception("Latent defect should only happen for disk")
 
@@ -687,7 +757,7 @@ class EventHandler(object):
             for slice_index in slice_indexes:
                 if slice_index >= current_total_slices:
                     continue
-                if self.status[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     if slice_index in self.unavailable_slice_durations.keys() and \
                         len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                         self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -696,8 +766,8 @@ class EventHandler(object):
                 if not self.isRepairable(slice_index):
                     continue
 
-                index = self.slice_locations[slice_index].index(u)
-                if self.status[slice_index][index] != -2:
+                index = self.distributer.chunkPosition(slice_index, u)
+                if self.status[slice_index, index] != -2:
                     continue
                 self.total_scrub_repairs += 1
                 rc = self.repair(slice_index, index)
@@ -719,11 +789,10 @@ class EventHandler(object):
                 raise Exception("Check instance is not Machine instance")
             diskes = u.getChildren()
             for disk in diskes:
-                slice_indexes = disk.getChildren()
-                for slice_index in slice_indexes:
+                for slice_index, index in self.distributer.getChunks(disk):
                     if slice_index > current_total_slices:
                         continue
-                    if self.status[slice_index] == self.lost_slice:
+                    if self.lost[slice_index]:
                         if slice_index in self.unavailable_slice_durations.keys() and \
                             len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                             self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -731,11 +800,10 @@ class EventHandler(object):
 
                     threshold_crossed = False
                     rc = 0.0
-                    index = self.slice_locations[slice_index].index(disk)
                     if self.isRepairable(slice_index):
-                        if self.status[slice_index][index] == -1 or self.status[slice_index][index] == -2:
+                        if self.status[slice_index, index] == -1 or self.status[slice_index, index] == -2:
                             threshold_crossed = True
-                        if e.info == 2 and self.status[slice_index][index] == 0:
+                        if e.info == 2 and self.status[slice_index, index] == 0:
                             threshold_crossed = True
                     if threshold_crossed:
                         rc = self.repair(slice_index, index)
@@ -750,11 +818,10 @@ class EventHandler(object):
                 raise Exception("Check instance is not Machine instance")
             diskes = u.getChildren()
             for disk in diskes:
-                slice_indexes = disk.getChildren()
-                for slice_index in slice_indexes:
+                for slice_index, index in self.distributer.getChunks(disk):
                     if slice_index > current_total_slices:
                         continue
-                    if self.status[slice_index] == self.lost_slice:
+                    if self.lost[slice_index]:
                         if slice_index in self.unavailable_slice_durations.keys() and \
                             len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                             self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -779,10 +846,10 @@ class EventHandler(object):
         # 5: check and repair all lost slices
         # 6: check and repair all unavailable and lost slices
         elif e.info == 5 or e.info == 6:
-            for slice_index, state in enumerate(self.status):
+            for slice_index in xrange(self.total_slices):
                 if slice_index > current_total_slices:
                     continue
-                if state == self.lost_slice:
+                if self.lost[slice_index]:
                     if slice_index in self.unavailable_slice_durations.keys() and \
                         len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                         self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -813,16 +880,10 @@ class EventHandler(object):
                     regenerate_end_ts = self.conf.upgrade_ts[index+1]
                 else:
                     regenerate_end_ts = self.conf.total_time
-                timestamps = queue.events.keys()
-                timestamps.sort()
-                for ts in timestamps:
-                    if ts > time:
-                        ts_events = queue.events.get(ts)
-                        for e in ts_events:
-                            if isinstance(e.getUnit(), Disk):
-                                queue.events.get(ts).remove(e)
-                                if queue.events.get(ts) == []:
-                                    queue.events.pop(ts)
+                # events of the old disks are regenerated below
+                for event in queue.getAllEvents():
+                    if event.getTime() > time and isinstance(event.getUnit(), Disk):
+                        queue.cancel(event)
                 for rack_disks in disks:
                     for disk in rack_disks:
                         if self.conf.failure_generator is not None:
@@ -837,41 +898,41 @@ class EventHandler(object):
             raise Exception("Incorrect upgrade check style")
 
     def end(self):
-        ret = Result()
+        ret = getContext().result
         avg_total_slices = self.avgTotalSlices()
 
-        Result.undurable_count = self.undurable_slice_count
-        Result.unavailable_count = self.unavailable_slice_count
+        ret.undurable_count = self.undurable_slice_count
+        ret.unavailable_count = self.unavailable_slice_count
         # Result.undurable_infos = self.undurable_slice_infos
-        Result.undurable_count_details = self.calUndurableDetails()
-        Result.unavailable_slice_durations = self.unavailable_slice_durations
+        ret.undurable_count_details = self.calUndurableDetails()
+        ret.unavailable_slice_durations = self.unavailable_slice_durations
 
-        Result.PDL = format(float(self.undurable_slice_count)/avg_total_slices, ".4e")
-        Result.NOMDL = self.NOMDL()
+        ret.PDL = format(float(self.undurable_slice_count)/avg_total_slices, ".4e")
+        ret.NOMDL = self.NOMDL()
 
         # unavailability from system perspective
         TTFs, TTRs = self.processDuration(True)
         if len(TTFs) == 0 or len(TTRs) == 0:
-            Result.MTTR = 0.0
-            Result.MTBF = self.end_time
-            Result.PUA = 0.0
+            ret.MTTR = 0.0
+            ret.MTBF = self.end_time
+            ret.PUA = 0.0
         else:
             MTTF = sum(TTFs)/len(TTFs)
             MTTR = sum(TTRs)/len(TTRs)
-            Result.MTTR = round(MTTR, 4)
-            Result.MTBF = round(MTTR + MTTF, 4)
-            Result.PUA = format(MTTR/(MTTF+MTTR), ".4e")
+            ret.MTTR = round(MTTR, 4)
+            ret.MTBF = round(MTTR + MTTF, 4)
+            ret.PUA = format(MTTR/(MTTF+MTTR), ".4e")
         # unavailability from stripe perspective
         TTFs, TTRs = self.processDuration(False)
-        Result.PUS = format(sum(TTRs)/(self.end_time * avg_total_slices), ".4e")
+        ret.PUS = format(sum(TTRs)/(self.end_time * avg_total_slices), ".4e")
 
         # repair bandwidth in TiBs
-        Result.TRT = format(float(self.total_repair_transfers)/pow(2,20), ".4e")
+        ret.TRT = format(float(self.total_repair_transfers)/pow(2,20), ".4e")
 
         if not self.queue_disable:
             queue_times, avg_queue_time = self.contention_model.statistics()
-            Result.queue_times = queue_times
-            Result.avg_queue_time = format(avg_queue_time, ".4f")
+            ret.queue_times = queue_times
+            ret.avg_queue_time = format(avg_queue_time, ".4f")
             info_logger.info("total times of queuing: %d, average queue time: %f" %
                     (queue_times, avg_queue_time))
 
@@ -955,8 +1016,7 @@ class EventHandler(object):
         curr_time = time
         disks = u.getChildren()
         for child in disks:
-            slice_indexes = child.getChildren()
-            for slice_index in slice_indexes:
+            for slice_index, index in self.distributer.getChunks(child):
                 # When this machine failed, it decremented the availability
                 # count of all its slices. This eager recovery is the first
                 # point in time that this machine failure has been
@@ -966,7 +1026,7 @@ class EventHandler(object):
                 # it as an anomaly
                 if self.availableCount(slice_index) >= self.n:
                     self.anomalous_available_count += 1
-                if self.status[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     continue
 
                 threshold_crossed = False
@@ -985,7 +1045,7 @@ class EventHandler(object):
                         threshold_crossed = True
 
                 if threshold_crossed:
-                    num_unavailable = self.status[slice_index].count(0)
+                    num_unavailable = self.durableCount(slice_index) - self.availableCount(slice_index)
                     slice_installment.slices.append(slice_index)
                     total_num_chunks_added_for_repair += self.k + \
                         num_unavailable - 1
@@ -1049,7 +1109,7 @@ class EventHandler(object):
 
             for slice_index in u.slices:
                 # slice_index = s.intValue()
-                if self.status[slice_index] == self.lost_slice:
+                if self.lost[slice_index]:
                     if slice_index in self.unavailable_slice_durations.keys() and \
                         len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                         self.unavailable_slice_durations[slice_index][-1].append(time)
@@ -1070,7 +1130,7 @@ class EventHandler(object):
 
                 if threshold_crossed:
                     if self.isLost(slice_index):
-                        self.status[slice_index] = self.lost_slice
+                        self.lost[slice_index] = True
                         continue
                     if not self.isRepairable(slice_index):
                         continue
@@ -1089,11 +1149,11 @@ class EventHandler(object):
                         transfer_required += self.k - 1 + chunks_recovered
                     else:
                         if self.availableCount(slice_index) < self.n:
-                            try:
-                                index = self.status[slice_index].index(0)
-                            except ValueError:
+                            unavailable = np.flatnonzero(self.status[slice_index] == 0)
+                            if len(unavailable) == 0:
                                 error_logger.error("No block crash in slice " + str(slice_index))
                                 continue
+                            index = int(unavailable[0])
                             rc = self.repair(slice_index, index)
                             transfer_required += rc
                             if self.durableCount(slice_index) != self.n:
@@ -1104,7 +1164,7 @@ class EventHandler(object):
             u.setLastFailureTime(e.getTime())
 
     def handleSliceRecovery(self, slice_index, e, is_durable_failure):
-        if self.status[slice_index] == self.lost_slice:
+        if self.lost[slice_index]:
             if slice_index in self.unavailable_slice_durations.keys() and \
                 len(self.unavailable_slice_durations[slice_index][-1]) == 1:
                 self.unavailable_slice_durations[slice_index][-1].append(e.getTime())
@@ -1120,5 +1180,120 @@ class EventHandler(object):
         self._my_assert(self.durableCount(slice_index) == self.n)
         return recovered
 
+# Check the int8 block states and counters of EventHandler against plain
+# per-slice lists driven through the DRS handler, as the states were kept
+# before, with 'steps' random block changes and repairs on 'total_slices'
+# stripes. Calls that raise count as equal when both sides raise. Return
+# the number of mismatches.
+def verifyBookkeeping(drs_handler, repair_table=None, total_slices=50, steps=20000):
+    handler = EventHandler.__new__(EventHandler)
+    handler.initStatus(drs_handler, total_slices, repair_table, 1)
+    n, k = drs_handler.n, drs_handler.k
+    states = [[1]*n for i in xrange(total_slices)]
+    optimal_repairs = 0
+
+    def attempt(f, *args):
+        try:
+            return f(*args)
+        except Exception:
+            return "error"
+
+    def isLost(state):
+        if drs_handler.isMDS:
+            return len([b for b in state if b >= 0]) < k
+        return not drs_handler.isRepairable([1 if b == 0 else b for b in state])
+
+    mismatches = 0
+    for step in xrange(steps):
+        slice_index = randrange(total_slices)
+        r = random()
+        if r < 0.6:
+            index = randrange(n)
+            block = choice([1, 0, -1, -2])
+            handler.setChunk(slice_index, index, block)
+            states[slice_index][index] = block
+        elif r < 0.85:
+            index = randrange(n)
+            state = list(states[slice_index])
+            expected = attempt(drs_handler.repair, state, index)
+            if expected != "error":
+                states[slice_index][index] = 1
+                if expected < drs_handler.RC:
+                    optimal_repairs += 1
+            mismatches += attempt(handler.repair, slice_index, index) != expected
+        else:
+            only_lost = random() < 0.5
+            state = list(states[slice_index])
+            expected = attempt(drs_handler.parallRepair, state, only_lost)
+            if expected != "error":
+                states[slice_index] = state
+            mismatches += attempt(handler.parallelRepair, slice_index, only_lost) != expected
+
+        state = states[slice_index]
+        mismatches += handler.status[slice_index].tolist() != state
+        mismatches += handler.durableCount(slice_index) != len([b for b in state if b >= 0])
+        mismatches += handler.availableCount(slice_index) != state.count(1)
+        mismatches += handler.lseCount(slice_index) != state.count(-2)
+        mismatches += bool(handler.isRepairable(slice_index)) != \
+            bool(drs_handler.isRepairable(list(state)))
+        mismatches += bool(handler.isLost(slice_index)) != isLost(state)
+    mismatches += handler.total_optimal_repairs != optimal_repairs
+    return mismatches
+
+
+# Place the slices of the configuration at 'conf_path', generate the events
+# of all units and hand them to an EventHandler through EventQueue.run().
+# Return the number of events handled and the Result of end().
+def smokeRun(conf_path, seed_value=1):
+    from simulator.EventQueue import EventQueue
+    from simulator.Simulation import Simulation
+
+    seed(seed_value)
+    np.random.seed(seed_value)
+    simulation = Simulation(conf_path)
+    distributer = simulation.getDistributer()
+    root = distributer.getRoot()
+    simulation.distributeSlices(root)
+
+    end_time = simulation.conf.total_time
+    queue = EventQueue()
+    root.generateEvents(queue, 0, end_time, True)
+    handler = EventHandler(distributer)
+    handled = queue.run(handler, end_time)
+    return handled, handler.end()
+
+
 if __name__ == "__main__":
-    print "hello"
+    import os
+    import sys
+
+    from simulator.Configuration import Configuration, CONF_PATH
+    from simulator.drs.Handler import getDRSHandler
+    from simulator.drs.RepairTable import getRepairTable
+
+    seed(1)
+    failed = False
+    for name, params in [("RS", [9, 6]), ("LRC", [10, 6, 2]), ("XORBAS", [10, 6, 2]),
+                         ("MSR", [9, 6, 7])]:
+        drs_handler = getDRSHandler(name, params)
+        tables = [None]
+        if not drs_handler.isMDS:
+            tables.append(getRepairTable(drs_handler))
+        for repair_table in tables:
+            mismatches = verifyBookkeeping(drs_handler, repair_table)
+            failed = failed or mismatches != 0
+            print name, params, "repair table:", repair_table is not None, \
+                "mismatches:", mismatches
+    if failed:
+        raise Exception("Block bookkeeping differs from the list-based states")
+
+    conf_path = Configuration.path
+    if len(sys.argv) > 1:
+        conf_path = sys.argv[1]
+        if not os.path.isabs(conf_path):
+            conf_path = CONF_PATH + conf_path
+    handled, result = smokeRun(conf_path)
+    print "events handled:", handled, "PDL:", result.PDL, "NOMDL:", result.NOMDL, \
+        "PUS:", result.PUS, "TRT:", result.TRT
+    if handled == 0:
+        raise Exception("No event was handled")
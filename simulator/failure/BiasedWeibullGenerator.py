@@ -0,0 +1,176 @@
+from math import log
+
+import numpy as np
+
+from simulator.failure.WeibullGenerator import WeibullGenerator
+
+
+class BiasedWeibullGenerator(WeibullGenerator):
+    """
+    WeibullGenerator with its hazard scaled by 'bias', for importance
+    sampling of rare data loss.
+
+    A Weibull event is the time at which the cumulative hazard since the
+    current time reaches an Exp(1) variate. Here the hazard is raised 'bias'
+    times inside the windows given to setWindows() (everywhere if none were
+    given), so failures there come 'bias' times as often, and every draw
+    adds the log of its likelihood ratio to log_weight. The caller passes
+    the end of the interval of the draws to censor(): with Hw the raised
+    part of the hazard up to the failure or the end, whichever is first,
+    the ratio is exp((bias - 1)*Hw), divided by bias for a failure up to
+    the end inside a window.
+
+    Biasing only inside windows keeps the ratio bounded: the simulation
+    passes the loss durations of the tiers drawn before, so units are only
+    biased while some stripe is already degraded.
+    """
+
+    def __init__(self, generator, bias):
+        self.name = generator.name
+        self.gamma = generator.gamma
+        self.lamda = generator.lamda
+        self.beta = generator.beta
+        self.start_time = generator.start_time
+        if bias <= 0:
+            raise Exception("Failure bias must be positive")
+        self.bias = float(bias)
+        # sum of the log likelihood ratios of the censored draws
+        self.log_weight = 0.0
+        # (current time, start time, unrounded draw, raised) of the last draws
+        self.last = None
+        # sorted disjoint (starts, ends) the hazard is raised in, None for everywhere
+        self.windows = None
+
+    def resetWeight(self):
+        self.log_weight = 0.0
+        self.last = None
+
+    # Raise the hazard only inside the union of [starts[i], ends[i]].
+    def setWindows(self, starts, ends):
+        starts = np.asarray(starts, np.float64)
+        ends = np.asarray(ends, np.float64)
+        order = np.argsort(starts, kind="mergesort")
+        merged_starts = []
+        merged_ends = []
+        for start, end in zip(starts[order], ends[order]):
+            if end <= start:
+                continue
+            if merged_ends and start <= merged_ends[-1]:
+                merged_ends[-1] = max(merged_ends[-1], end)
+            else:
+                merged_starts.append(start)
+                merged_ends.append(end)
+        self.windows = (np.array(merged_starts, np.float64), np.array(merged_ends, np.float64))
+
+    def _hazard(self, times, start_times):
+        return np.power(np.maximum(times - self.gamma - start_times, 0)/self.lamda, self.beta)
+
+    def _inverse(self, hazard, start_times):
+        return self.lamda*np.power(hazard, 1.0/self.beta) + self.gamma + start_times
+
+    def generateNextEvent(self, current_time):
+        return float(self.generateNextEvents(np.array([current_time], np.float64))[0])
+
+    def generateNextEvents(self, current_times, start_times=None):
+        current_times = np.asarray(current_times, np.float64)
+        if start_times is None:
+            start_times = self.start_time
+        start_times = np.broadcast_to(np.asarray(start_times, np.float64),
+                                      current_times.shape)
+        if np.any(current_times < start_times):
+            raise Exception("Negative current time!")
+
+        # walk the hazard clock from the current time, 'left' of the Exp(1)
+        # variate is used up outside the windows at rate 1, inside at rate bias
+        position = current_times + self.gamma
+        level = self._hazard(position, start_times)
+        left = -np.log1p(-np.random.random(current_times.shape))
+        result = np.empty(current_times.shape)
+        raised = np.zeros(current_times.shape, bool)
+        if self.windows is None:
+            result[:] = self._inverse(level + left/self.bias, start_times)
+            raised[:] = True
+        else:
+            open_rows = np.ones(current_times.shape, bool)
+            starts, ends = self.windows
+            first = np.searchsorted(ends, position.min()) if position.size else len(ends)
+            for i in xrange(first, len(ends)):
+                for edge, rate in ((starts[i], 1.0), (ends[i], self.bias)):
+                    edge_level = np.maximum(self._hazard(edge, start_times), level)
+                    hit = open_rows & (left <= (edge_level - level)*rate)
+                    result[hit] = self._inverse(level[hit] + left[hit]/rate, start_times[hit])
+                    raised[hit] = rate != 1.0
+                    open_rows &= ~hit
+                    left -= (edge_level - level)*rate
+                    level = edge_level
+                if not open_rows.any():
+                    break
+            result[open_rows] = self._inverse(level[open_rows] + left[open_rows],
+                                              start_times[open_rows])
+        self.last = (current_times, start_times, result, raised)
+        return np.round(result, 2)
+
+    # Hazard inside the windows between the times 'lower' and 'upper'.
+    def _raisedHazard(self, lower, upper, start_times):
+        if self.windows is None:
+            return self._hazard(np.maximum(upper, lower), start_times) - \
+                self._hazard(lower, start_times)
+        total = np.zeros(lower.shape)
+        starts, ends = self.windows
+        if not lower.size:
+            return total
+        first = np.searchsorted(ends, lower.min())
+        last = np.searchsorted(starts, upper.max())
+        for i in xrange(first, last):
+            a = np.maximum(lower, starts[i])
+            b = np.minimum(upper, ends[i])
+            inside = b > a
+            total[inside] += self._hazard(b[inside], start_times[inside]) - \
+                self._hazard(a[inside], start_times[inside])
+        return total
+
+    # Weigh the last draws, whose intervals end at end_times.
+    def censor(self, end_times):
+        if self.last is None:
+            return
+        self.log_weight += self.logRatios(end_times).sum()
+        self.last = None
+
+    # Log likelihood ratio of each of the last draws.
+    def logRatios(self, end_times):
+        current_times, start_times, result, raised = self.last
+        # events are rounded to 0.01, those up to end + 0.005 count as before the end
+        ends = np.broadcast_to(np.asarray(end_times, np.float64) + 0.005, result.shape)
+        accepted = result <= ends
+        raised_hazard = self._raisedHazard(current_times + self.gamma,
+                                           np.minimum(result, ends), start_times)
+        return (self.bias - 1)*raised_hazard - (accepted & raised)*log(self.bias)
+
+
+# Mean and standard deviation of the estimate of P(next event before
+# 'end_time') from 'size' weighted draws, against the exact value. The
+# hazard is raised inside 'windows', (starts, ends), or everywhere.
+def check(parameters, bias, end_time, windows=None, size=100000):
+    w = BiasedWeibullGenerator(WeibullGenerator("wei", parameters), bias)
+    if windows is not None:
+        w.setWindows(*windows)
+    events = w.generateNextEvents(np.zeros(size))
+    samples = (events <= end_time)*np.exp(w.logRatios(end_time))
+    exact = 1.0 - np.exp(-pow(max(end_time - w.gamma, 0)/w.lamda, w.beta))
+    return samples.mean(), samples.std()/np.sqrt(size), exact
+
+
+if __name__ == "__main__":
+    np.random.seed(1)
+    for parameters, bias, end_time, windows in [
+            ({'gamma': 0.0, 'lamda': 16257.8, 'beta': 1.3}, 10, 100.0, None),
+            ({'gamma': 0.0, 'lamda': 8375, 'beta': 0.994}, 5, 50.0, None),
+            ({'gamma': 24.0, 'lamda': 10.0, 'beta': 1.0}, 2, 30.0, None),
+            ({'gamma': 0.0, 'lamda': 16257.8, 'beta': 1.3}, 10, 100.0, ([10, 60, 40], [30, 80, 50])),
+            ({'gamma': 0.0, 'lamda': 50.0, 'beta': 1.3}, 3, 100.0, ([20, 25], [40, 200])),
+            ({'gamma': 0.0, 'lamda': 8375, 'beta': 0.994}, 5, 50.0, ([], []))]:
+        mean, error, exact = check(parameters, bias, end_time, windows)
+        print parameters, "bias", bias, "windows", windows, \
+            "estimate %.4e +- %.1e, exact %.4e" % (mean, error, exact)
+        if abs(mean - exact) > 5*error + 1e-12:
+            raise Exception("Weighted estimate is off by more than 5 standard errors")
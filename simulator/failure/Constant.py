@@ -2,6 +2,7 @@ from simulator.failure.EventGenerator import EventGenerator
 
 
 class Constant(EventGenerator):
+    STATE = "previous_event"
 
     def __init__(self, name, parameters):
         self.frequency = float(parameters['freq'])
@@ -1,8 +1,15 @@
 from abc import ABCMeta, abstractmethod
 
+import numpy as np
+
 
 class EventGenerator:
     __metaclass__ = ABCMeta
+    # attribute holding the per-unit state that reset() sets, None for
+    # generators without one; see GeneratorView
+    STATE = None
+    # False for generators with state that GeneratorView can not hold
+    SHARED = True
 
     @abstractmethod
     def __init__(self, name, parameters):
@@ -12,6 +19,29 @@ class EventGenerator:
     def generateNextEvent(self, current_time):
         raise NotImplementedError
 
+    # Next events for many current times at once. If start_times is given,
+    # the generator is reset to start_times[i] before drawing event i.
+    # Generators with a vectorized sampler override this.
+    def generateNextEvents(self, current_times, start_times=None):
+        events = np.empty(len(current_times), np.float64)
+        for i in xrange(len(current_times)):
+            if start_times is not None:
+                self.reset(start_times[i])
+            events[i] = self.generateNextEvent(current_times[i])
+        return events
+
+    # Called with the ends of the intervals of the last generateNextEvents()
+    # draws. Only generators that weigh their draws, BiasedWeibullGenerator,
+    # use it.
+    def censor(self, end_times):
+        pass
+
+    def getState(self):
+        return getattr(self, self.STATE)
+
+    def setState(self, value):
+        setattr(self, self.STATE, float(value))
+
     @abstractmethod
     def reset(self, current_time):
         raise NotImplementedError
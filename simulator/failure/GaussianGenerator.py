@@ -4,6 +4,7 @@ from simulator.failure.EventGenerator import EventGenerator
 
 
 class GaussianGenerator(EventGenerator):
+    STATE = "start_time"
 
     def __init__(self, name, parameters):
         self.name = name
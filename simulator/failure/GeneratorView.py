@@ -0,0 +1,119 @@
+from array import array
+from copy import deepcopy
+
+
+class GeneratorView(object):
+    """
+    The event generator of one unit, as a handle on the generator shared by
+    all units of its tier.
+
+    The shared generator holds the parameters. The only per-unit state, the
+    origin its reset() sets (EventGenerator.STATE), lives in position
+    'position' of the compact array 'states' (array('d'), one entry per
+    unit; numpy.frombuffer() maps it for whole-tier draws). It is loaded
+    into the shared generator before every call and saved back afterwards,
+    so units of a tier never see each other's origins.
+    """
+    __slots__ = ("generator", "state", "states", "position")
+
+    def __init__(self, generator, states, position):
+        self.generator = generator
+        self.state = generator.STATE
+        self.states = states
+        self.position = position
+
+    # load and save are inlined, these run once per event of the unit path
+    def reset(self, current_time):
+        generator = self.generator
+        # reset() may keep part of the state, e.g. GaussianGenerator
+        setattr(generator, self.state, self.states[self.position])
+        generator.reset(current_time)
+        self.states[self.position] = getattr(generator, self.state)
+
+    def generateNextEvent(self, current_time):
+        generator = self.generator
+        setattr(generator, self.state, self.states[self.position])
+        event = generator.generateNextEvent(current_time)
+        self.states[self.position] = getattr(generator, self.state)
+        return event
+
+    def generateNextEvents(self, current_times, start_times=None):
+        generator = self.generator
+        setattr(generator, self.state, self.states[self.position])
+        events = generator.generateNextEvents(current_times, start_times)
+        self.states[self.position] = getattr(generator, self.state)
+        return events
+
+    def getCurrentTime(self):
+        setattr(self.generator, self.state, self.states[self.position])
+        return self.generator.getCurrentTime()
+
+    # parameters and everything else come from the shared generator
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+
+
+# Array of per-unit states for 'count' units sharing 'generator', starting
+# from the state it has now.
+def newStates(generator, count):
+    if generator.STATE is None or not generator.SHARED:
+        return None
+    return array("d", [generator.getState()])*count
+
+
+# The generator unit 'position' uses: the shared one itself when it keeps
+# no per-unit state, a GeneratorView on 'states' when it does, and a copy
+# for generators that can not be shared (traces).
+def share(generator, states, position):
+    if not generator.SHARED:
+        return deepcopy(generator)
+    if generator.STATE is None:
+        return generator
+    return GeneratorView(generator, states, position)
+
+
+# Events of 'n' units drawn through shared views and through private
+# copies of 'generator', and the seconds each took. Every other unit draws
+# far ahead first, so a view that sees another unit's state draws
+# differently.
+def compareViews(generator, n=10000):
+    from random import seed
+    from time import time
+    from numpy.random import seed as np_seed
+
+    states = newStates(generator, n)
+    views = [share(generator, states, i) for i in xrange(n)]
+    copies = [deepcopy(generator) for i in xrange(n)]
+
+    results = []
+    for generators in (views, copies):
+        seed(1)
+        np_seed(1)
+        t = time()
+        events = []
+        for i, g in enumerate(generators):
+            g.reset(i*0.5)
+        for g in generators[::2]:
+            events.append(g.generateNextEvent(g.getCurrentTime() + 1000.0))
+        for i, g in enumerate(generators):
+            g.reset(i*0.5)
+            events.append(g.generateNextEvent(g.getCurrentTime() + 5.0))
+        results.append((events, time() - t))
+    return results
+
+
+if __name__ == "__main__":
+    from simulator.failure.WeibullGenerator import WeibullGenerator
+    from simulator.failure.GaussianGenerator import GaussianGenerator
+
+    # shared views draw the same events as private copies
+    for generator in (WeibullGenerator("failureGenerator",
+                                       {'gamma': 0.0, 'lamda': 16257.8, 'beta': 1.3}),
+                      GaussianGenerator("recoveryGenerator",
+                                        {'mean': 24.0, 'stddev': 6.0, 'minval': 12.0})):
+        (view_events, view_time), (copy_events, copy_time) = compareViews(generator)
+        print generator.__class__.__name__, "same events:", view_events == copy_events, \
+            "views %.3fs, copies %.3fs" % (view_time, copy_time)
+        if view_events != copy_events:
+            raise Exception("Shared views of " + generator.__class__.__name__ +
+                            " draw other events than private copies")
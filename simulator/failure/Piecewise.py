@@ -5,6 +5,8 @@ from simulator.failure.EventGenerator import EventGenerator
 
 
 class Piecewise(EventGenerator):
+    STATE = "previous_event"
+
     values = []
     intervals = []
 
@@ -1,5 +1,7 @@
 from random import uniform
 
+import numpy as np
+
 from simulator.failure.EventGenerator import EventGenerator
 
 
@@ -26,3 +28,9 @@ class Real(EventGenerator):
 
     def generateNextEvent(self, current_time):
         return round(current_time + uniform(0, self.gamma) + self.lamda, 2)
+
+    # reset() does nothing here, so start_times is ignored.
+    def generateNextEvents(self, current_times, start_times=None):
+        current_times = np.asarray(current_times, np.float64)
+        return np.round(current_times + np.random.uniform(0, self.gamma, current_times.shape) +
+                        self.lamda, 2)
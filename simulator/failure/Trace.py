@@ -17,6 +17,8 @@ class TmpEvent(object):
 
 
 class Trace(EventGenerator):
+    # the events left of the current machine are per unit
+    SHARED = False
 
     def __init__(self, name, parameters):
         self.name = name
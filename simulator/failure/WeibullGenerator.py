@@ -1,5 +1,7 @@
+from math import exp, log1p
 from random import random
-from decimal import *
+
+import numpy as np
 
 from simulator.failure.EventGenerator import EventGenerator
 
@@ -7,13 +9,21 @@ from simulator.failure.EventGenerator import EventGenerator
 class WeibullGenerator(EventGenerator):
     """
     Weibull Distribution.
+
+    Next events are drawn from the residual life given survival up to the
+    current time: with c = current_time - start_time and r uniform in [0, 1),
+        next = lamda * ((c/lamda)^beta - ln(1-r))^(1/beta) + gamma + start_time
+    which is the inverse of F conditioned on T > c, written without the
+    1 - F(c) cancellation so float64 is accurate.
     """
+    STATE = "start_time"
+
     def __init__(self, name, parameters):
         self.name = name
-        self.gamma = Decimal(parameters['gamma'])
-        self.lamda = Decimal(parameters['lamda'])
-        self.beta = Decimal(parameters['beta'])
-        self.start_time = Decimal(0)
+        self.gamma = float(parameters['gamma'])
+        self.lamda = float(parameters['lamda'])
+        self.beta = float(parameters['beta'])
+        self.start_time = 0.0
 
     def getName(self):
         return self.name
@@ -22,28 +32,60 @@ class WeibullGenerator(EventGenerator):
         return self.start_time
 
     def reset(self, current_time):
-        self.start_time = Decimal(current_time)
+        self.start_time = float(current_time)
 
     def getRate(self):
         return self.lamda
 
     def F(self, current_time):
-        t = -pow(current_time/self.lamda, self.beta)
-        return Decimal(1.0) - t.exp()
+        return 1.0 - exp(-pow(current_time/self.lamda, self.beta))
 
     def generateNextEvent(self, current_time):
-        c_time = Decimal(current_time) - self.start_time
+        return round(self.drawNextEvent(current_time), 2)
+
+    # Unrounded next event, generateNextEvent() rounds it to 0.01.
+    def drawNextEvent(self, current_time):
+        c_time = current_time - self.start_time
         if c_time < 0:
             raise Exception("Negative current time!")
 
         r = random()
-        R = (Decimal(1) - self.F(c_time)) * Decimal(r) + self.F(c_time)
-        tmp = pow(-Decimal(1-R).ln(), Decimal(1)/self.beta)
+        tmp = pow(pow(c_time/self.lamda, self.beta) - log1p(-r), 1.0/self.beta)
         result = self.lamda*tmp + self.gamma + self.start_time
 
         if result < 0:
             raise Exception("Generated time is negative")
-        return round(result, 2)
+        return result
+
+    # Draw the next events of many units at once, one per entry of
+    # current_times. start_times defaults to this generator's start time;
+    # pass an array to give every unit its own origin.
+    def generateNextEvents(self, current_times, start_times=None):
+        return np.round(self.drawNextEvents(current_times, start_times), 2)
+
+    # Unrounded counterpart of generateNextEvents().
+    def drawNextEvents(self, current_times, start_times=None):
+        current_times = np.asarray(current_times, np.float64)
+        if start_times is None:
+            start_times = self.start_time
+        c_times = current_times - start_times
+        if np.any(c_times < 0):
+            raise Exception("Negative current time!")
+
+        r = np.random.random(current_times.shape)
+        tmp = np.power(np.power(c_times/self.lamda, self.beta) - np.log1p(-r), 1.0/self.beta)
+        result = self.lamda*tmp + self.gamma + start_times
+
+        if np.any(result < 0):
+            raise Exception("Generated time is negative")
+        return result
+
+    # Conditional CDF of the next event drawn at current_time.
+    def conditionalCDF(self, t, current_time):
+        c_time = current_time - self.start_time
+        x = np.maximum(np.asarray(t, np.float64) - self.gamma - self.start_time, c_time)
+        return 1.0 - np.exp(-(np.power(x/self.lamda, self.beta) -
+                              pow(c_time/self.lamda, self.beta)))
 
 
 def main():
@@ -79,9 +121,37 @@ def test():
     return MTTF
 
 
+# Kolmogorov-Smirnov test of the scalar and the batch sampler against the
+# analytic conditional CDF, on unrounded draws (rounding to 0.01 makes the
+# samples discrete). Raises if either p-value is at most alpha.
+def testKS(parameters, current_time, size=20000, alpha=0.001):
+    from scipy.stats import kstest
+
+    w = WeibullGenerator("wei", parameters)
+    cdf = lambda t: w.conditionalCDF(t, current_time)
+    scalar = kstest([w.drawNextEvent(current_time) for i in xrange(size)], cdf)
+    batch = kstest(w.drawNextEvents(np.repeat(current_time, size)), cdf)
+    for name, result in [("scalar", scalar), ("batch", batch)]:
+        if result.pvalue <= alpha:
+            raise Exception("KS test of the %s sampler failed for %s at %s: p = %.3g" %
+                            (name, parameters, current_time, result.pvalue))
+    return scalar, batch
+
+
 if __name__ == "__main__":
+    from random import seed
+
+    seed(1)
+    np.random.seed(1)
     w = WeibullGenerator("wei", {'gamma': 6.0, 'lamda': 336, 'beta': 3.0})
     current_time = 1102.99
     print "F return:", w.F(current_time)
     print "next:", w.generateNextEvent(current_time)
 
+    for parameters, current_time in [({'gamma': 0.0, 'lamda': 16257.8, 'beta': 1.3}, 0.0),
+                                     ({'gamma': 0.0, 'lamda': 16257.8, 'beta': 1.3}, 30000.0),
+                                     ({'gamma': 0.0, 'lamda': 8375, 'beta': 0.994}, 5000.0),
+                                     ({'gamma': 24.0, 'lamda': 10.0, 'beta': 1.0}, 0.0)]:
+        scalar, batch = testKS(parameters, current_time)
+        print parameters, current_time, "scalar KS:", scalar, "batch KS:", batch
+
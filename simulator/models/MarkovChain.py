@@ -0,0 +1,252 @@
+from math import exp, gamma as gamma_function
+
+import numpy as np
+from scipy.sparse import csc_matrix
+from scipy.sparse.linalg import spsolve, expm_multiply
+
+from simulator.Result import Result
+from simulator.unit.Rack import Rack
+from simulator.unit.Machine import Machine
+from simulator.unit.Disk import Disk
+from simulator.unit.DiskWithScrubbing import DiskWithScrubbing
+from simulator.failure.WeibullGenerator import WeibullGenerator
+from simulator.failure.Real import Real
+from simulator.failure.Constant import Constant
+from simulator.failure.GaussianGenerator import GaussianGenerator
+from simulator.failure.NoFailure import NoFailure
+
+# milliseconds per hour
+MS_PER_HOUR = 3600 * 1000.0
+
+
+class MarkovChain(object):
+    """
+    Continuous-time Markov chain of one stripe, an analytic estimate of what
+    Simulation measures.
+
+    The blocks of a stripe fail and come back independently, after
+    exponential times with the means of the generators of the layer file.
+    Disk failures, permanent machine failures and latent sector errors lose
+    a block until it is repaired, with the repair times of
+    Configuration.comRepairTime. Transient machine and rack failures only
+    make it unavailable. A stripe with f blocks not available can not be
+    recovered with the probability loss_probability[f], taken from the
+    repair table of the DRS handler.
+
+    The loss chain counts the lost blocks and ends in data loss, it gives
+    the MTTDL and the PDL over total_time. The availability chain counts
+    lost and unavailable blocks apart, its stationary distribution gives
+    the expected unavailability. Both are solved with sparse matrices.
+    Blocks in one rack (hierarchical placement) are treated as
+    independent.
+    """
+
+    def __init__(self, conf, topology):
+        self.conf = conf
+        self.handler = conf.getDRSHandler()
+        self.n = self.handler.n
+        self.loss_probability = lossProbabilities(self.handler, conf.getRepairTable())
+
+        disk_repair_time, node_repair_time = conf.comRepairTime()
+        disk = topology.getTier(Disk).prototype
+        machine = topology.getTier(Machine).prototype
+        rack_tier = topology.getTier(Rack)
+
+        # (rate per block, mean time to repair) of every kind of failure
+        self.loss_failures = []
+        self.unavailable_failures = []
+        self.loss_failures.append((1.0/meanTime(disk.failure_generator),
+                                   meanTime(disk.recovery_generator) + disk_repair_time))
+
+        machine_rate = 1.0/meanTime(machine.failure_generator)
+        transient_time = meanTime(machine.recovery_generator)
+        self.loss_failures.append((machine_rate*machine.fail_fraction,
+                                   meanTime(machine.recovery_generator2) + node_repair_time))
+        transient_rate = machine_rate*(1 - machine.fail_fraction)
+        if machine.eager_recovery_enabled:
+            # failures longer than fail_timeout are repaired as losses
+            long_failure = survival(machine.recovery_generator, machine.fail_timeout)
+            self.loss_failures.append((transient_rate*long_failure,
+                                       machine.fail_timeout + node_repair_time))
+            transient_rate *= 1 - long_failure
+            transient_time = min(transient_time, machine.fail_timeout)
+        self.unavailable_failures.append((transient_rate, transient_time))
+
+        if isinstance(disk, DiskWithScrubbing):
+            # a sector error hits one chunk of the disk
+            chunks = self.conf.disk_capacity*pow(10, 12)/pow(2, 20)/self.conf.chunk_size
+            self.loss_failures.append((1.0/meanTime(disk.latent_error_generator)/chunks,
+                                       meanTime(disk.scrub_generator)))
+
+        if rack_tier is not None and rack_tier.prototype.failure_generator is not None:
+            rack = rack_tier.prototype
+            self.unavailable_failures.append((1.0/meanTime(rack.failure_generator),
+                                              meanTime(rack.recovery_generator)))
+
+        self.loss_rate, self.loss_repair_rate = combine(self.loss_failures)
+        self.unavailable_rate, self.unavailable_repair_rate = combine(self.unavailable_failures)
+
+    # Generator of the loss chain over states 0..m lost blocks, m the most
+    # a stripe can survive. Leaving it is data loss.
+    def lossChain(self):
+        n = self.n
+        loss_probability = self.loss_probability
+        m = int(np.flatnonzero(loss_probability < 1)[-1])
+        rows, cols, values = [], [], []
+
+        for f in xrange(m + 1):
+            out = (n - f)*self.loss_rate
+            # stripes that survived f failures, lost with the next one
+            lost = (loss_probability[f + 1] - loss_probability[f])/(1 - loss_probability[f])
+            if f < m:
+                rows.append(f)
+                cols.append(f + 1)
+                values.append(out*(1 - lost))
+            if f > 0:
+                rows.append(f)
+                cols.append(f - 1)
+                values.append(f*self.loss_repair_rate)
+                out += f*self.loss_repair_rate
+            rows.append(f)
+            cols.append(f)
+            values.append(-out)
+        return csc_matrix((values, (rows, cols)), shape=(m + 1, m + 1))
+
+    # Mean time to data loss of one stripe, in hours.
+    def stripeMTTDL(self):
+        Q = self.lossChain()
+        return spsolve(-Q, np.ones(Q.shape[0]))[0]
+
+    # Probability that one stripe loses data within 'time' hours.
+    def stripePDL(self, time):
+        Q = self.lossChain()
+        start = np.zeros(Q.shape[0])
+        start[0] = 1.0
+        return 1.0 - expm_multiply(Q.T*time, start).sum()
+
+    # Generator of the availability chain over (lost, unavailable) blocks,
+    # and the states as an array of pairs.
+    def availabilityChain(self):
+        n = self.n
+        states = [(d, u) for d in xrange(n + 1) for u in xrange(n + 1 - d)]
+        index = dict([(state, i) for i, state in enumerate(states)])
+        rows, cols, values = [], [], []
+
+        def add(state, to, rate):
+            rows.append(index[state])
+            cols.append(index[to])
+            values.append(rate)
+            rows.append(index[state])
+            cols.append(index[state])
+            values.append(-rate)
+
+        for d, u in states:
+            available = n - d - u
+            if available:
+                add((d, u), (d + 1, u), available*self.loss_rate)
+                add((d, u), (d, u + 1), available*self.unavailable_rate)
+            if d:
+                add((d, u), (d - 1, u), d*self.loss_repair_rate)
+            if u:
+                add((d, u), (d, u - 1), u*self.unavailable_repair_rate)
+        Q = csc_matrix((values, (rows, cols)), shape=(len(states), len(states)))
+        return Q, np.array(states)
+
+    # Long-run fraction of time a stripe can not be read.
+    def stripeUnavailability(self):
+        Q, states = self.availabilityChain()
+        # pi Q = 0 with sum(pi) = 1, the last balance equation replaced
+        A = Q.T.tolil()
+        A[-1, :] = 1
+        b = np.zeros(len(states))
+        b[-1] = 1
+        pi = spsolve(A.tocsc(), b)
+        return float(np.dot(pi, self.loss_probability[states.sum(1)]))
+
+    # Estimates as a Result: PDL and PUAW as Simulation reports them, MTTDL
+    # of the whole system in hours and the expected unavailable time of a
+    # slice over total_time in milliseconds.
+    def estimate(self):
+        total_time = self.conf.total_time
+        unavailability = self.stripeUnavailability()
+        result = Result()
+        result.PDL = format(self.stripePDL(total_time), ".4e")
+        result.PUAW = format(unavailability, ".4e")
+        result.MTTDL = self.stripeMTTDL()/self.conf.total_slices
+        result.unavailable_ms = unavailability*total_time*MS_PER_HOUR
+        return result
+
+
+# Share of stripes with f blocks not available that can not be recovered,
+# for f = 0..n, as HandleDuration counts them.
+def lossProbabilities(handler, repair_table=None):
+    if repair_table is not None:
+        return np.asarray(repair_table.loss_probability, np.float64)
+    ft = handler.n - handler.k
+    loss_probability = np.zeros(handler.n + 1)
+    if handler.isMDS:
+        loss_probability[ft + 1:] = 1.0
+    else:
+        loss_probability[ft] = handler.threshold
+        loss_probability[ft + 1:] = 1.0
+    return loss_probability
+
+
+# Total rate and rate-weighted repair rate of (rate, mean repair time) pairs.
+def combine(failures):
+    rate = sum([r for r, repair_time in failures])
+    if rate == 0:
+        return 0.0, 1.0
+    repair_time = sum([r*repair_time for r, repair_time in failures])/rate
+    return rate, 1.0/repair_time
+
+
+# Mean time between reset and the next event of 'generator', in hours.
+def meanTime(generator):
+    if generator is None or isinstance(generator, NoFailure):
+        return float("inf")
+    if isinstance(generator, WeibullGenerator):
+        return generator.gamma + generator.lamda*gamma_function(1 + 1.0/generator.beta)
+    if isinstance(generator, Real):
+        return generator.gamma/2.0 + generator.lamda
+    if isinstance(generator, Constant):
+        return generator.frequency
+    if isinstance(generator, GaussianGenerator):
+        return generator.mean
+    raise Exception("No analytic mean for " + generator.__class__.__name__)
+
+
+# Probability that the next event of 'generator' comes more than 'time'
+# hours after reset.
+def survival(generator, time):
+    if isinstance(generator, WeibullGenerator):
+        if time <= generator.gamma:
+            return 1.0
+        return exp(-pow((time - generator.gamma)/generator.lamda, generator.beta))
+    if isinstance(generator, Real):
+        if generator.gamma == 0:
+            return float(generator.lamda > time)
+        return min(max((generator.gamma + generator.lamda - time)/generator.gamma, 0.0), 1.0)
+    raise Exception("No analytic survival for " + generator.__class__.__name__)
+
+
+if __name__ == "__main__":
+    import sys
+    from time import time
+
+    from simulator.Configuration import Configuration, CONF_PATH
+    from simulator.XMLParser import XMLParser
+    from simulator.dataDistribute.SSSDistribute import SSSDistribute
+
+    conf = Configuration(CONF_PATH + sys.argv[1])
+    distributer = SSSDistribute(XMLParser(conf))
+    t = time()
+    chain = MarkovChain(conf, distributer.getTopology())
+    result = chain.estimate()
+    print "solved in %.3fs" % (time() - t)
+    print "loss rate per block: %.4e/h, repair rate: %.4e/h" % (chain.loss_rate,
+                                                                 chain.loss_repair_rate)
+    print "unavailability rate per block: %.4e/h, recovery rate: %.4e/h" % \
+        (chain.unavailable_rate, chain.unavailable_repair_rate)
+    print "PDL:", result.PDL, "PUAW:", result.PUAW, "MTTDL: %.4e h" % result.MTTDL, \
+        "unavailable: %.1f ms" % result.unavailable_ms
@@ -1,13 +1,13 @@
 from simulator.unit.Unit import Unit
 from simulator.Duration import Duration
-from simulator.Configuration import Configuration
+from simulator.Configuration import getConfiguration
 
 
 class Disk(Unit):
 
     def __init__(self, name, parent, parameters):
         super(Disk, self).__init__(name, parent, parameters)
-        conf = Configuration()
+        conf = getConfiguration()
         self.disk_capacity = conf.disk_capacity
         self.disk_repair_time = conf.disk_repair_time
         self.slices_hit_by_LSE = []
@@ -18,6 +18,10 @@ class Disk(Unit):
     def getDiskCapacity(self):
         return self.disk_capacity
 
+    # slices with a latent error on this disk, repaired by the next scrub
+    def getSlicesHitByLSE(self):
+        return self.slices_hit_by_LSE
+
     def generateDurations(self, result_durations, start_time, end_time, reset):
         if start_time < self.start_time:
             start_time = self.start_time
@@ -2,19 +2,18 @@ from random import random, uniform
 from math import ceil
 from copy import deepcopy
 
+from simulator.Context import getContext
 from simulator.unit.Unit import Unit
 from simulator.Duration import Duration
+from simulator.Event import Event
 from simulator.failure.Trace import Trace
-from simulator.Configuration import Configuration
+from simulator.Configuration import getConfiguration
 
 
 class Machine(Unit):
-    id_counter = 0
-    fail_fraction = 0.0
 
     def __init__(self, name, parent, parameters):
-        self.my_id = Machine.id_counter
-        Machine.id_counter += 1
+        self.my_id = getContext().nextMachineID()
         super(Machine, self).__init__(name, parent, parameters)
 
         # recovery generator for permanent machine failure
@@ -25,7 +24,7 @@ class Machine(Unit):
         self.fail_timeout = -1
         if self.fail_timeout == -1:
             # Fraction of machine failures that are permanent.
-            Machine.fail_fraction = float(parameters.get("fail_fraction", 0.008))
+            self.fail_fraction = float(parameters.get("fail_fraction", 0.008))
             self.fail_timeout = float(parameters.get("fail_timeout", 0.25))
             # If True, machine failure and recovery durations will be generated
             # but ignored.
@@ -35,7 +34,7 @@ class Machine(Unit):
 
         self.fail_durations = []
 
-        conf = Configuration()
+        conf = getConfiguration()
         self.machine_repair_time = conf.node_repair_time
 
     def getFailureGenerator(self):
@@ -50,6 +49,18 @@ class Machine(Unit):
     def getEventGenerators(self):
         return [self.failure_generator, self.recovery_generator, self.recovery_generator2]
 
+    # Long failures turned into losses also start eager recovery once
+    # fail_timeout has passed.
+    def durationEvents(self, d):
+        events = super(Machine, self).durationEvents(d)
+        if d.getType() == Duration.DurationType.Loss and d.info == 2:
+            eager = Event(Event.EventType.EagerRecoveryStart, d.getStartTime() + self.fail_timeout,
+                          self, d.info)
+            eager.next_recovery_time = d.getEndTime()
+            eager.ignore = d.ignore
+            events.append(eager)
+        return events
+
     def generateDurations(self, result_durations, start_time, end_time, reset):
         if start_time < self.start_time:
             start_time = self.start_time
@@ -102,7 +113,7 @@ class Machine(Unit):
 
             r = random()
             if not self.fast_forward:  # we will process failures
-                if r < Machine.fail_fraction:
+                if r < self.fail_fraction:
                     # failure type: tempAndShort=1, tempAndLong=2, permanent=3
                     failure_type = 3
 
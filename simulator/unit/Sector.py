@@ -1,3 +1,4 @@
+from simulator.Event import Event
 from simulator.unit.Unit import Unit
 
 
@@ -13,3 +14,11 @@ class Sector(Unit):
     def setOriginalFailureTime(self, original_failure_time):
         self.original_failure_time = original_failure_time
 
+    # A latent error and the scrub that repairs it are events of the disk.
+    def durationEvents(self, d):
+        defect = Event(Event.EventType.LatentDefect, d.getStartTime(), self.parent, d.info)
+        defect.next_recovery_time = d.getEndTime()
+        scrub = Event(Event.EventType.LatentRecovered, d.getEndTime(), self.parent, d.info)
+        defect.ignore = scrub.ignore = d.ignore
+        return [defect, scrub]
+
@@ -1,12 +1,14 @@
 from abc import ABCMeta
 from copy import deepcopy
 
+from simulator.Context import getContext
 from simulator.Duration import Duration
+from simulator.DurationQueue import DurationQueue
+from simulator.Event import Event
 
 
 class Unit:
     __metaclass__ = ABCMeta
-    unit_count = 0
 
     def __init__(self, name, parent, parameters):
         self.children = []
@@ -15,14 +17,12 @@ class Unit:
         self.failure_generator = None
         self.recovery_generator = None
 
-        self.id = Unit.unit_count
+        self.id = getContext().nextUnitID()
         self.start_time = 0
         self.end_time = None
         self.last_failure_time = 0
         self.last_bandwidth_need = 0
 
-        Unit.unit_count += 1
-
     def __eq__(self, other):
         return self.id == other.id
 
@@ -117,6 +117,24 @@ class Unit:
 
             last_recover_time = current_time
 
+    # Events of this unit and the units below it between start_time and
+    # end_time, added to 'queue' for EventHandler. They are made from the
+    # durations generateDurations() draws, so both follow the same rules.
+    def generateEvents(self, queue, start_time, end_time, reset):
+        durations = DurationQueue()
+        self.generateDurations(durations, start_time, end_time, reset)
+        for d in durations.getAllDurations():
+            queue.addEvents(d.getUnit().durationEvents(d))
+
+    # The failure starting a duration of this unit, which carries the
+    # recovery time, and the recovery ending it.
+    def durationEvents(self, d):
+        failure = Event(Event.EventType.Failure, d.getStartTime(), self, d.info)
+        failure.next_recovery_time = d.getEndTime()
+        recovery = Event(Event.EventType.Recovered, d.getEndTime(), self, d.info)
+        failure.ignore = recovery.ignore = d.ignore
+        return [failure, recovery]
+
     def toString(self):
         if self.parent is None:
             return self.name
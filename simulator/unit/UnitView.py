@@ -0,0 +1,89 @@
+from copy import deepcopy
+
+from simulator.failure.EventGenerator import EventGenerator
+from simulator.failure.GeneratorView import share
+
+
+class UnitView(object):
+    """
+    A unit of a Topology seen through the Unit API.
+
+    A view holds only its topology, tier and index. Structure (id, name,
+    parent, children) and start times are read from the topology arrays,
+    everything else from the prototype unit of the tier. Generators of the
+    prototype are shared, with the per-unit state in topology arrays (see
+    GeneratorView), lists are copied into the view on first access, and
+    attributes written through the Unit API stay with the view, so only
+    units that are actually used as objects cost more than a handle.
+    """
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return self.topology.first_id + self.index
+
+    @property
+    def name(self):
+        return self.tier.name + str((self.index - self.tier.first) % self.tier.count)
+
+    @property
+    def parent(self):
+        parent = self.tier.parent[self.index - self.tier.first]
+        if parent < 0:
+            return None
+        return self.topology.getUnit(self.topology.first_id + parent)
+
+    # Leaf units (disks) hold slice indexes, the others their child units.
+    @property
+    def children(self):
+        if self.tier.leaf:
+            return self.topology.getSlices(self.id)
+        return [self.topology.getUnit(self.topology.first_id + i)
+                for i in self.topology.childIndexes(self.index)]
+
+    # Slices are placed through DataDistribute.addChunk(), which also
+    # records their chunk positions, so they can only be removed here.
+    @children.setter
+    def children(self, children):
+        if not self.tier.leaf or children:
+            raise Exception("Children of " + self.tier.name + " are set by the topology")
+        self.topology.removeChunks(self.id)
+
+    @property
+    def start_time(self):
+        return self.topology.start_times[self.index]
+
+    @start_time.setter
+    def start_time(self, ts):
+        self.topology.start_times[self.index] = ts
+
+    @property
+    def my_id(self):
+        return self.topology.first_machine_id + self.index - self.tier.first
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("topology", "tier", "index"):
+            raise AttributeError(name)
+        value = getattr(self.tier.prototype, name)
+        if isinstance(value, EventGenerator):
+            value = share(value, self.topology.generatorStates(self.tier, name),
+                          self.index - self.tier.first)
+            self.__dict__[name] = value
+        elif isinstance(value, (list, dict)):
+            value = deepcopy(value)
+            self.__dict__[name] = value
+        return value
+
+
+_view_classes = {}
+
+
+# View class of unit_class, e.g. RackView for Rack. isinstance checks
+# against the unit classes keep working on views.
+def viewClass(unit_class):
+    view_class = _view_classes.get(unit_class)
+    if view_class is None:
+        view_class = type(unit_class.__name__ + "View", (UnitView, unit_class),
+                          {"__slots__": ("topology", "tier", "index")})
+        _view_classes[unit_class] = view_class
+    return view_class